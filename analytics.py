@@ -0,0 +1,635 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from gestion import changed_rows
+
+METRICS = ['Tiempo_espera', 'Tiempo_atencion', 'Tiempo_total', 'Tiempo_retraso']
+DURATION_METRICS = ['Tiempo_espera', 'Tiempo_atencion', 'Tiempo_total']
+PERCENTILES = (50, 90, 95)
+
+# Histogram bins (minutes) of the quantile sketches: fine where most waits
+# are, coarser in the tail; the last bin collects everything above 8 hours
+SKETCH_EDGES = np.r_[
+    np.arange(0, 30, 1), np.arange(30, 60, 2), np.arange(60, 120, 5),
+    np.arange(120, 240, 10), np.arange(240, 481, 30),
+].astype('float64')
+SKETCH_BINS = len(SKETCH_EDGES)  # Bin i covers [edge i, edge i+1), the last one is open
+
+ALL = "Todos"  # Key for "all providers" / "all hours"
+NO_HOUR = -1  # Key used for records without hora_de_reserva
+
+_EPOCH = np.datetime64('1970-01-01', 'D')
+
+# Columns an index reads from a record: a change to any of them changes its totals
+_FINGERPRINT_COLUMNS = ['Orden_de_compra', 'Proveedor', 'hora_de_reserva', 'Hora_llegada', *METRICS]
+
+
+def _day_numbers(values):
+    """Datetime-like column -> int64 day numbers (NaT -> -1)"""
+    days = pd.to_datetime(values, errors='coerce', format='mixed').to_numpy('datetime64[D]')
+    out = (days - _EPOCH).astype('int64')
+    out[np.isnat(days)] = -1
+    return out
+
+
+def _to_day_number(value):
+    """date/datetime/str -> int64 day number"""
+    return int((np.datetime64(pd.Timestamp(value).date(), 'D') - _EPOCH).astype('int64'))
+
+
+def _day_number_to_date(day_number):
+    return (_EPOCH + np.timedelta64(int(day_number), 'D')).astype(object)
+
+
+def completed_records(gestion_df):
+    """Rows with service completed (the ones the dashboard aggregates)"""
+    if gestion_df.empty or 'Tiempo_total' not in gestion_df.columns:
+        return gestion_df.iloc[0:0]
+    return gestion_df[gestion_df['Tiempo_total'].notna()]
+
+
+def _fingerprints(records):
+    """One uint64 hash per record of the columns the indexes read"""
+    columns = [c for c in _FINGERPRINT_COLUMNS if c in records.columns]
+    return pd.util.hash_pandas_object(records[columns], index=False).to_numpy()
+
+
+def _metric_matrix(df, metrics):
+    """(len(df), len(metrics)) float array of metric values, NaN when missing"""
+    return np.column_stack([
+        pd.to_numeric(df[m], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        if m in df.columns else np.full(len(df), np.nan)
+        for m in metrics
+    ])
+
+
+def _record_values(df):
+    """Per-row [sum_1..sum_M, count_1..count_M] vectors for the metrics"""
+    metrics = _metric_matrix(df, METRICS)
+    present = ~np.isnan(metrics)
+    return np.hstack([np.where(present, metrics, 0.0), present.astype('float64')])
+
+
+class VersionedCache:
+    """Views derived from the shared snapshot, built at most once per version
+
+    ``build`` receives the value built for the previous version (or None).
+    """
+
+    def __init__(self, max_entries=64):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+
+    def get(self, name, version, build):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                self._entries.move_to_end(name)
+                if entry[0] == version:
+                    return entry[1]
+            value = build(entry[1] if entry is not None else None)
+            self._entries[name] = (version, value)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+            return value
+
+
+class _PrefixSums:
+    """Running totals of per-record vectors, per key and time bucket
+
+    Keys are (provider, hour) with ALL for either; subclasses define the
+    bucket of a day and the vector of each record.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> sorted int64 bucket day numbers
+        self._cum = {}      # key -> (len(buckets) + 1, width) running totals
+        self._fingerprints = np.empty(0, dtype='uint64')  # One per record folded in
+        self._source = None  # Gestion frame the index reflects
+        self.providers = []
+
+    def _bucket(self, days):
+        """Bucket (as a day number) of each day number"""
+        return days
+
+    def _vectors(self, records):
+        """(len(records), width) array of values to accumulate"""
+        raise NotImplementedError
+
+    def _cells(self, records):
+        """(rows, columns, values) of the non-zero entries of the record vectors, and the width
+
+        Subclasses with wide, sparse vectors override this so the dense
+        (len(records), width) array is never built.
+        """
+        vectors = self._vectors(records)
+        rows, columns = np.nonzero(vectors)
+        return rows, columns, vectors[rows, columns], vectors.shape[1]
+
+    # ── building ───────────────────────────────────────────────
+    @classmethod
+    def from_gestion(cls, gestion_df):
+        """Build from all completed records (vectorized)"""
+        index = cls()
+        index._build(completed_records(gestion_df))
+        index._source = gestion_df
+        return index
+
+    def _aggregate(self, records):
+        """Summed vectors per (provider, hour, bucket), as a frame sorted by that key
+
+        Each record's cells are added straight into its key's row with one
+        bincount, so memory grows with the number of keys, not of records.
+        Records without a provider are kept (as NaN) for the ALL totals.
+        """
+        hours = pd.to_numeric(records['hora_de_reserva'], errors='coerce') if 'hora_de_reserva' in records.columns \
+            else pd.Series(np.nan, index=records.index)
+        days = _day_numbers(records['Hora_llegada'])
+        keys = pd.DataFrame({
+            'provider': records['Proveedor'].astype(object).to_numpy(),
+            'hour': hours.fillna(NO_HOUR).astype('int64').to_numpy(),
+            'bucket': self._bucket(days),
+        })
+        dated = days >= 0
+        grouper = keys[dated].groupby(['provider', 'hour', 'bucket'], sort=True, dropna=False)
+        group = np.full(len(records), -1, dtype='int64')
+        group[dated] = grouper.ngroup().to_numpy()
+        index = grouper.size().index
+
+        rows, columns, values, width = self._cells(records)
+        keep = group[rows] >= 0
+        flat = group[rows[keep]] * width + columns[keep]
+        sums = np.bincount(flat, weights=values[keep], minlength=len(index) * width)
+        return pd.DataFrame(sums.reshape(len(index), width).astype(values.dtype), index=index)
+
+    def _build(self, records):
+        self._buckets, self._cum, self._fingerprints = {}, {}, _fingerprints(records)
+        aggregated = self._aggregate(records).reset_index()
+        value_columns = list(range(aggregated.shape[1] - 3))
+        with_provider = aggregated[aggregated['provider'].notna()]
+
+        # The aggregated cells rolled up at four levels of detail
+        levels = [
+            with_provider,
+            with_provider.assign(hour=ALL),
+            aggregated.assign(provider=ALL),
+            aggregated.assign(provider=ALL, hour=ALL),
+        ]
+        for level in levels:
+            grouped = level.groupby(['provider', 'hour', 'bucket'], sort=True)[value_columns].sum()
+            if grouped.empty:
+                continue
+            keys = grouped.index.droplevel('bucket')
+            # Boundaries between keys in the sorted table
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            ends = np.r_[starts[1:], len(grouped)]
+            bucket_values = grouped.index.get_level_values('bucket').to_numpy()
+            sums = grouped.to_numpy()
+            for start, end in zip(starts, ends):
+                block = sums[start:end]
+                cum = np.zeros((len(block) + 1, len(value_columns)), dtype=block.dtype)
+                np.cumsum(block, axis=0, out=cum[1:])
+                self._buckets[keys[start]] = bucket_values[start:end]
+                self._cum[keys[start]] = cum
+
+        self.providers = sorted({k[0] for k in self._buckets if k[0] != ALL})
+
+    def _add_to_key(self, key, bucket, values):
+        """Add one bucket's totals to a key, shifting the running totals after it"""
+        buckets = self._buckets.get(key)
+        if buckets is None:
+            self._buckets[key] = np.array([bucket], dtype='int64')
+            self._cum[key] = np.vstack([np.zeros_like(values), values])
+            return
+
+        cum = self._cum[key]
+        position = np.searchsorted(buckets, bucket)
+        if position == len(buckets) or buckets[position] != bucket:
+            # New bucket: insert a row carrying the running total before it
+            buckets = np.insert(buckets, position, bucket)
+            cum = np.insert(cum, position + 1, cum[position], axis=0)
+        else:
+            cum = cum.copy()  # May be shared with the index this one was copied from
+        cum[position + 1:] += values
+        self._buckets[key] = buckets
+        self._cum[key] = cum
+
+    def _copy(self):
+        """Index sharing this one's arrays; ``_add_to_key`` never writes to them in place"""
+        index = type(self)()
+        index._buckets = dict(self._buckets)
+        index._cum = dict(self._cum)
+        index._fingerprints = self._fingerprints
+        index._source = self._source
+        index.providers = self.providers
+        return index
+
+    def add_records(self, records):
+        """Incrementally add newly completed records (usually today's)"""
+        records = completed_records(records)
+        if records.empty:
+            return
+        grouped = self._aggregate(records)
+        with self._lock:
+            for (provider, hour, bucket), values in zip(grouped.index, grouped.to_numpy()):
+                keys = [(ALL, hour), (ALL, ALL)]
+                if not pd.isna(provider):
+                    keys += [(provider, hour), (provider, ALL)]
+                for key in keys:
+                    self._add_to_key(key, bucket, values)
+            self._fingerprints = np.concatenate([self._fingerprints, _fingerprints(records)])
+            self.providers = sorted({k[0] for k in self._buckets if k[0] != ALL})
+
+    def sync(self, gestion_df):
+        """Index matching a snapshot; this one is never modified
+
+        Records completed since the last sync are added to a copy. If
+        records changed or disappeared (sheet edited by hand, a service
+        registered again) a fresh index is built instead, since their old
+        contribution is not kept.
+        """
+        if gestion_df is self._source:
+            return self
+        rows = changed_rows(gestion_df, self._source) if self._source is not None else None
+        if rows is not None:
+            # Registrations since the last sync: only the rows they touched are compared
+            new = self._completed_rows(gestion_df, rows)
+            before = rows[rows < len(self._source)]
+            folded = before[self._completed_rows(self._source, before)]
+            if not np.isin(folded, rows[new]).all() or not np.array_equal(
+                    _fingerprints(self._source.iloc[folded]), _fingerprints(gestion_df.iloc[folded])):
+                return type(self).from_gestion(gestion_df)
+            added = gestion_df.iloc[np.setdiff1d(rows[new], folded)]
+        else:
+            completed = completed_records(gestion_df)
+            fingerprints = _fingerprints(completed)
+            new = ~np.isin(fingerprints, self._fingerprints)
+            if len(fingerprints) - new.sum() != len(self._fingerprints) or \
+                    not np.isin(self._fingerprints, fingerprints).all():
+                return type(self).from_gestion(gestion_df)
+            added = completed[new]
+        index = self._copy()
+        index.add_records(added)
+        index._source = gestion_df
+        return index
+
+    @staticmethod
+    def _completed_rows(gestion_df, rows):
+        """Which of the rows at positions ``rows`` have service completed"""
+        if 'Tiempo_total' not in gestion_df.columns:
+            return np.zeros(len(rows), dtype=bool)
+        return gestion_df['Tiempo_total'].iloc[rows].notna().to_numpy()
+
+    def _range(self, key, start, end):
+        """(buckets, running totals) slice for start..end day numbers (inclusive)"""
+        buckets = self._buckets.get(key)
+        if buckets is None:
+            return None, None
+        i0 = np.searchsorted(buckets, self._bucket(start), side='left')
+        i1 = np.searchsorted(buckets, self._bucket(end), side='right')
+        return buckets[i0:i1], self._cum[key][i0:i1 + 1]
+
+    def _totals(self, key, start, end):
+        buckets, cum = self._range(key, start, end)
+        if buckets is None or len(buckets) == 0:
+            return None
+        return cum[-1] - cum[0]
+
+    def bounds(self):
+        """(first, last) date with completed records, or None"""
+        buckets = self._buckets.get((ALL, ALL))
+        if buckets is None or len(buckets) == 0:
+            return None
+        return _day_number_to_date(buckets[0]), _day_number_to_date(buckets[-1])
+
+
+class DailyIndex(_PrefixSums):
+    """Prefix sums per day of the dashboard metrics, for any date range
+
+    The accumulated vector of a record is [sums..., counts...] of the four
+    time metrics, so means over any range come from one subtraction.
+    """
+
+    def _vectors(self, records):
+        return _record_values(records)
+
+    # ── queries ────────────────────────────────────────────────
+    @staticmethod
+    def _means(totals):
+        """Means (NaN where count is 0) from [sums..., counts...]"""
+        sums, counts = np.split(np.asarray(totals, dtype='float64'), 2, axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / counts, np.nan), counts
+
+    def summary(self, start, end, provider=ALL):
+        """Mean of each metric and record count over a date range"""
+        provider = provider or ALL
+        totals = self._totals((provider, ALL), _to_day_number(start), _to_day_number(end))
+        if totals is None:
+            return None
+        means, counts = self._means(totals)
+        result = dict(zip(METRICS, means))
+        result['registros'] = int(counts.max())
+        return result
+
+    def series(self, start, end, provider=ALL, granularity='day'):
+        """Per-day (or per ISO week) metric means over a date range"""
+        provider = provider or ALL
+        days, cum = self._range((provider, ALL), _to_day_number(start), _to_day_number(end))
+        if days is None or len(days) == 0:
+            return pd.DataFrame()
+
+        per_day = np.diff(cum, axis=0)
+        dates = pd.to_datetime([_day_number_to_date(d) for d in days])
+        if granularity == 'week':
+            weeks = dates.isocalendar()
+            groups = pd.DataFrame(per_day).groupby(
+                [weeks['year'].to_numpy(), weeks['week'].to_numpy()], sort=True
+            ).sum()
+            means, _ = self._means(groups.to_numpy())
+            result = pd.DataFrame(means, columns=METRICS)
+            result.insert(0, 'numero_de_semana', groups.index.get_level_values(1))
+        else:
+            means, _ = self._means(per_day)
+            result = pd.DataFrame(means, columns=METRICS)
+            result.insert(0, 'fecha', dates)
+        return result.round(1)
+
+    def by_hour(self, start, end, provider=ALL):
+        """Metric means per reservation hour over a date range"""
+        provider = provider or ALL
+        start, end = _to_day_number(start), _to_day_number(end)
+        rows = []
+        for key in self._buckets:
+            if key[0] != provider or key[1] in (ALL, NO_HOUR):
+                continue
+            totals = self._totals(key, start, end)
+            if totals is not None:
+                means, _ = self._means(totals)
+                rows.append([key[1], *means])
+        if not rows:
+            return pd.DataFrame()
+        return pd.DataFrame(rows, columns=['hora_de_reserva', *METRICS]).sort_values(
+            'hora_de_reserva'
+        ).reset_index(drop=True).round(1)
+
+
+def _week_start(days):
+    """Day number of the Monday of each day number's week (1970-01-01 was a Thursday)"""
+    return days - (days + 3) % 7
+
+
+def sketch_percentiles(histograms, percentiles=PERCENTILES):
+    """Percentiles from merged sketch histograms, shape (..., SKETCH_BINS)
+
+    Values are interpolated linearly inside the bin holding the rank.
+    Returns an array of shape (..., len(percentiles)); NaN without data.
+    """
+    histograms = np.asarray(histograms, dtype='float64')
+    cum = np.cumsum(histograms, axis=-1)
+    total = cum[..., -1:]
+    widths = np.diff(np.r_[SKETCH_EDGES, SKETCH_EDGES[-1]])
+
+    result = []
+    for p in percentiles:
+        rank = total * p / 100.0
+        position = np.minimum((cum < rank).sum(axis=-1, keepdims=True), SKETCH_BINS - 1)
+        below = np.take_along_axis(cum, position, axis=-1) - np.take_along_axis(histograms, position, axis=-1)
+        in_bin = np.take_along_axis(histograms, position, axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.clip(np.where(in_bin > 0, (rank - below) / in_bin, 0.0), 0.0, 1.0)
+        value = SKETCH_EDGES[position] + fraction * widths[position]
+        result.append(np.where(total > 0, value, np.nan)[..., 0])
+    return np.stack(result, axis=-1)
+
+
+class QuantileSketches(_PrefixSums):
+    """Weekly mergeable histograms of wait/service/total minutes, per provider and hour"""
+
+    def _bucket(self, days):
+        return _week_start(days)
+
+    def _cells(self, records):
+        # One count per record and metric: (metric, bin) flattened into a column
+        values = _metric_matrix(records, DURATION_METRICS)
+        rows, metrics = np.nonzero(~np.isnan(values))
+        bins = np.clip(np.searchsorted(SKETCH_EDGES, values[rows, metrics], side='right') - 1, 0, SKETCH_BINS - 1)
+        counts = np.ones(len(rows), dtype='int64')
+        return rows, metrics * SKETCH_BINS + bins, counts, len(DURATION_METRICS) * SKETCH_BINS
+
+    def _histograms(self, totals):
+        return totals.reshape(len(DURATION_METRICS), SKETCH_BINS)
+
+    def percentiles(self, start, end, provider=ALL, hour=ALL):
+        """p50/p90/p95 per duration metric over the weeks of a date range"""
+        totals = self._totals((provider or ALL, hour), _to_day_number(start), _to_day_number(end))
+        if totals is None:
+            return pd.DataFrame()
+        values = sketch_percentiles(self._histograms(totals))
+        return pd.DataFrame(
+            values, index=DURATION_METRICS, columns=[f"p{p}" for p in PERCENTILES]
+        ).round(1)
+
+    def weekly_percentiles(self, start, end, provider=ALL, metric='Tiempo_espera'):
+        """p50/p90/p95 of one metric for each week of a date range"""
+        weeks, cum = self._range((provider or ALL, ALL), _to_day_number(start), _to_day_number(end))
+        if weeks is None or len(weeks) == 0:
+            return pd.DataFrame()
+        per_week = np.diff(cum, axis=0).reshape(len(weeks), len(DURATION_METRICS), SKETCH_BINS)
+        values = sketch_percentiles(per_week[:, DURATION_METRICS.index(metric)])
+        result = pd.DataFrame(values, columns=[f"p{p}" for p in PERCENTILES]).round(1)
+        mondays = pd.to_datetime([_day_number_to_date(w) for w in weeks])
+        result.insert(0, 'numero_de_semana', mondays.isocalendar()['week'].to_numpy())
+        return result
+
+    def hourly_percentiles(self, start, end, provider=ALL, metric='Tiempo_espera'):
+        """p50/p90/p95 of one metric for each reservation hour of a date range"""
+        start, end = _to_day_number(start), _to_day_number(end)
+        provider = provider or ALL
+        rows = []
+        for key in self._buckets:
+            if key[0] != provider or key[1] in (ALL, NO_HOUR):
+                continue
+            totals = self._totals(key, start, end)
+            if totals is not None:
+                histogram = self._histograms(totals)[DURATION_METRICS.index(metric)]
+                rows.append([key[1], *sketch_percentiles(histogram)])
+        if not rows:
+            return pd.DataFrame()
+        return pd.DataFrame(rows, columns=['hora_de_reserva', *[f"p{p}" for p in PERCENTILES]]).sort_values(
+            'hora_de_reserva'
+        ).reset_index(drop=True).round(1)
+
+
+def provider_scorecard(gestion_df, start, end):
+    """Ranked per-provider KPIs for a date range, with the change vs the previous one
+
+    One groupby over the completed records of the window and of the window
+    of the same length right before it. Columns: records, on-time rate
+    (Tiempo_retraso <= 0), mean and p90 wait, service minutes per package
+    and the change in on-time rate and mean wait against the previous
+    period. Sorted best first.
+    """
+    start, end = _to_day_number(start), _to_day_number(end)
+    previous_start = start - (end - start + 1)
+
+    records = completed_records(gestion_df)
+    days = _day_numbers(records['Hora_llegada'])
+    in_window = (days >= previous_start) & (days <= end)
+    if not in_window.any():
+        return pd.DataFrame()
+    records = records[in_window]
+
+    frame = pd.DataFrame({
+        'Proveedor': records['Proveedor'].astype(object).to_numpy(),
+        'actual': days[in_window] >= start,
+        'espera': pd.to_numeric(records['Tiempo_espera'], errors='coerce').to_numpy(dtype='float64', na_value=np.nan),
+        'atencion': pd.to_numeric(records['Tiempo_atencion'], errors='coerce').to_numpy(dtype='float64', na_value=np.nan),
+        'bultos': pd.to_numeric(records['Numero_de_bultos'], errors='coerce').to_numpy(dtype='float64', na_value=np.nan),
+    })
+    retraso = pd.to_numeric(records['Tiempo_retraso'], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    frame['a_tiempo'] = np.where(np.isnan(retraso), np.nan, (retraso <= 0).astype('float64'))
+    # Service minutes only count towards packages when both are known
+    has_bultos = ~np.isnan(frame['atencion']) & (frame['bultos'] > 0)
+    frame['atencion_bultos'] = frame['atencion'].where(has_bultos)
+    frame['bultos'] = frame['bultos'].where(has_bultos)
+
+    grouped = frame.groupby(['Proveedor', 'actual'], sort=False)
+    stats = grouped.agg(
+        registros=('espera', 'size'),
+        a_tiempo=('a_tiempo', 'mean'),
+        espera_media=('espera', 'mean'),
+        atencion=('atencion_bultos', 'sum'),
+        bultos=('bultos', 'sum'),
+    )
+    stats['espera_p90'] = grouped['espera'].quantile(0.9)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats['min_por_bulto'] = stats['atencion'] / stats['bultos'].where(stats['bultos'] > 0)
+
+    if True not in stats.index.get_level_values('actual'):
+        return pd.DataFrame()
+    current = stats.xs(True, level='actual')
+    previous = stats.xs(False, level='actual') if False in stats.index.get_level_values('actual') \
+        else stats.iloc[0:0].droplevel('actual')
+    previous = previous.reindex(current.index)
+
+    scorecard = pd.DataFrame({
+        'Proveedor': current.index,
+        'Registros': current['registros'].to_numpy(),
+        'A tiempo (%)': (current['a_tiempo'] * 100).to_numpy(),
+        'Espera media (min)': current['espera_media'].to_numpy(),
+        'Espera p90 (min)': current['espera_p90'].to_numpy(),
+        'Atención por bulto (min)': current['min_por_bulto'].to_numpy(),
+        'Δ A tiempo (pp)': ((current['a_tiempo'] - previous['a_tiempo']) * 100).to_numpy(),
+        'Δ Espera media (min)': (current['espera_media'] - previous['espera_media']).to_numpy(),
+    })
+    return scorecard.sort_values(
+        ['A tiempo (%)', 'Espera media (min)'], ascending=[False, True], na_position='last'
+    ).reset_index(drop=True).round(1)
+
+
+CUBE_AXES = {
+    'Proveedor': 0,
+    'Semana': 1,
+    'Hora de reserva': 2,
+}
+
+
+class PivotCube:
+    """Counts and metric sums per (provider, week, reservation hour)"""
+
+    def __init__(self, providers, weeks, hours, values):
+        self.providers = providers  # sorted provider names
+        self.weeks = weeks          # sorted Monday day numbers
+        self.hours = hours          # sorted reservation hours (NO_HOUR first if present)
+        self._values = values       # (providers, weeks, hours, [sums..., counts...])
+
+    @classmethod
+    def from_gestion(cls, gestion_df):
+        records = completed_records(gestion_df)
+        days = _day_numbers(records['Hora_llegada']) if not records.empty else np.array([], dtype='int64')
+        records = records[days >= 0]
+        days = days[days >= 0]
+
+        provider_codes, providers = pd.factorize(records['Proveedor'].astype(object), sort=True)
+        week_codes, weeks = pd.factorize(_week_start(days), sort=True)
+        hours = pd.to_numeric(records['hora_de_reserva'], errors='coerce').fillna(NO_HOUR).astype('int64') \
+            if 'hora_de_reserva' in records.columns else pd.Series(NO_HOUR, index=records.index)
+        hour_codes, hour_values = pd.factorize(hours.to_numpy(), sort=True)
+
+        shape = (len(providers), len(weeks), len(hour_values))
+        flat = np.ravel_multi_index((provider_codes, week_codes, hour_codes), shape) if len(records) else \
+            np.array([], dtype='int64')
+        vectors = _record_values(records)
+        values = np.stack([
+            np.bincount(flat, weights=vectors[:, i], minlength=int(np.prod(shape)))
+            for i in range(vectors.shape[1])
+        ], axis=-1).reshape(*shape, vectors.shape[1])
+        return cls(list(providers), np.asarray(weeks), np.asarray(hour_values), values)
+
+    def _week_labels(self, weeks):
+        mondays = pd.to_datetime([_day_number_to_date(w) for w in weeks])
+        calendar = mondays.isocalendar()
+        return [f"{y}-S{w:02d}" for y, w in zip(calendar['year'], calendar['week'])]
+
+    def _labels(self, axis, selection):
+        if axis == 0:
+            return [self.providers[i] for i in selection]
+        if axis == 1:
+            return self._week_labels(self.weeks[selection])
+        return [int(h) for h in self.hours[selection]]
+
+    def _selection(self, start=None, end=None, provider=ALL):
+        """Index arrays of each axis restricted to a date range and provider"""
+        providers = np.arange(len(self.providers))
+        if provider and provider != ALL:
+            providers = providers[[p == provider for p in self.providers]]
+        weeks = np.arange(len(self.weeks))
+        if start is not None:
+            weeks = weeks[self.weeks[weeks] >= _week_start(_to_day_number(start))]
+        if end is not None:
+            weeks = weeks[self.weeks[weeks] <= _week_start(_to_day_number(end))]
+        return [providers, weeks, np.arange(len(self.hours))]
+
+    def view(self, rows, columns=None, metric='Tiempo_espera', start=None, end=None, provider=ALL):
+        """Mean of ``metric`` (or record count when metric is None) by one or two axes
+
+        ``rows``/``columns`` are keys of CUBE_AXES. Returns a DataFrame indexed
+        by the row labels, with one column per column label (or a single
+        column named after the metric).
+        """
+        selection = self._selection(start, end, provider)
+        axes = [CUBE_AXES[rows]] + ([CUBE_AXES[columns]] if columns else [])
+        if 2 in axes:
+            # Records without reservation hour only count in slices that ignore hours
+            hours = selection[2]
+            selection[2] = hours[self.hours[hours] != NO_HOUR]
+        if any(len(s) == 0 for s in selection):
+            return pd.DataFrame()
+
+        sub = self._values[np.ix_(*selection)]
+        summed = sub.sum(axis=tuple(a for a in range(3) if a not in axes))
+        if len(axes) == 2 and axes[0] > axes[1]:
+            summed = summed.swapaxes(0, 1)
+
+        if metric is None:
+            data = summed[..., len(METRICS):].max(axis=-1)
+        else:
+            metric_index = METRICS.index(metric)
+            counts = summed[..., len(METRICS) + metric_index]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                data = np.where(counts > 0, summed[..., metric_index] / counts, np.nan)
+
+        index = pd.Index(self._labels(axes[0], selection[axes[0]]), name=rows)
+        if columns is None:
+            result = pd.DataFrame({metric or 'Registros': data}, index=index)
+        else:
+            result = pd.DataFrame(data, index=index,
+                                  columns=pd.Index(self._labels(axes[1], selection[axes[1]]), name=columns))
+        # Drop rows/columns without records in this slice
+        return result.dropna(how='all').dropna(axis=1, how='all').round(1)
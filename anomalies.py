@@ -0,0 +1,157 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from gestion import get_arrival_record
+
+ANOMALY_METRICS = ('Tiempo_retraso', 'Tiempo_atencion')
+EWMA_ALPHA = 0.1          # Weight of the newest record (about the last 20 arrivals count)
+ANOMALY_Z = 3.0           # Standard deviations above the provider's norm to flag
+ANOMALY_MIN_HISTORY = 10  # Records of a provider before any of its records is flagged
+
+FLAG_COLUMNS = ['Orden_de_compra', 'Proveedor', 'Hora_llegada', 'Métrica', 'Valor', 'Esperado', 'z']
+
+
+class ProviderAnomalies:
+    """Per-provider exponentially weighted mean and variance of delay and service time
+
+    Every record is scored against its provider's statistics *before* it
+    (in arrival order), then folded in. Records ``threshold`` standard
+    deviations above the norm are flagged; only the late/slow side counts.
+    The first snapshot is backfilled in one vectorized pass per metric;
+    registrations recorded afterwards update the statistics in O(1) each.
+    """
+
+    def __init__(self, alpha=EWMA_ALPHA, threshold=ANOMALY_Z, min_history=ANOMALY_MIN_HISTORY):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_history = min_history
+        self._lock = threading.Lock()
+        self._source = None  # Gestion frame the statistics reflect
+        self._stats = {}     # (metric, provider) -> [count, mean, variance]
+        self._flags = pd.DataFrame(columns=FLAG_COLUMNS)
+        self._new_flags = []
+
+    def is_current(self, gestion_df):
+        return self._source is gestion_df
+
+    def rebuild(self, gestion_df):
+        """Backfill statistics and flags over the whole history"""
+        arrival = pd.to_datetime(gestion_df['Hora_llegada'], errors='coerce', format='mixed')
+        order = np.argsort(arrival.to_numpy(dtype='datetime64[ns]'), kind='stable')  # NaT last
+        stats, flags = {}, []
+        for metric in ANOMALY_METRICS:
+            values = pd.to_numeric(gestion_df[metric], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)[order]
+            keep = ~np.isnan(values)
+            frame = pd.DataFrame({
+                'Proveedor': gestion_df['Proveedor'].astype(str).to_numpy()[order][keep],
+                'Valor': values[keep],
+            })
+            if frame.empty:
+                continue
+            groups = frame.groupby('Proveedor', sort=False)['Valor']
+            ewm = groups.ewm(alpha=self.alpha, adjust=False)
+            mean = ewm.mean().reset_index(level=0, drop=True).sort_index()
+            variance = ewm.var(bias=True).reset_index(level=0, drop=True).sort_index()
+
+            # Statistics each record is scored against: those of the previous one
+            previous_mean = mean.groupby(frame['Proveedor']).shift()
+            previous_std = np.sqrt(variance.groupby(frame['Proveedor']).shift())
+            seen = groups.cumcount()
+            z = (frame['Valor'] - previous_mean) / previous_std.where(previous_std > 0)
+            flagged = ((seen >= self.min_history) & (z >= self.threshold)).to_numpy()
+
+            rows = order[keep][flagged]
+            flags.append(pd.DataFrame({
+                'Orden_de_compra': gestion_df['Orden_de_compra'].to_numpy()[rows],
+                'Proveedor': frame['Proveedor'].to_numpy()[flagged],
+                'Hora_llegada': arrival.to_numpy()[rows],
+                'Métrica': metric,
+                'Valor': frame['Valor'].to_numpy()[flagged],
+                'Esperado': previous_mean.to_numpy()[flagged],
+                'z': z.to_numpy()[flagged],
+            }))
+
+            last = pd.DataFrame({'count': groups.size(), 'mean': mean.groupby(frame['Proveedor']).last(),
+                                 'variance': variance.groupby(frame['Proveedor']).last()})
+            for provider, row in last.iterrows():
+                stats[(metric, provider)] = [int(row['count']), row['mean'], row['variance']]
+
+        flags = [f for f in flags if not f.empty]
+        with self._lock:
+            self._stats = stats
+            self._flags = pd.concat(flags, ignore_index=True) if flags else pd.DataFrame(columns=FLAG_COLUMNS)
+            self._new_flags = []
+            self._source = gestion_df
+
+    def advance(self, base_gestion_df, gestion_df, events):
+        """Fold the records touched by (event_type, orden, payload) events
+
+        Ignored unless the statistics reflect ``base_gestion_df``; the next
+        read then backfills from the new snapshot. Returns the new flags.
+        """
+        with self._lock:
+            if self._source is not base_gestion_df:
+                return []
+            new_flags = []
+            for event_type, orden, payload in events:
+                record = get_arrival_record(gestion_df, str(orden))
+                if record is None:
+                    continue
+                metric = 'Tiempo_retraso' if 'Hora_llegada' in payload else 'Tiempo_atencion'
+                flag = self._update(metric, record)
+                if flag is not None:
+                    new_flags.append(flag)
+            self._new_flags.extend(new_flags)
+            self._source = gestion_df
+            return new_flags
+
+    def _update(self, metric, record):
+        """Score one record and fold it into its provider's statistics"""
+        value = pd.to_numeric(record[metric], errors='coerce')
+        if pd.isna(value):
+            return None
+        value = float(value)
+        provider = str(record['Proveedor'])
+        stats = self._stats.get((metric, provider))
+        if stats is None:
+            self._stats[(metric, provider)] = [1, value, 0.0]
+            return None
+
+        count, mean, variance = stats
+        flag = None
+        std = np.sqrt(variance)
+        if count >= self.min_history and std > 0 and (value - mean) / std >= self.threshold:
+            flag = {
+                'Orden_de_compra': record['Orden_de_compra'], 'Proveedor': provider,
+                'Hora_llegada': pd.to_datetime(record['Hora_llegada'], errors='coerce'),
+                'Métrica': metric, 'Valor': value, 'Esperado': mean, 'z': (value - mean) / std,
+            }
+
+        # Same recurrence as pandas' ewm(adjust=False) mean and biased variance
+        diff = value - mean
+        increment = self.alpha * diff
+        stats[:] = [count + 1, mean + increment, (1 - self.alpha) * (variance + diff * increment)]
+        return flag
+
+    def flags(self, since=None):
+        """Flagged records, latest arrivals first, optionally from ``since`` on"""
+        with self._lock:
+            flags = self._flags
+            if self._new_flags:
+                new_flags = pd.DataFrame(self._new_flags, columns=FLAG_COLUMNS)
+                flags = pd.concat([flags, new_flags], ignore_index=True) if len(flags) else new_flags
+        if since is not None:
+            flags = flags[pd.to_datetime(flags['Hora_llegada']) >= pd.Timestamp(since)]
+        return flags.sort_values('Hora_llegada', ascending=False, ignore_index=True)
+
+    def norms(self):
+        """Current mean and standard deviation per provider and metric"""
+        with self._lock:
+            rows = [
+                {'Proveedor': provider, 'Métrica': metric, 'Registros': count,
+                 'Media': mean, 'Desv. estándar': np.sqrt(variance)}
+                for (metric, provider), (count, mean, variance) in self._stats.items()
+            ]
+        return pd.DataFrame(rows, columns=['Proveedor', 'Métrica', 'Registros', 'Media', 'Desv. estándar'])
@@ -0,0 +1,338 @@
+"""Headless ingestion of arrival and service registrations (HTTP service + CLI)
+
+Gate scanners and the WMS push events here instead of driving a browser
+session per terminal. The service shares the journal, snapshot and
+validation with the Streamlit app: run it on the same host with the same
+JOURNAL_PATH and SharePoint settings (SP_SITE_URL, SP_FILE_ID or WAREHOUSES,
+SP_USERNAME, SP_PASSWORD). With several warehouses every event names its
+"almacen". When INGEST_API_TOKEN is set, requests must send
+"Authorization: Bearer <token>".
+
+Usage:
+    python api.py serve --port 8502
+    python api.py arrival 4500123 --at "2024-05-31 08:12:00" --terminal porton-1 --almacen Norte
+    python api.py service 4500123 --inicio "2024-05-31 08:30:00" --fin "2024-05-31 09:05:00"
+    python api.py send eventos.json
+
+HTTP:
+    POST /events   one event or a list, applied in order:
+                   {"type": "arrival", "orden_de_compra": "4500123", "hora_llegada": "...", "terminal": "..."}
+                   {"type": "service", "orden_de_compra": "4500123",
+                    "hora_inicio_atencion": "...", "hora_fin_atencion": "..."}
+                   200 when all are recorded, 503 when a warehouse's storage is
+                   unavailable (the results say which events were recorded), 409
+                   when the only rejections are arrivals or services already
+                   registered, 422 otherwise
+    GET  /health   snapshot version, pending events and last errors per warehouse
+    GET  /export?proveedor=...&desde=YYYY-MM-DD&hasta=YYYY-MM-DD&formato=csv|parquet&almacen=...
+                   gestion records of the slice, streamed in chunks
+"""
+import argparse
+import hmac
+import json
+import os
+import sys
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from export import EXPORT_MIME_TYPES, iter_export, slice_positions
+from journal import EVENT_ARRIVAL, EVENT_SERVICE
+from store import (
+    DEFAULT_JOURNAL_PATH, AlreadyRegistered, arrival_registration, build_stores, parse_warehouses,
+    service_registration,
+)
+
+DEFAULT_PORT = 8502
+MAX_BODY_BYTES = 5 * 1024 * 1024  # Plenty for thousands of events per request
+
+
+def build_warehouse_stores():
+    """{warehouse: store} over the same journals and workbooks as the Streamlit app"""
+    try:
+        warehouses = parse_warehouses(os.getenv("WAREHOUSES"), os.getenv("SP_FILE_ID"))
+        if not warehouses:
+            raise KeyError("SP_FILE_ID")
+        return build_stores(
+            os.environ["SP_SITE_URL"], warehouses,
+            os.environ["SP_USERNAME"], os.environ["SP_PASSWORD"],
+            journal_path=os.getenv("JOURNAL_PATH", DEFAULT_JOURNAL_PATH),
+            writer_engine=os.getenv("EXCEL_WRITER_ENGINE"),
+        )
+    except KeyError as e:
+        sys.exit(f"Missing required environment variable: {e}")
+    except ValueError as e:
+        sys.exit(str(e))
+
+
+def _required(event, field):
+    value = event.get(field)
+    if value in (None, ""):
+        raise ValueError(f"Falta el campo '{field}'.")
+    return value
+
+
+def event_registration(reservas_df, event):
+    """Registration (see ``store.arrival_registration``) of a raw arrival or service event"""
+    if event.get('type') not in (EVENT_ARRIVAL, EVENT_SERVICE):
+        raise ValueError(f"Tipo de evento desconocido: {event.get('type')}")
+    orden_compra = _required(event, 'orden_de_compra')
+    if event['type'] == EVENT_ARRIVAL:
+        return arrival_registration(
+            reservas_df, orden_compra, _required(event, 'hora_llegada'), event.get('terminal')
+        )
+    return service_registration(
+        orden_compra, _required(event, 'hora_inicio_atencion'), _required(event, 'hora_fin_atencion'),
+        event.get('terminal')
+    )
+
+
+def _warehouse_of(stores, event):
+    """Warehouse an event belongs to; it may be omitted when there is only one"""
+    warehouse = event.get('almacen')
+    if warehouse is None and len(stores) == 1:
+        return next(iter(stores))
+    if warehouse not in stores:
+        raise ValueError(f"Almacén desconocido: {warehouse}" if warehouse else "Falta el campo 'almacen'.")
+    return warehouse
+
+
+def _unavailable(error):
+    return {'status': 'error', 'error': f'Almacenamiento no disponible: {error}', 'unavailable': True}
+
+
+def ingest(stores, events):
+    """Validate and journal a batch of raw events; returns one result per event
+
+    Events are applied in order within each warehouse. Valid events are
+    recorded even when others in the batch are rejected, or when another
+    warehouse's storage is unavailable.
+    """
+    results = [None] * len(events)
+    batches = {}  # warehouse -> (registrations, positions, reservas_df)
+    unavailable = {}  # warehouse -> error
+    for i, event in enumerate(events):
+        try:
+            if not isinstance(event, dict):
+                raise ValueError("Cada evento debe ser un objeto JSON.")
+            warehouse = _warehouse_of(stores, event)
+            if warehouse not in batches and warehouse not in unavailable:
+                try:
+                    stores[warehouse].follow_journal()
+                    batches[warehouse] = ([], [], stores[warehouse].hub.get()[1])
+                except Exception as e:
+                    # Snapshot not available (SharePoint unreachable on first load)
+                    unavailable[warehouse] = e
+            if warehouse in unavailable:
+                results[i] = _unavailable(unavailable[warehouse])
+                continue
+            registrations, positions, reservas_df = batches[warehouse]
+            registrations.append(event_registration(reservas_df, event))
+            positions.append(i)
+        except ValueError as e:
+            results[i] = {'status': 'error', 'error': str(e)}
+
+    for warehouse, (registrations, positions, _) in batches.items():
+        try:
+            outcomes = stores[warehouse].record_many(registrations, stop_on_error=False)
+        except Exception as e:
+            # Nothing of this warehouse was journaled; the others keep their results
+            for i in positions:
+                results[i] = _unavailable(e)
+            continue
+        for i, outcome in zip(positions, outcomes):
+            if isinstance(outcome, Exception):
+                results[i] = {'status': 'error', 'error': str(outcome)}
+                if isinstance(outcome, AlreadyRegistered):
+                    results[i]['conflict'] = True
+            else:
+                results[i] = {'status': 'ok', 'id': outcome, 'almacen': warehouse}
+
+    for i, event in enumerate(events):
+        if isinstance(event, dict):
+            results[i]['orden_de_compra'] = event.get('orden_de_compra')
+    return results
+
+
+def make_handler(stores, token=None):
+    class IngestHandler(BaseHTTPRequestHandler):
+        server_version = "AlmacenIngest/1.0"
+
+        def _send(self, status, body):
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _authorized(self):
+            if not token:
+                return True
+            header = self.headers.get('Authorization', '')
+            return hmac.compare_digest(header, f"Bearer {token}")
+
+        def do_GET(self):
+            if not self._authorized():
+                return self._send(401, {'error': 'No autorizado'})
+            url = urllib.parse.urlsplit(self.path)
+            if url.path == '/export':
+                return self._export(dict(urllib.parse.parse_qsl(url.query)))
+            if url.path != '/health':
+                return self._send(404, {'error': 'No encontrado'})
+            self._send(200, {
+                warehouse: {
+                    'snapshot_version': store.hub.version,
+                    'snapshot_error': str(store.hub.last_error) if store.hub.last_error else None,
+                    'pending_events': store.journal.pending_count(),
+                    'sync_error': str(store.reconciler.last_error) if store.reconciler.last_error else None,
+                    'last_sync': store.reconciler.last_sync,
+                }
+                for warehouse, store in stores.items()
+            })
+
+        def _export(self, params):
+            """Stream a gestion slice without building the file in memory"""
+            try:
+                gestion_df = stores[_warehouse_of(stores, params)].hub.get()[2]
+                export_format = params.get('formato', 'csv')
+                positions = slice_positions(
+                    gestion_df, params.get('proveedor'), params.get('desde'), params.get('hasta')
+                )
+                chunks = iter_export(gestion_df, positions, export_format)
+            except ValueError as e:
+                return self._send(400, {'error': str(e)})
+
+            # No Content-Length: the body ends when the connection closes
+            self.send_response(200)
+            self.send_header('Content-Type', EXPORT_MIME_TYPES[export_format])
+            self.send_header('Content-Disposition', f'attachment; filename="gestion.{export_format}"')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            for chunk in chunks:
+                self.wfile.write(chunk)
+            self.close_connection = True
+
+        def do_POST(self):
+            if not self._authorized():
+                return self._send(401, {'error': 'No autorizado'})
+            if self.path != '/events':
+                return self._send(404, {'error': 'No encontrado'})
+
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                return self._send(400, {'error': 'Content-Length no válido'})
+            if length > MAX_BODY_BYTES:
+                return self._send(413, {'error': 'Solicitud demasiado grande'})
+            try:
+                body = json.loads(self.rfile.read(length) or b'null')
+            except ValueError:
+                return self._send(400, {'error': 'JSON no válido'})
+            if body is None:
+                return self._send(400, {'error': 'Se esperaba un evento o una lista de eventos'})
+
+            single = not isinstance(body, list)
+            results = ingest(stores, [body] if single else body)
+
+            accepted = sum(r['status'] == 'ok' for r in results)
+            if accepted == len(results):
+                status = 200
+            elif any(r.get('unavailable') for r in results):
+                status = 503
+            elif all(r['status'] == 'ok' or r.get('conflict') for r in results):
+                status = 409
+            else:
+                status = 422
+            self._send(status, results[0] if single else {
+                'accepted': accepted, 'rejected': len(results) - accepted, 'results': results,
+            })
+
+    return IngestHandler
+
+
+def serve(host, port):
+    stores = build_warehouse_stores()
+    for store in stores.values():
+        store.start()
+    server = ThreadingHTTPServer((host, port), make_handler(stores, os.getenv("INGEST_API_TOKEN")))
+    print(f"Escuchando en http://{host}:{port} (almacenes: {', '.join(stores)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def post_events(url, events):
+    """Send events to a running service and return (status, response body)"""
+    request = urllib.request.Request(
+        url.rstrip('/') + '/events',
+        data=json.dumps(events).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST',
+    )
+    token = os.getenv("INGEST_API_TOKEN")
+    if token:
+        request.add_header('Authorization', f"Bearer {token}")
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default=os.getenv("INGEST_URL", f"http://127.0.0.1:{DEFAULT_PORT}"),
+                        help='Service URL for the client commands')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help='Run the HTTP service')
+    serve_parser.add_argument('--host', default='0.0.0.0')
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+
+    arrival_parser = commands.add_parser('arrival', help='Register an arrival')
+    arrival_parser.add_argument('orden')
+    arrival_parser.add_argument('--at', required=True, help="'YYYY-MM-DD HH:MM:SS'")
+    arrival_parser.add_argument('--terminal')
+    arrival_parser.add_argument('--almacen')
+
+    service_parser = commands.add_parser('service', help='Register service start and end')
+    service_parser.add_argument('orden')
+    service_parser.add_argument('--inicio', required=True)
+    service_parser.add_argument('--fin', required=True)
+    service_parser.add_argument('--terminal')
+    service_parser.add_argument('--almacen')
+
+    send_parser = commands.add_parser('send', help='Send events from a JSON file (object or list)')
+    send_parser.add_argument('file')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.host, args.port)
+        return
+
+    if args.command == 'arrival':
+        events = {'type': EVENT_ARRIVAL, 'orden_de_compra': args.orden,
+                  'hora_llegada': args.at, 'terminal': args.terminal, 'almacen': args.almacen}
+    elif args.command == 'service':
+        events = {'type': EVENT_SERVICE, 'orden_de_compra': args.orden,
+                  'hora_inicio_atencion': args.inicio, 'hora_fin_atencion': args.fin,
+                  'terminal': args.terminal, 'almacen': args.almacen}
+    else:
+        with open(args.file, encoding='utf-8') as f:
+            events = json.load(f)
+
+    status, body = post_events(args.url, events)
+    print(json.dumps(body, ensure_ascii=False, indent=2))
+    sys.exit(0 if status == 200 else 1)
+
+
+if __name__ == '__main__':
+    main()
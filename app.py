@@ -1,14 +1,39 @@
+import time
+SCRIPT_START = time.perf_counter()  # Start of this rerun, for the load timing report
+
+import hmac
 import io
 import os
+import uuid
 import streamlit as st
 import pandas as pd
-import time
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 from datetime import datetime, timedelta, time as dt_time
-from office365.sharepoint.client_context import ClientContext
-from office365.runtime.auth.user_credential import UserCredential
+from anomalies import ANOMALY_Z, FLAG_COLUMNS
+from analytics import (
+    DURATION_METRICS, DailyIndex, PivotCube, QuantileSketches, VersionedCache, provider_scorecard
+)
+from dock_queue import ServiceTimeModel, forecast_day, optimize_slots, slot_minutes
+from export import EXPORT_MIME_TYPES, available_export_formats, iter_export, slice_positions
+from gestion import (
+    build_arrival_data, get_arrival_record, get_completed_orders, get_existing_arrivals,
+    get_pending_arrivals, get_today_reservations,
+)
+from history import HISTORY_PAGE_SIZES, STATUSES, HistoryIndex
+from order_lookup import OrderPrefixIndex
+from profiling import (
+    hotspots, memory_top, profile_bytes, profile_call, start_memory_tracing,
+    stop_memory_tracing, take_memory_snapshot, traced_memory_mb,
+)
+from reservation_import import plan_import, read_reservations_batch
+from schema import GESTION_COLUMNS, compact_gestion, memory_report
+from store import (
+    DEFAULT_JOURNAL_PATH, arrival_registration, build_stores, load_snapshots, parse_warehouses,
+    service_registration,
+)
+
+# plotly and office365 are imported lazily where they are used: they are the
+# slowest imports and are not needed to paint the registration tabs
+IMPORTS_DONE = time.perf_counter()
 
 # Configure page
 st.set_page_config(
@@ -139,126 +164,142 @@ st.markdown("""
 # ─────────────────────────────────────────────────────────────
 # 1. Configuration
 # ─────────────────────────────────────────────────────────────
+def get_optional_setting(name, default=None):
+    """Read an optional setting from the environment or secrets"""
+    value = os.getenv(name)
+    if value is not None:
+        return value
+    # Deployments configured only through the environment have no secrets.toml
+    if not st.secrets.load_if_toml_exists():
+        return default
+    return st.secrets.get(name, default)
+
 try:
     SITE_URL = os.getenv("SP_SITE_URL") or st.secrets["SP_SITE_URL"]
-    FILE_ID = os.getenv("SP_FILE_ID") or st.secrets["SP_FILE_ID"]
     USERNAME = os.getenv("SP_USERNAME") or st.secrets["SP_USERNAME"]
     PASSWORD = os.getenv("SP_PASSWORD") or st.secrets["SP_PASSWORD"]
 except KeyError as e:
     st.error(f"Missing required environment variable or secret: {e}")
     st.stop()
 
+# Warehouse workbooks served by this process: WAREHOUSES, or the single SP_FILE_ID
+try:
+    WAREHOUSES = parse_warehouses(get_optional_setting("WAREHOUSES"), get_optional_setting("SP_FILE_ID"))
+except ValueError as e:
+    st.error(str(e))
+    st.stop()
+if not WAREHOUSES:
+    st.error("Missing required environment variable or secret: 'SP_FILE_ID'")
+    st.stop()
+
+# Dashboard scope aggregating every warehouse
+ALL_WAREHOUSES = "Todos los almacenes"
+
+# Metrics watched for providers running late or slow
+ANOMALY_METRIC_LABELS = {'Tiempo_retraso': 'Retraso', 'Tiempo_atencion': 'Tiempo de atención'}
+
+# xlsx writer used for uploads: xlsxwriter, openpyxl_write_only or openpyxl
+EXCEL_WRITER_ENGINE = get_optional_setting("EXCEL_WRITER_ENGINE")
+
+# Docks unloading in parallel (default for the queue forecast)
+DOCK_BAYS = int(get_optional_setting("DOCK_BAYS", 2))
+
+# Reservations allowed in the same hour when importing bookings (0 = no limit)
+SLOT_CAPACITY = int(get_optional_setting("SLOT_CAPACITY", 0))
+
+# Admin-only profiling of a rerun with ?perfil=<PROFILER_TOKEN> (disabled when unset)
+PROFILER_TOKEN = get_optional_setting("PROFILER_TOKEN")
+
 # ─────────────────────────────────────────────────────────────
 # 2. Excel Download Functions
 # ─────────────────────────────────────────────────────────────
-@st.cache_data(ttl=300)  # Cache for 5 minutes
+SNAPSHOT_POLL_SECONDS = 5   # How often sessions check for new snapshots
+MANUAL_REFRESH_DEBOUNCE_SECONDS = 30  # Ignore repeated "Actualizar Excel" clicks
+
+# Local journal of registrations not yet written to SharePoint (shared with api.py)
+JOURNAL_PATH = get_optional_setting("JOURNAL_PATH", DEFAULT_JOURNAL_PATH)
+
+@st.cache_resource
+def get_stores():
+    """Journal, shared snapshot and compaction of every warehouse in this server process"""
+    return build_stores(
+        SITE_URL, WAREHOUSES, USERNAME, PASSWORD,
+        journal_path=JOURNAL_PATH, writer_engine=EXCEL_WRITER_ENGINE
+    )
+
+def get_current_warehouse():
+    """Warehouse this session registers arrivals and services for"""
+    warehouse = st.session_state.get('warehouse')
+    return warehouse if warehouse in WAREHOUSES else next(iter(WAREHOUSES))
+
+def get_store(warehouse=None):
+    """Store of one warehouse (the session's current one by default)"""
+    return get_stores()[warehouse or get_current_warehouse()]
+
+def get_journal():
+    """Local journal every registration is written to before SharePoint"""
+    return get_store().journal
+
+def get_snapshot_hub():
+    """Workbook snapshot shared by every session in this server process"""
+    return get_store().hub
+
+def get_reconciler():
+    """Scheduled compaction of journaled registrations into SharePoint"""
+    return get_store().reconciler
+
 def download_excel_to_memory():
-    """Download Excel file from SharePoint to memory"""
+    """Get the shared workbook snapshot, downloading it when stale"""
     try:
-        # Authenticate
-        user_credentials = UserCredential(USERNAME, PASSWORD)
-        ctx = ClientContext(SITE_URL).with_credentials(user_credentials)
-        
-        # Get file
-        file = ctx.web.get_file_by_id(FILE_ID)
-        ctx.load(file)
-        ctx.execute_query()
-        
-        # Download to memory
-        file_content = io.BytesIO()
-        
-        # Try multiple download methods
-        try:
-            file.download(file_content)
-            ctx.execute_query()
-        except TypeError:
-            try:
-                response = file.download()
-                ctx.execute_query()
-                file_content = io.BytesIO(response.content)
-            except:
-                file.download_session(file_content)
-                ctx.execute_query()
-        
-        file_content.seek(0)
-        
-        # Load all sheets
-        credentials_df = pd.read_excel(file_content, sheet_name="proveedor_credencial", dtype=str)
-        reservas_df = pd.read_excel(file_content, sheet_name="proveedor_reservas", dtype={'Orden_de_compra': str})
-        
-        # Try to load gestion sheet, create if doesn't exist
-        try:
-            gestion_df = pd.read_excel(file_content, sheet_name="proveedor_gestion")
-        except ValueError:
-            # Create empty gestion dataframe with required columns
-            gestion_df = pd.DataFrame(columns=[
-                'Orden_de_compra', 'Proveedor', 'Numero_de_bultos',
-                'Hora_llegada', 'Hora_inicio_atencion', 'Hora_fin_atencion',
-                'Tiempo_espera', 'Tiempo_atencion', 'Tiempo_total', 'Tiempo_retraso',
-                'numero_de_semana', 'hora_de_reserva'
-            ])
-        
-        return credentials_df, reservas_df, gestion_df
-        
+        version, frames = get_snapshot_hub().get_versioned()
     except Exception as e:
         st.error(f"Error descargando Excel: {str(e)}")
         return None, None, None
+    
+    # Remember which version this session is showing
+    st.session_state.setdefault('snapshot_versions', {})[get_current_warehouse()] = version
+    return frames
 
-def save_gestion_to_excel(new_record):
-    """Save new management record to Excel file"""
+@st.experimental_fragment(run_every=SNAPSHOT_POLL_SECONDS)
+def watch_snapshot_version():
+    """Rerun this session when another terminal publishes a new snapshot"""
+    # Registrations pushed through the ingestion API land in the shared journals
+    for store in get_stores().values():
+        store.follow_journal()
+    seen_versions = st.session_state.get('snapshot_versions', {})
+    if any(get_store(name).hub.version != version for name, version in seen_versions.items()):
+        st.rerun()
+
+@st.experimental_fragment(run_every=SNAPSHOT_POLL_SECONDS)
+def show_dock_occupancy():
+    """Trucks waiting and being served right now at this warehouse"""
     try:
-        # Load current data
-        credentials_df, reservas_df, gestion_df = download_excel_to_memory()
-        
-        if reservas_df is None:
-            return False
-        
-        # Add new record
-        new_row = pd.DataFrame([new_record])
-        updated_gestion_df = pd.concat([gestion_df, new_row], ignore_index=True)
-        
-        # Authenticate and upload
-        user_credentials = UserCredential(USERNAME, PASSWORD)
-        ctx = ClientContext(SITE_URL).with_credentials(user_credentials)
-        
-        # Create Excel file
-        excel_buffer = io.BytesIO()
-        with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-            credentials_df.to_excel(writer, sheet_name="proveedor_credencial", index=False)
-            reservas_df.to_excel(writer, sheet_name="proveedor_reservas", index=False)
-            updated_gestion_df.to_excel(writer, sheet_name="proveedor_gestion", index=False)
-        
-        # Get the file info
-        file = ctx.web.get_file_by_id(FILE_ID)
-        ctx.load(file)
-        ctx.execute_query()
-        
-        file_name = file.properties['Name']
-        server_relative_url = file.properties['ServerRelativeUrl']
-        folder_url = server_relative_url.replace('/' + file_name, '')
-        
-        # Upload the updated file
-        folder = ctx.web.get_folder_by_server_relative_url(folder_url)
-        excel_buffer.seek(0)
-        folder.files.add(file_name, excel_buffer.getvalue(), True)
-        ctx.execute_query()
-        
-        # Clear cache
-        download_excel_to_memory.clear()
-        
-        return True
-        
-    except Exception as e:
-        st.error(f"Error guardando registro: {str(e)}")
-        return False
+        status = get_store().occupancy_status(DOCK_BAYS)
+    except Exception:
+        return  # No snapshot yet: the load error is shown elsewhere
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("🚚 En espera", status['waiting'])
+    col2.metric("⚙️ En atención", status['in_service'])
+    col3.metric("⏳ Espera más larga", f"{status['longest_wait']:.0f} min")
+    col4.metric(
+        "📦 Cola proyectada", f"{status['backlog']:.0f} min",
+        help=f"Tiempo para atender a los camiones en el patio con {DOCK_BAYS} andén(es)"
+    )
+
+# Start downloading the workbook in the background as soon as the server
+# runs the script, while the page is still being built, and fold journaled
+# registrations into the workbook on a schedule (every warehouse at once)
+for warehouse_store in get_stores().values():
+    warehouse_store.start()
 
 # ─────────────────────────────────────────────────────────────
 # 3. Helper Functions
 # ─────────────────────────────────────────────────────────────
-def get_today_reservations(reservas_df):
-    """Get today's reservations"""
-    today = datetime.now().strftime('%Y-%m-%d')
-    return reservas_df[reservas_df['Fecha'].astype(str).str.contains(today, na=False)]
+def get_upcoming_reservations(reservas_df, days_ahead):
+    """Get reservations from tomorrow up to ``days_ahead`` days ahead"""
+    dates = pd.to_datetime(reservas_df['Fecha'], errors='coerce', format='mixed').dt.normalize()
+    tomorrow = pd.Timestamp(datetime.now().date()) + pd.Timedelta(days=1)
+    return reservas_df[(dates >= tomorrow) & (dates < tomorrow + pd.Timedelta(days=days_ahead))]
 
 def parse_time_range(time_range_str):
     """Parse time range string (e.g., '09:00-09:30' or '09:00 - 09:30') and return start time"""
@@ -278,19 +319,6 @@ def parse_single_time(time_str):
     except:
         return None
 
-def calculate_time_difference(start_datetime, end_datetime):
-    """Calculate time difference in minutes"""
-    if start_datetime and end_datetime:
-        # Ensure both are datetime objects
-        if isinstance(start_datetime, str):
-            start_datetime = datetime.fromisoformat(start_datetime)
-        if isinstance(end_datetime, str):
-            end_datetime = datetime.fromisoformat(end_datetime)
-            
-        diff = end_datetime - start_datetime
-        return int(diff.total_seconds() / 60)
-    return None
-
 def combine_date_time(date_part, time_part):
     """Combine date and time into datetime"""
     return datetime.combine(date_part, time_part)
@@ -302,6 +330,144 @@ def get_current_week():
     """Get current week number"""
     return datetime.now().isocalendar()[1]
 
+@st.cache_resource
+def get_snapshot_views():
+    """Dashboard views of the shared snapshots, rebuilt once per version"""
+    return VersionedCache()
+
+def get_view_version(scope):
+    """Snapshot version(s) this session shows for a warehouse or ALL_WAREHOUSES"""
+    versions = st.session_state.get('snapshot_versions', {})
+    if scope == ALL_WAREHOUSES:
+        return tuple(sorted(versions.items()))
+    return versions.get(scope)
+
+def get_snapshot_view(name, scope, build):
+    """View of one warehouse (the current one by default) or of all of them"""
+    scope = scope or get_current_warehouse()
+    return get_snapshot_views().get(f'{scope}:{name}', get_view_version(scope), build)
+
+def get_warehouse_gestion(scope):
+    """Gestion records of one warehouse, or of every warehouse combined
+
+    All warehouses are downloaded in parallel, so the wait is that of the
+    slowest workbook. Returns (gestion_df, {warehouse: load error}).
+    """
+    stores = get_stores() if scope == ALL_WAREHOUSES else {scope: get_store(scope)}
+    snapshots = load_snapshots(stores)
+    errors = {name: s for name, s in snapshots.items() if isinstance(s, Exception)}
+    loaded = {name: s for name, s in snapshots.items() if not isinstance(s, Exception)}
+    
+    versions = st.session_state.setdefault('snapshot_versions', {})
+    versions.update({name: version for name, (version, frames) in loaded.items()})
+    
+    if scope != ALL_WAREHOUSES:
+        gestion_df = loaded[scope][1][2] if scope in loaded else pd.DataFrame(columns=GESTION_COLUMNS)
+        return gestion_df, errors
+    
+    return get_snapshot_view(
+        'gestion', ALL_WAREHOUSES,
+        lambda previous: combine_warehouse_gestion({
+            name: frames[2] for name, (version, frames) in loaded.items()
+        })
+    ), errors
+
+def combine_warehouse_gestion(gestion_by_warehouse):
+    """One gestion frame for several warehouses, with an 'Almacen' column
+    
+    Order numbers are prefixed with the warehouse, so the same PO received
+    at two docks stays two records.
+    """
+    frames = [
+        gestion_df.assign(
+            Almacen=name,
+            Orden_de_compra=name + '/' + gestion_df['Orden_de_compra'].astype(str)
+        )
+        for name, gestion_df in gestion_by_warehouse.items() if not gestion_df.empty
+    ]
+    if not frames:
+        return pd.DataFrame(columns=GESTION_COLUMNS)
+    return compact_gestion(pd.concat(frames, ignore_index=True))
+
+def get_daily_index(gestion_df, scope=None):
+    """Prefix-sum index for date-range queries on the current snapshot"""
+    def build(previous):
+        if previous is None:
+            return DailyIndex.from_gestion(gestion_df)
+        # Only registrations completed since the previous version are added
+        return previous.sync(gestion_df)
+    
+    return get_snapshot_view('daily_index', scope, build)
+
+def get_quantile_sketches(gestion_df, scope=None):
+    """Weekly percentile sketches of the current snapshot"""
+    def build(previous):
+        if previous is None:
+            return QuantileSketches.from_gestion(gestion_df)
+        return previous.sync(gestion_df)
+    
+    return get_snapshot_view('quantile_sketches', scope, build)
+
+def get_pivot_cube(gestion_df, scope=None):
+    """Provider × week × hour cube of the current snapshot"""
+    return get_snapshot_view(
+        'pivot_cube', scope, lambda previous: PivotCube.from_gestion(gestion_df)
+    )
+
+def get_provider_scorecard(gestion_df, start_date, end_date, scope=None):
+    """All-provider scorecard for a period, computed once per snapshot version"""
+    return get_snapshot_view(
+        f'scorecard:{start_date}:{end_date}', scope,
+        lambda previous: provider_scorecard(gestion_df, start_date, end_date)
+    )
+
+def get_service_time_model(gestion_df):
+    """Historical service/delay distributions, rebuilt per snapshot version"""
+    return get_snapshot_view(
+        'service_time_model', None, lambda previous: ServiceTimeModel(gestion_df)
+    )
+
+def get_dock_forecast(today_reservations, gestion_df, bays):
+    """Queue forecast for today's reservations, recomputed per snapshot version"""
+    model = get_service_time_model(gestion_df)
+    # Not-yet-arrived trucks can't arrive in the past: refresh every 15 minutes
+    now = datetime.now()
+    quarter = now.replace(minute=now.minute - now.minute % 15, second=0, microsecond=0)
+    return get_snapshot_view(
+        f'dock_forecast:{bays}:{quarter:%H%M}', None,
+        lambda previous: forecast_day(today_reservations, gestion_df, bays, now=quarter, model=model)
+    )
+
+def get_history_index(gestion_df):
+    """Arrival-sorted record positions for the history browser, per snapshot version"""
+    return get_snapshot_view('history_index', None, lambda previous: HistoryIndex(gestion_df))
+
+def get_order_index(today_reservations):
+    """Prefix index over today's orders and providers, per snapshot version and day"""
+    return get_snapshot_view(
+        f'order_index:{datetime.now():%Y-%m-%d}', None,
+        lambda previous: OrderPrefixIndex(today_reservations)
+    )
+
+def get_anomaly_flags(scope):
+    """Records unusual for their provider, in one warehouse or in all of them"""
+    names = list(WAREHOUSES) if scope == ALL_WAREHOUSES else [scope]
+    frames = []
+    for name in names:
+        try:
+            frames.append(get_store(name).anomaly_engine().flags().assign(Almacen=name))
+        except Exception:
+            continue  # Warehouse without a snapshot: its load error is shown elsewhere
+    if not frames:
+        return pd.DataFrame(columns=[*FLAG_COLUMNS, 'Almacen'])
+    return pd.concat(frames, ignore_index=True)
+
+def get_completed_weeks_range(weeks_back):
+    """First and last date of the last ``weeks_back`` completed weeks"""
+    today = datetime.now().date()
+    week_start = today - timedelta(days=today.weekday())
+    return week_start - timedelta(weeks=weeks_back), week_start - timedelta(days=1)
+
 def get_completed_weeks_data(gestion_df, weeks_back):
     """Get data for completed weeks only"""
     if gestion_df.empty:
@@ -388,15 +554,17 @@ def aggregate_by_hour(df, weeks_back, provider_filter=None):
     
     return hourly_data
 
-def create_weekly_times_chart(weekly_data):
-    """Create chart for weekly time metrics"""
+def create_weekly_times_chart(weekly_data, x_column='numero_de_semana', x_title='Número de Semana'):
+    """Create chart for weekly (or daily) time metrics"""
+    import plotly.graph_objects as go
+    
     if weekly_data.empty:
         return None
     
     fig = go.Figure()
     
     fig.add_trace(go.Scatter(
-        x=weekly_data['numero_de_semana'],
+        x=weekly_data[x_column],
         y=weekly_data['Tiempo_espera'],
         mode='lines+markers',
         name='Tiempo de Espera',
@@ -404,7 +572,7 @@ def create_weekly_times_chart(weekly_data):
     ))
     
     fig.add_trace(go.Scatter(
-        x=weekly_data['numero_de_semana'],
+        x=weekly_data[x_column],
         y=weekly_data['Tiempo_atencion'],
         mode='lines+markers', 
         name='Tiempo de Atención',
@@ -412,7 +580,7 @@ def create_weekly_times_chart(weekly_data):
     ))
     
     fig.add_trace(go.Scatter(
-        x=weekly_data['numero_de_semana'],
+        x=weekly_data[x_column],
         y=weekly_data['Tiempo_total'],
         mode='lines+markers',
         name='Tiempo Total', 
@@ -420,26 +588,29 @@ def create_weekly_times_chart(weekly_data):
     ))
     
     fig.update_layout(
-        title='Tiempos Promedio por Semana',
-        xaxis_title='Número de Semana',
+        title='Tiempos Promedio por Semana' if x_column == 'numero_de_semana' else 'Tiempos Promedio por Día',
+        xaxis_title=x_title,
         yaxis_title='Tiempo (minutos)',
         hovermode='x unified'
     )
     
-    # Set x-axis tick interval to 1
-    fig.update_xaxes(dtick=1)
+    # Set x-axis tick interval to 1 (one tick per week)
+    if x_column == 'numero_de_semana':
+        fig.update_xaxes(dtick=1)
     
     return fig
 
-def create_weekly_delay_chart(weekly_data):
-    """Create chart for weekly delay metrics"""
+def create_weekly_delay_chart(weekly_data, x_column='numero_de_semana', x_title='Número de Semana'):
+    """Create chart for weekly (or daily) delay metrics"""
+    import plotly.graph_objects as go
+    
     if weekly_data.empty:
         return None
     
     fig = go.Figure()
     
     fig.add_trace(go.Scatter(
-        x=weekly_data['numero_de_semana'],
+        x=weekly_data[x_column],
         y=weekly_data['Tiempo_retraso'],
         mode='lines+markers',
         name='Tiempo de Retraso',
@@ -450,17 +621,21 @@ def create_weekly_delay_chart(weekly_data):
     fig.add_hline(y=0, line_dash="dash", line_color="gray", opacity=0.5)
     
     fig.update_layout(
-        title='Tiempo de Retraso Promedio por Semana',
-        xaxis_title='Número de Semana',
+        title='Tiempo de Retraso Promedio por Semana' if x_column == 'numero_de_semana' else 'Tiempo de Retraso Promedio por Día',
+        xaxis_title=x_title,
         yaxis_title='Tiempo (minutos)',
-        hovermode='x unified',
-        xaxis=dict(dtick=1)
+        hovermode='x unified'
     )
     
+    if x_column == 'numero_de_semana':
+        fig.update_xaxes(dtick=1)
+    
     return fig
 
 def create_hourly_times_chart(hourly_data):
     """Create chart for hourly time metrics"""
+    import plotly.graph_objects as go
+    
     if hourly_data.empty:
         return None
     
@@ -498,6 +673,8 @@ def create_hourly_times_chart(hourly_data):
 
 def create_hourly_delay_chart(hourly_data):
     """Create chart for hourly delay metrics"""
+    import plotly.graph_objects as go
+    
     if hourly_data.empty:
         return None
     
@@ -524,205 +701,271 @@ def create_hourly_delay_chart(hourly_data):
     
     return fig
 
-def get_existing_arrivals(gestion_df):
-    """Get orders that already have arrival registered today but not yet completed"""
-    today = datetime.now().strftime('%Y-%m-%d')
-    if gestion_df.empty:
-        return []
+def create_percentile_chart(percentile_data, metric_label, x_column='numero_de_semana', x_title='Número de Semana'):
+    """Create chart for p50/p90/p95 of one time metric"""
+    import plotly.graph_objects as go
     
-    # Filter records with arrival time from today
-    today_arrivals = gestion_df[
-        gestion_df['Hora_llegada'].astype(str).str.contains(today, na=False)
-    ]
+    if percentile_data.empty:
+        return None
     
-    # Only return orders that don't have service times completed
-    pending_service = today_arrivals[
-        today_arrivals['Hora_inicio_atencion'].isna() | 
-        today_arrivals['Hora_fin_atencion'].isna()
-    ]
+    fig = go.Figure()
     
-    return sorted(pending_service['Orden_de_compra'].tolist())
-
-def get_completed_orders(gestion_df):
-    """Get orders that have both arrival and service registered today"""
-    today = datetime.now().strftime('%Y-%m-%d')
-    if gestion_df.empty:
-        return []
+    for column, color in [('p50', '#45B7D1'), ('p90', '#F39C12'), ('p95', '#E74C3C')]:
+        fig.add_trace(go.Scatter(
+            x=percentile_data[x_column],
+            y=percentile_data[column],
+            mode='lines+markers',
+            name=column.upper(),
+            line=dict(color=color)
+        ))
     
-    # Filter records with arrival time from today
-    today_records = gestion_df[
-        gestion_df['Hora_llegada'].astype(str).str.contains(today, na=False)
-    ]
+    fig.update_layout(
+        title=f'Percentiles de {metric_label}',
+        xaxis_title=x_title,
+        yaxis_title='Tiempo (minutos)',
+        hovermode='x unified'
+    )
     
-    # Return orders that have both arrival and service times
-    completed = today_records[
-        today_records['Hora_inicio_atencion'].notna() & 
-        today_records['Hora_fin_atencion'].notna()
-    ]
+    if x_column == 'numero_de_semana':
+        fig.update_xaxes(dtick=1)
     
-    return completed['Orden_de_compra'].tolist()
+    return fig
 
-def get_pending_arrivals(today_reservations, gestion_df):
-    """Get orders that haven't registered arrival yet"""
-    existing_arrivals = get_existing_arrivals(gestion_df)
-    completed_orders = get_completed_orders(gestion_df)
+def create_heatmap_chart(pivot_data, value_label, x_title, y_title):
+    """Create heatmap for a two-axis slice of the pivot cube"""
+    import plotly.graph_objects as go
     
-    # Combine both lists to exclude from dropdown
-    processed_orders = existing_arrivals + completed_orders
+    if pivot_data.empty:
+        return None
     
-    # Return orders that haven't been processed at all
-    pending = today_reservations[
-        ~today_reservations['Orden_de_compra'].isin(processed_orders)
-    ]
+    fig = go.Figure(data=go.Heatmap(
+        z=pivot_data.values,
+        x=[str(c) for c in pivot_data.columns],
+        y=[str(i) for i in pivot_data.index],
+        colorscale='RdYlGn_r',
+        colorbar=dict(title=value_label),
+        hoverongaps=False
+    ))
     
-    return sorted(pending['Orden_de_compra'].astype(str).tolist())
+    fig.update_layout(
+        title=f'{value_label}: {y_title} × {x_title}',
+        xaxis_title=x_title,
+        yaxis_title=y_title,
+        xaxis=dict(type='category'),
+        yaxis=dict(type='category', autorange='reversed'),
+        height=max(400, 22 * len(pivot_data.index) + 150)
+    )
+    
+    return fig
 
-def get_arrival_record(gestion_df, orden_compra):
-    """Get existing arrival record for an order"""
-    if gestion_df.empty:
+def create_forecast_chart(forecast_data):
+    """Create chart for the expected dock wait per booked hour"""
+    import plotly.graph_objects as go
+    
+    if forecast_data.empty:
         return None
     
-    record = gestion_df[gestion_df['Orden_de_compra'] == orden_compra]
-    return record.iloc[0] if not record.empty else None
+    fig = go.Figure()
+    
+    fig.add_trace(go.Bar(
+        x=forecast_data['Hora'],
+        y=forecast_data['Espera esperada (min)'],
+        name='Espera Esperada',
+        marker_color='#45B7D1'
+    ))
+    
+    fig.add_trace(go.Scatter(
+        x=forecast_data['Hora'],
+        y=forecast_data['Espera p90 (min)'],
+        mode='lines+markers',
+        name='Espera P90',
+        line=dict(color='#E74C3C')
+    ))
+    
+    fig.update_layout(
+        title='Espera Pronosticada por Hora de Reserva',
+        xaxis_title='Hora de Reserva',
+        yaxis_title='Tiempo (minutos)',
+        hovermode='x unified'
+    )
+    
+    return fig
+
+def get_terminal_id():
+    """Name of this terminal for the event log (?terminal=... or a per-session id)"""
+    if 'terminal_id' not in st.session_state:
+        st.session_state['terminal_id'] = (
+            st.query_params.get("terminal") or f"web-{uuid.uuid4().hex[:8]}"
+        )
+    return st.session_state['terminal_id']
 
-def save_arrival_to_excel(arrival_data):
-    """Save arrival data to Excel file"""
+def record_registration(registration):
+    """Append a registration to the event log and show it to every session at once
+    
+    ``registration`` comes from ``arrival_registration``/``service_registration``,
+    which the ingestion API uses too, so both reject the same repeated
+    registrations. The event is fsync'd to the local journal and applied to
+    the shared snapshot under the hub lock. Writing the workbook is left to
+    the scheduled compaction, so saving never waits on (or fails with)
+    SharePoint.
+    """
+    get_store().record(*registration)
+
+def save_arrival_to_excel(registration):
+    """Save an arrival registration (journaled locally, synced to Excel in the background)"""
     try:
-        credentials_df, reservas_df, gestion_df = download_excel_to_memory()
-        
-        if reservas_df is None:
-            return False
-        
-        # Check if record already exists
-        existing_record = get_arrival_record(gestion_df, arrival_data['Orden_de_compra'])
-        
-        if existing_record is not None:
-            # Update existing record
-            gestion_df.loc[
-                gestion_df['Orden_de_compra'] == arrival_data['Orden_de_compra'], 
-                'Hora_llegada'
-            ] = arrival_data['Hora_llegada']
-            
-            # Update week number and reservation hour if missing
-            if 'numero_de_semana' not in gestion_df.columns:
-                gestion_df['numero_de_semana'] = None
-            if 'hora_de_reserva' not in gestion_df.columns:
-                gestion_df['hora_de_reserva'] = None
-            
-            # Calculate week number from arrival date
-            arrival_datetime = datetime.fromisoformat(arrival_data['Hora_llegada'])
-            week_number = arrival_datetime.isocalendar()[1]
-            
-            gestion_df.loc[
-                gestion_df['Orden_de_compra'] == arrival_data['Orden_de_compra'], 
-                'numero_de_semana'
-            ] = week_number
-            
-            # Update reservation hour
-            gestion_df.loc[
-                gestion_df['Orden_de_compra'] == arrival_data['Orden_de_compra'], 
-                'hora_de_reserva'
-            ] = arrival_data['hora_de_reserva']
-            
-            updated_gestion_df = gestion_df
-        else:
-            # Add week number and reservation hour to new arrival data
-            arrival_datetime = datetime.fromisoformat(arrival_data['Hora_llegada'])
-            week_number = arrival_datetime.isocalendar()[1]
-            arrival_data['numero_de_semana'] = week_number
-            
-            # Add new record
-            new_row = pd.DataFrame([arrival_data])
-            updated_gestion_df = pd.concat([gestion_df, new_row], ignore_index=True)
-        
-        return upload_excel_file(credentials_df, reservas_df, updated_gestion_df)
+        record_registration(registration)
+        return True
         
+    except ValueError as e:
+        st.error(str(e))
+        return False
     except Exception as e:
         st.error(f"Error guardando llegada: {str(e)}")
         return False
 
-def update_service_times(orden_compra, service_data):
-    """Update service times for existing arrival record"""
+def update_service_times(registration):
+    """Save a service registration for an arrived order (synced in the background)"""
     try:
-        credentials_df, reservas_df, gestion_df = download_excel_to_memory()
-        
-        if gestion_df.empty:
-            return False
-        
-        # Find the record to update
-        mask = gestion_df['Orden_de_compra'] == orden_compra
-        if not mask.any():
-            st.error("No se encontró registro de llegada para esta orden.")
-            return False
-        
-        # Ensure week number and reservation hour columns exist
-        if 'numero_de_semana' not in gestion_df.columns:
-            gestion_df['numero_de_semana'] = None
-            
-            # Calculate week number for existing records that don't have it
-            for idx, row in gestion_df.iterrows():
-                if pd.notna(row['Hora_llegada']):
-                    try:
-                        arrival_dt = datetime.fromisoformat(str(row['Hora_llegada']))
-                        gestion_df.loc[idx, 'numero_de_semana'] = arrival_dt.isocalendar()[1]
-                    except:
-                        pass
-        
-        if 'hora_de_reserva' not in gestion_df.columns:
-            gestion_df['hora_de_reserva'] = None
-            
-            # Calculate reservation hour for existing records that don't have it
-            # This would require accessing reservas_df, so we'll leave it as None for existing records
-            # It will be populated for new records going forward
-        
-        # Update service times and calculations
-        gestion_df.loc[mask, 'Hora_inicio_atencion'] = service_data['Hora_inicio_atencion']
-        gestion_df.loc[mask, 'Hora_fin_atencion'] = service_data['Hora_fin_atencion']
-        gestion_df.loc[mask, 'Tiempo_espera'] = service_data['Tiempo_espera']
-        gestion_df.loc[mask, 'Tiempo_atencion'] = service_data['Tiempo_atencion']
-        gestion_df.loc[mask, 'Tiempo_total'] = service_data['Tiempo_total']
-        
-        return upload_excel_file(credentials_df, reservas_df, gestion_df)
+        record_registration(registration)
+        return True
         
+    except ValueError as e:
+        st.error(str(e))
+        return False
     except Exception as e:
         st.error(f"Error actualizando tiempos de atención: {str(e)}")
         return False
 
-def upload_excel_file(credentials_df, reservas_df, gestion_df):
-    """Upload updated Excel file to SharePoint"""
+def show_anomaly_warning(orden_compra, metric):
+    """Warn when the record just saved is unusual for its provider"""
     try:
-        user_credentials = UserCredential(USERNAME, PASSWORD)
-        ctx = ClientContext(SITE_URL).with_credentials(user_credentials)
-        
-        # Create Excel file
-        excel_buffer = io.BytesIO()
-        with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-            credentials_df.to_excel(writer, sheet_name="proveedor_credencial", index=False)
-            reservas_df.to_excel(writer, sheet_name="proveedor_reservas", index=False)
-            gestion_df.to_excel(writer, sheet_name="proveedor_gestion", index=False)
-        
-        # Get the file info and upload
-        file = ctx.web.get_file_by_id(FILE_ID)
-        ctx.load(file)
-        ctx.execute_query()
-        
-        file_name = file.properties['Name']
-        server_relative_url = file.properties['ServerRelativeUrl']
-        folder_url = server_relative_url.replace('/' + file_name, '')
-        
-        folder = ctx.web.get_folder_by_server_relative_url(folder_url)
-        excel_buffer.seek(0)
-        folder.files.add(file_name, excel_buffer.getvalue(), True)
-        ctx.execute_query()
-        
-        # Clear cache
-        download_excel_to_memory.clear()
+        flags = get_store().anomaly_engine().flags()
+    except Exception:
+        return
+    flags = flags[(flags['Orden_de_compra'] == orden_compra) & (flags['Métrica'] == metric)]
+    for flag in flags.to_dict('records'):
+        st.warning(
+            f"🚨 {ANOMALY_METRIC_LABELS[metric]} atípico para {flag['Proveedor']}: "
+            f"{flag['Valor']:.0f} min (habitual {flag['Esperado']:.0f} min)"
+        )
+
+def import_reservations(batch_df, slot_capacity):
+    """Upsert a batch of bookings into the reservas sheet and upload it at once
+    
+    The plan is recomputed against the sheet as it is on SharePoint right
+    now. Returns the applied ReservationImport.
+    """
+    plans = []
+    
+    def change(reservas_df):
+        plans.append(plan_import(batch_df, reservas_df, slot_capacity))
+        return plans[-1].apply(reservas_df)
+    
+    get_store().update_reservas(change)
+    return plans[-1]
+
+def select_order(orders, order_index, key):
+    """Order picker with type-ahead search (order number or provider)
+
+    Only the top matches are sent to the browser; a scanned barcode selects
+    its order directly. Returns the selected order or None.
+    """
+    # The search of the last saved order is cleared for the next scan
+    if st.session_state.pop(f"order_search_{key}_saved", False):
+        st.session_state[f"order_search_{key}"] = ""
+    query = st.text_input(
+        "Buscar orden:",
+        key=f"order_search_{key}",
+        placeholder="Escanee o escriba la orden o el proveedor"
+    )
+    matches, total = order_index.search(query, allowed=orders)
+    if not matches:
+        st.warning("Ninguna orden coincide con la búsqueda.")
+        return None
+    
+    selected = st.selectbox(
+        "Orden de Compra:",
+        options=matches,
+        format_func=order_index.label,
+        key=f"order_select_{key}"
+    )
+    if total > len(matches):
+        st.caption(f"Mostrando {len(matches)} de {total} coincidencias. Escriba más para acotar.")
+    return selected
+
+def show_timing_report(data_ready):
+    """Show how long this rerun spent on imports, data and first paint"""
+    first_paint = time.perf_counter()
+    st.caption(
+        f"⏱️ Imports: {(IMPORTS_DONE - SCRIPT_START) * 1000:.0f} ms · "
+        f"Datos listos: {(data_ready - SCRIPT_START) * 1000:.0f} ms · "
+        f"Primer render: {(first_paint - SCRIPT_START) * 1000:.0f} ms"
+    )
+
+def is_profiler_enabled():
+    """True when the URL carries the admin profiling token"""
+    token = st.query_params.get("perfil")
+    return bool(PROFILER_TOKEN and token) and hmac.compare_digest(str(token), str(PROFILER_TOKEN))
+
+def show_profile_report(profiler):
+    """Hotspots of this rerun and memory of the cached snapshots (admin only)"""
+    st.markdown("---")
+    with st.expander("🔬 Perfil de esta ejecución", expanded=True):
+        sort = st.radio(
+            "Ordenar por:", ["Tiempo acumulado", "Tiempo propio"], horizontal=True, key="profile_sort"
+        )
+        st.dataframe(
+            hotspots(profiler, sort='self' if sort == "Tiempo propio" else 'cumulative'),
+            hide_index=True,
+            use_container_width=True
+        )
+        st.download_button(
+            "⬇️ Descargar perfil (.prof)",
+            data=profile_bytes(profiler),
+            file_name=f"perfil_{datetime.now():%Y%m%d_%H%M%S}.prof",
+            mime="application/octet-stream"
+        )
+        st.caption("Abrir con `python -m pstats perfil.prof` o snakeviz.")
+    
+    with st.expander("🧠 Memoria de los snapshots"):
+        # Deep size of every warehouse's cached snapshot
+        reports = []
+        for warehouse, store in get_stores().items():
+            if store.hub.version:
+                credentials_df, reservas_df, gestion_df = store.hub.get()
+                report = memory_report({
+                    "proveedor_credencial": credentials_df,
+                    "proveedor_reservas": reservas_df,
+                    "proveedor_gestion": gestion_df,
+                })
+                reports.append(report.assign(Almacén=warehouse))
+        if reports:
+            st.dataframe(pd.concat(reports, ignore_index=True), hide_index=True, use_container_width=True)
         
-        return True
+        # Allocation tracing is process-wide and slows every session down
+        tracing = st.checkbox(
+            "Rastrear asignaciones (tracemalloc)", value=traced_memory_mb() is not None
+        )
+        if tracing:
+            start_memory_tracing()
+        else:
+            stop_memory_tracing()
+            st.session_state.pop('memory_snapshot', None)
+            return
         
-    except Exception as e:
-        st.error(f"Error subiendo archivo: {str(e)}")
-        return False
+        current_mb, peak_mb = traced_memory_mb()
+        st.caption(
+            f"Memoria rastreada: {current_mb:.1f} MB (pico {peak_mb:.1f} MB). Solo se ven las "
+            "asignaciones hechas después de activar el rastreo: pulse «Actualizar Excel» para medir el snapshot."
+        )
+        if st.button("📸 Tomar instantánea", key="memory_snapshot_button"):
+            previous = st.session_state.get('memory_snapshot')
+            snapshot = take_memory_snapshot()
+            st.session_state['memory_snapshot'] = snapshot
+            st.dataframe(memory_top(snapshot, previous), hide_index=True, use_container_width=True)
+            if previous is not None:
+                st.caption("Crecimiento desde la instantánea anterior.")
 
 # ─────────────────────────────────────────────────────────────
 # 6. Main App
@@ -732,11 +975,22 @@ def main():
     
     # Manual refresh button - rightmost position
     col1, col2 = st.columns([4, 1])
+    
+    # One server process serves every dock: pick the one this terminal registers for
+    if len(WAREHOUSES) > 1:
+        with col1:
+            st.selectbox("Almacén:", options=list(WAREHOUSES), key="warehouse")
+    
+    # Versions shown in this run (the dashboard may add other warehouses)
+    st.session_state['snapshot_versions'] = {}
+    
     with col2:
         if st.button("🔄 Actualizar Excel", help="Descargar datos frescos desde SharePoint"):
-            download_excel_to_memory.clear()
-            st.success("✅ Datos actualizados!")
-            st.rerun()
+            # One download for everyone; sessions rerun when the new version lands
+            if get_snapshot_hub().request_refresh(min_interval=MANUAL_REFRESH_DEBOUNCE_SECONDS):
+                st.success("🔄 Actualizando datos...")
+            else:
+                st.info("⏳ Los datos ya se están actualizando o se actualizaron hace poco.")
     
     st.markdown("---")
     
@@ -748,8 +1002,32 @@ def main():
         st.error("No se pudo cargar los datos. Verifique la conexión.")
         return
     
+    # Registrations saved locally but not yet in SharePoint
+    pending_sync = get_journal().pending_count()
+    if pending_sync:
+        reconciler = get_reconciler()
+        detail = f" (último error: {reconciler.last_error})" if reconciler.last_error else ""
+        st.caption(f"📝 {pending_sync} registro(s) guardado(s) localmente, pendiente(s) de sincronizar con SharePoint{detail}")
+    
+    # A failed background refresh keeps the previous snapshot in use
+    if get_snapshot_hub().last_error is not None:
+        st.warning(f"⚠️ Mostrando datos anteriores, no se pudo actualizar: {get_snapshot_hub().last_error}")
+    
+    # Pick up arrivals/services saved from other terminals
+    watch_snapshot_version()
+    
+    # Live dock occupancy, refreshed on its own without rerunning the page
+    show_dock_occupancy()
+    
+    data_ready = time.perf_counter()
+    
     # Create tabs with enhanced styling - MOVED HERE
-    tab1, tab2, tab3 = st.tabs(["🚚 REGISTRO DE LLEGADA", "⚙️ REGISTRO DE ATENCIÓN", "📊 DASHBOARD"])
+    tab1, tab2, tab3, tab4 = st.tabs(["🚚 REGISTRO DE LLEGADA", "⚙️ REGISTRO DE ATENCIÓN", "📊 DASHBOARD", "📜 HISTORIAL"])
+    
+    # Load timing report, shown with ?tiempos=1 in the URL
+    if st.query_params.get("tiempos"):
+        with col1:
+            show_timing_report(data_ready)
     
     # Visual separator
     st.markdown('<div class="tab-separator"></div>', unsafe_allow_html=True)
@@ -765,6 +1043,7 @@ def main():
         existing_arrivals = get_existing_arrivals(gestion_df)
         completed_orders = get_completed_orders(gestion_df)
         pending_arrivals = get_pending_arrivals(today_reservations, gestion_df)
+        order_index = get_order_index(today_reservations)
     else:
         existing_arrivals = []
         completed_orders = []
@@ -787,11 +1066,7 @@ def main():
                     st.info("✅ Todas las llegadas del día han sido registradas")
                     selected_order_tab1 = None
                 else:
-                    selected_order_tab1 = st.selectbox(
-                        "Orden de Compra:",
-                        options=pending_arrivals,  # Already sorted in get_pending_arrivals
-                        key="order_select_tab1"
-                    )
+                    selected_order_tab1 = select_order(pending_arrivals, order_index, "tab1")
                 
                 if selected_order_tab1:
                     # Get order details
@@ -895,90 +1170,167 @@ def main():
             if selected_order_tab1:
                 if st.button("Guardar Llegada", type="primary", key="save_arrival"):
                     if arrival_time:
-                        # Get order details for delay calculation
-                        order_details = today_reservations[
-                            today_reservations['Orden_de_compra'] == selected_order_tab1
-                        ].iloc[0]
-                        
-                        arrival_datetime = combine_date_time(datetime.now().date(), arrival_time)
-                        
-                        # Calculate delay and extract reservation hour
-                        tiempo_retraso = 0  # Default to 0 if can't calculate
-                        hora_de_reserva = None
-                        
-                        # Get the actual time value from Excel
-                        hora_str = str(order_details['Hora']).strip()
-                        
-                        # Try parsing as single time first (new format), then as range (old format)
-                        booked_start_time = parse_single_time(hora_str)
-                        if not booked_start_time:
-                            booked_start_time = parse_time_range(hora_str)
-                        
-                        if booked_start_time:
-                            booked_datetime = combine_date_time(datetime.now().date(), booked_start_time)
-                            calculated_delay = calculate_time_difference(booked_datetime, arrival_datetime)
-                            if calculated_delay is not None:
-                                tiempo_retraso = calculated_delay
-                            # Extract hour for hora_de_reserva (e.g., 10 for "10:00:00")
-                            hora_de_reserva = booked_start_time.hour
+                        try:
+                            registration = arrival_registration(
+                                today_reservations, selected_order_tab1,
+                                combine_date_time(datetime.now().date(), arrival_time),
+                                terminal=get_terminal_id()
+                            )
+                        except ValueError as e:
+                            st.error(str(e))
                         else:
-                            # Fallback: manual calculation for formats like "10:00:00"
-                            try:
-                                if ':' in hora_str:
-                                    time_parts = hora_str.split(':')
-                                    booked_hour = int(time_parts[0])
-                                    booked_minute = int(time_parts[1]) if len(time_parts) > 1 else 0
-                                    booked_second = int(time_parts[2]) if len(time_parts) > 2 else 0
-                                    
-                                    # Create booked datetime manually
-                                    booked_datetime = datetime.combine(
-                                        datetime.now().date(), 
-                                        dt_time(booked_hour, booked_minute, booked_second)
-                                    )
+                            tiempo_retraso = registration[2]['Tiempo_retraso']
+                            
+                            # Save to Excel
+                            with st.spinner("Guardando llegada..."):
+                                if save_arrival_to_excel(registration):
+                                    st.session_state["order_search_tab1_saved"] = True
+                                    st.success("✅ Llegada registrada exitosamente!")
+                                    show_anomaly_warning(selected_order_tab1, 'Tiempo_retraso')
+                                    if tiempo_retraso > 0:
+                                        st.warning(f"⏰ Retraso: {tiempo_retraso} minutos")
+                                    elif tiempo_retraso < 0:
+                                        st.info(f"⚡ Adelanto: {abs(tiempo_retraso)} minutos")
+                                    else:
+                                        st.success("🎯 Llegada puntual")
                                     
-                                    # Calculate delay manually
-                                    tiempo_retraso = calculate_time_difference(booked_datetime, arrival_datetime)
-                                    hora_de_reserva = booked_hour
-                            except Exception:
-                                # If all else fails, set to defaults
-                                hora_de_reserva = None
-                                tiempo_retraso = 0
-                        
-                        # Prepare arrival data
-                        arrival_data = {
-                            'Orden_de_compra': selected_order_tab1,
-                            'Proveedor': order_details['Proveedor'],
-                            'Numero_de_bultos': order_details['Numero_de_bultos'],
-                            'Hora_llegada': arrival_datetime.strftime('%Y-%m-%d %H:%M:%S'),
-                            'Hora_inicio_atencion': None,
-                            'Hora_fin_atencion': None,
-                            'Tiempo_espera': None,
-                            'Tiempo_atencion': None,
-                            'Tiempo_total': None,
-                            'Tiempo_retraso': tiempo_retraso,
-                            'numero_de_semana': arrival_datetime.isocalendar()[1],
-                            'hora_de_reserva': hora_de_reserva
-                        }
-                        
-                        # Save to Excel
-                        with st.spinner("Guardando llegada..."):
-                            if save_arrival_to_excel(arrival_data):
-                                st.success("✅ Llegada registrada exitosamente!")
-                                if tiempo_retraso > 0:
-                                    st.warning(f"⏰ Retraso: {tiempo_retraso} minutos")
-                                elif tiempo_retraso < 0:
-                                    st.info(f"⚡ Adelanto: {abs(tiempo_retraso)} minutos")
+                                    # Wait 5 seconds before refreshing
+                                    with st.spinner("Actualizando datos..."):
+                                        time.sleep(5)
+                                    st.rerun()
                                 else:
-                                    st.success("🎯 Llegada puntual")
-                                
-                                # Wait 5 seconds before refreshing
-                                with st.spinner("Actualizando datos..."):
-                                    time.sleep(5)
-                                st.rerun()
-                            else:
-                                st.error("Error al guardar la llegada. Intente nuevamente.")
+                                    st.error("Error al guardar la llegada. Intente nuevamente.")
                     else:
                         st.error("Por favor complete todos los campos.")
+            
+            # Expected congestion for the rest of the day
+            with st.expander("🔮 Pronóstico de cola de hoy"):
+                bays = st.number_input(
+                    "Andenes disponibles:",
+                    min_value=1,
+                    max_value=50,
+                    value=DOCK_BAYS,
+                    step=1,
+                    key="forecast_bays"
+                )
+                forecast = get_dock_forecast(today_reservations, gestion_df, int(bays))
+                if forecast.empty:
+                    st.info("No hay historial suficiente para pronosticar la cola de hoy.")
+                else:
+                    fig_forecast = create_forecast_chart(forecast)
+                    if fig_forecast:
+                        st.plotly_chart(fig_forecast, use_container_width=True)
+                    st.dataframe(forecast, hide_index=True, use_container_width=True)
+                    st.caption("Simulación Monte Carlo con los tiempos históricos de cada proveedor; las llegadas ya registradas usan su hora real.")
+        
+        # Rebooking proposals for the coming days
+        with st.expander("🗓️ Optimizar reservas próximas"):
+            upcoming = get_upcoming_reservations(reservas_df, 7)
+            if upcoming.empty:
+                st.info("No hay reservas para los próximos 7 días.")
+            else:
+                booked_hours = sorted({int(h) // 60 for h in slot_minutes(upcoming['Hora']) if h == h})
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    plan_bays = st.number_input(
+                        "Andenes disponibles:",
+                        min_value=1,
+                        max_value=50,
+                        value=DOCK_BAYS,
+                        step=1,
+                        key="plan_bays"
+                    )
+                with col2:
+                    max_shift = st.selectbox(
+                        "Desplazamiento máximo (horas):",
+                        options=[1, 2, 3, 4],
+                        index=1,
+                        key="plan_max_shift"
+                    )
+                with col3:
+                    allowed_hours = st.multiselect(
+                        "Horas permitidas:",
+                        options=list(range(24)),
+                        default=booked_hours,
+                        format_func=lambda h: f"{h:02d}:00",
+                        key="plan_allowed_hours"
+                    )
+                
+                if st.button("Calcular propuesta", key="plan_button"):
+                    with st.spinner("Simulando alternativas..."):
+                        st.session_state['slot_plan'] = optimize_slots(
+                            upcoming, get_service_time_model(gestion_df), int(plan_bays),
+                            max_shift_hours=max_shift, allowed_hours=allowed_hours
+                        )
+                
+                if 'slot_plan' in st.session_state:
+                    proposals, plan_summary = st.session_state['slot_plan']
+                    if plan_summary.empty:
+                        st.info("No hay historial suficiente para evaluar las reservas.")
+                    else:
+                        st.dataframe(plan_summary, hide_index=True, use_container_width=True)
+                        if proposals.empty:
+                            st.success("✅ Las reservas ya están bien repartidas.")
+                        else:
+                            st.dataframe(proposals, hide_index=True, use_container_width=True)
+    
+        # Bulk upsert of bookings from a CSV/xlsx file
+        with st.expander("📥 Importar reservas"):
+            st.caption(
+                "Archivo CSV o Excel con las columnas Orden_de_compra, Proveedor, Numero_de_bultos, "
+                "Fecha y Hora. Las órdenes que ya existen se actualizan; las filas sin cambios se ignoran."
+            )
+            uploaded_reservas = st.file_uploader(
+                "Archivo de reservas:", type=["csv", "xlsx"], key="reservas_import_file"
+            )
+            slot_capacity = st.number_input(
+                "Reservas máximas por hora (0 = sin límite):",
+                min_value=0,
+                max_value=500,
+                value=SLOT_CAPACITY,
+                step=1,
+                key="reservas_import_capacity"
+            )
+            
+            if uploaded_reservas is not None:
+                # Preview against the snapshot, computed once per file and capacity
+                preview_key = (uploaded_reservas.file_id, int(slot_capacity), get_view_version(get_current_warehouse()))
+                preview = st.session_state.get('reservas_import_preview')
+                if preview is None or preview[0] != preview_key:
+                    try:
+                        batch_df = read_reservations_batch(
+                            io.BytesIO(uploaded_reservas.getvalue()), uploaded_reservas.name
+                        )
+                        preview = (preview_key, batch_df, plan_import(batch_df, reservas_df, int(slot_capacity)))
+                    except ValueError as e:
+                        preview = (preview_key, None, e)
+                    st.session_state['reservas_import_preview'] = preview
+                
+                _, batch_df, import_plan = preview
+                if batch_df is None:
+                    st.error(str(import_plan))
+                else:
+                    st.dataframe(pd.DataFrame([import_plan.summary()]), hide_index=True, use_container_width=True)
+                    if not import_plan.rejected.empty:
+                        st.markdown("**Filas rechazadas:**")
+                        st.dataframe(import_plan.rejected, hide_index=True, use_container_width=True)
+                    
+                    if not import_plan.changed:
+                        st.info("No hay reservas nuevas ni modificadas en el archivo.")
+                    elif st.button(
+                        f"Importar {import_plan.changed} reserva(s)", type="primary", key="reservas_import_button"
+                    ):
+                        with st.spinner("Importando reservas..."):
+                            try:
+                                applied = import_reservations(batch_df, int(slot_capacity))
+                            except Exception as e:
+                                st.error(f"Error importando reservas: {str(e)}")
+                            else:
+                                summary = applied.summary()
+                                st.success(
+                                    f"✅ Reservas importadas: {summary['Nuevas']} nuevas, "
+                                    f"{summary['Modificadas']} modificadas."
+                                )
     
     # ─────────────────────────────────────────────────────────────
     # TAB 2: Service Registration
@@ -990,12 +1342,15 @@ def main():
             st.warning("No hay reservas programadas para hoy.")
         else:
             # Order selection
-            selected_order_tab2 = st.selectbox(
-                "Orden de Compra:",
-                options=existing_arrivals if existing_arrivals else ["No hay llegadas registradas"],  # Already sorted in get_existing_arrivals
-                disabled=not existing_arrivals,
-                key="order_select_tab2"
-            )
+            if existing_arrivals:
+                selected_order_tab2 = select_order(existing_arrivals, order_index, "tab2")
+            else:
+                selected_order_tab2 = st.selectbox(
+                    "Orden de Compra:",
+                    options=["No hay llegadas registradas"],
+                    disabled=True,
+                    key="order_select_tab2"
+                )
             
             if existing_arrivals and selected_order_tab2:
                 # Get arrival record
@@ -1105,100 +1460,49 @@ def main():
                         if st.button("Guardar Atención", type="primary", key="save_service"):
                             if start_time and end_time:
                                 today_date = datetime.now().date()
-                                hora_inicio = combine_date_time(today_date, start_time)
-                                hora_fin = combine_date_time(today_date, end_time)
-                                
-                                # Parse arrival time
-                                arrival_datetime = datetime.fromisoformat(str(arrival_record['Hora_llegada']))
-                                
-                                # Validate times
-                                if hora_inicio >= hora_fin:
-                                    st.error("La hora de fin debe ser posterior a la hora de inicio.")
-                                elif hora_inicio < arrival_datetime:
-                                    st.error("La hora de inicio de atención no puede ser anterior a la hora de llegada.")
-                                else:
-                                    # Calculate times
-                                    tiempo_espera = calculate_time_difference(arrival_datetime, hora_inicio)
-                                    tiempo_atencion = calculate_time_difference(hora_inicio, hora_fin)
-                                    tiempo_total = calculate_time_difference(arrival_datetime, hora_fin)
-                                    
-                                    # Prepare service data
-                                    service_data = {
-                                        'Hora_inicio_atencion': hora_inicio.strftime('%Y-%m-%d %H:%M:%S'),
-                                        'Hora_fin_atencion': hora_fin.strftime('%Y-%m-%d %H:%M:%S'),
-                                        'Tiempo_espera': tiempo_espera,
-                                        'Tiempo_atencion': tiempo_atencion,
-                                        'Tiempo_total': tiempo_total
-                                    }
-                                    
-                                    # Save to Excel
-                                    with st.spinner("Guardando atención..."):
-                                        if update_service_times(selected_order_tab2, service_data):
-                                            st.success("✅ Atención registrada exitosamente!")
-                                            
-                                            # Calculate delay for summary (recalculate to ensure accuracy)
-                                            arrival_datetime = datetime.fromisoformat(str(arrival_record['Hora_llegada']))
-                                            
-                                            # Get the booked time from reservas_df
-                                            order_reserva = today_reservations[
-                                                today_reservations['Orden_de_compra'] == selected_order_tab2
-                                            ]
-                                            
-                                            tiempo_retraso_display = 0  # Default to 0 if can't calculate
-                                            if not order_reserva.empty:
-                                                booked_time_range = str(order_reserva.iloc[0]['Hora'])
-                                                # Try parsing as single time first (new format), then as range (old format)
-                                                booked_start_time = parse_single_time(booked_time_range)
-                                                if not booked_start_time:
-                                                    booked_start_time = parse_time_range(booked_time_range)
-                                                
-                                                if booked_start_time:
-                                                    booked_datetime = combine_date_time(arrival_datetime.date(), booked_start_time)
-                                                    calculated_delay = calculate_time_difference(booked_datetime, arrival_datetime)
-                                                    if calculated_delay is not None:
-                                                        tiempo_retraso_display = calculated_delay
-                                                else:
-                                                    # Fallback: manual calculation for formats like "10:00:00"
-                                                    try:
-                                                        if ':' in booked_time_range:
-                                                            time_parts = booked_time_range.split(':')
-                                                            booked_hour = int(time_parts[0])
-                                                            booked_minute = int(time_parts[1]) if len(time_parts) > 1 else 0
-                                                            booked_second = int(time_parts[2]) if len(time_parts) > 2 else 0
-                                                            
-                                                            # Create booked datetime manually
-                                                            booked_datetime = datetime.combine(
-                                                                arrival_datetime.date(), 
-                                                                dt_time(booked_hour, booked_minute, booked_second)
-                                                            )
-                                                            
-                                                            # Calculate delay manually
-                                                            tiempo_retraso_display = calculate_time_difference(booked_datetime, arrival_datetime)
-                                                    except Exception:
-                                                        # Keep default value of 0
-                                                        pass
-                                            
-                                            # Show summary
-                                            col1, col2 = st.columns(2)
-                                            with col1:
-                                                st.metric("Tiempo de Espera", f"{tiempo_espera} min")
-                                                st.metric("Tiempo de Atención", f"{tiempo_atencion} min")
-                                            with col2:
-                                                st.metric("Tiempo Total", f"{tiempo_total} min")
-                                                # Display calculated delay
-                                                if tiempo_retraso_display > 0:
-                                                    st.metric("Tiempo de Retraso", f"{tiempo_retraso_display} min")
-                                                elif tiempo_retraso_display < 0:
-                                                    st.metric("Tiempo de Adelanto", f"{abs(tiempo_retraso_display)} min")
-                                                else:
-                                                    st.metric("Tiempo de Retraso", f"{tiempo_retraso_display} min")
-                                            
-                                            # Wait 5 seconds before refreshing
-                                            with st.spinner("Actualizando datos..."):
-                                                time.sleep(10)
-                                            st.rerun()
-                                        else:
-                                            st.error("Error al guardar la atención. Intente nuevamente.")
+                                registration = service_registration(
+                                    selected_order_tab2,
+                                    combine_date_time(today_date, start_time),
+                                    combine_date_time(today_date, end_time),
+                                    terminal=get_terminal_id()
+                                )
+                                # Save to Excel
+                                with st.spinner("Guardando atención..."):
+                                    if update_service_times(registration):
+                                        service_data = registration[2]
+                                        st.session_state["order_search_tab2_saved"] = True
+                                        st.success("✅ Atención registrada exitosamente!")
+                                        show_anomaly_warning(selected_order_tab2, 'Tiempo_atencion')
+                                        
+                                        # Delay of the arrival, derived as when it was registered
+                                        try:
+                                            tiempo_retraso_display = build_arrival_data(
+                                                today_reservations, selected_order_tab2, arrival_record['Hora_llegada']
+                                            )['Tiempo_retraso']
+                                        except ValueError:
+                                            tiempo_retraso_display = 0
+                                        
+                                        # Show summary
+                                        col1, col2 = st.columns(2)
+                                        with col1:
+                                            st.metric("Tiempo de Espera", f"{service_data['Tiempo_espera']} min")
+                                            st.metric("Tiempo de Atención", f"{service_data['Tiempo_atencion']} min")
+                                        with col2:
+                                            st.metric("Tiempo Total", f"{service_data['Tiempo_total']} min")
+                                            # Display calculated delay
+                                            if tiempo_retraso_display > 0:
+                                                st.metric("Tiempo de Retraso", f"{tiempo_retraso_display} min")
+                                            elif tiempo_retraso_display < 0:
+                                                st.metric("Tiempo de Adelanto", f"{abs(tiempo_retraso_display)} min")
+                                            else:
+                                                st.metric("Tiempo de Retraso", f"{tiempo_retraso_display} min")
+                                        
+                                        # Wait 5 seconds before refreshing
+                                        with st.spinner("Actualizando datos..."):
+                                            time.sleep(10)
+                                        st.rerun()
+                                    else:
+                                        st.error("Error al guardar la atención. Intente nuevamente.")
                             else:
                                 st.error("Por favor complete todos los campos de tiempo.")
             else:
@@ -1207,12 +1511,86 @@ def main():
                     unsafe_allow_html=True
                 )
     
+    # ─────────────────────────────────────────────────────────────
+    # TAB 4: History browser (before the dashboard, which returns early without data)
+    # ─────────────────────────────────────────────────────────────
+    with tab4:
+        st.markdown("*Consulte los registros anteriores; solo se envía al navegador la página visible*")
+        
+        history = get_history_index(gestion_df)
+        history_bounds = history.bounds()
+        if history_bounds is None:
+            st.info("No hay registros para mostrar.")
+        else:
+            col1, col2, col3, col4 = st.columns([2, 2, 2, 1])
+            with col1:
+                first_day, last_day = history_bounds
+                history_range = st.date_input(
+                    "Desde / hasta:",
+                    value=(max(first_day, last_day - timedelta(days=29)), last_day),
+                    key="history_date_range"
+                )
+            with col2:
+                history_provider = st.selectbox(
+                    "Proveedor:", options=["Todos"] + history.providers(), key="history_provider"
+                )
+            with col3:
+                history_status = st.selectbox(
+                    "Estado:", options=["Todos"] + list(STATUSES), key="history_status"
+                )
+            with col4:
+                page_size = st.selectbox("Filas:", options=HISTORY_PAGE_SIZES, index=1, key="history_page_size")
+            
+            if len(history_range) == 2:
+                start_date, end_date = history_range
+            else:
+                # A range still being picked has only its first date
+                start_date = end_date = history_range[0]
+            
+            # Back to the first page whenever the filter changes
+            history_filter = (start_date, end_date, history_provider, history_status, page_size)
+            if st.session_state.get('history_filter') != history_filter:
+                st.session_state['history_filter'] = history_filter
+                st.session_state['history_page'] = 1
+            
+            total = history.count(start_date, end_date, history_provider, history_status)
+            page_count = max((total + page_size - 1) // page_size, 1)
+            st.session_state['history_page'] = min(st.session_state.get('history_page', 1), page_count)
+            
+            page_number = st.number_input(
+                f"Página (de {page_count}):", min_value=1, max_value=page_count, step=1, key="history_page"
+            )
+            _, page_rows = history.page(
+                start_date, end_date, history_provider, history_status,
+                page=int(page_number) - 1, page_size=page_size
+            )
+            
+            first_row = (int(page_number) - 1) * page_size
+            st.caption(f"Registros {min(first_row + 1, total)}–{first_row + len(page_rows)} de {total}, más recientes primero")
+            st.dataframe(page_rows, hide_index=True, use_container_width=True)
+    
     # ─────────────────────────────────────────────────────────────
     # TAB 3: Dashboard
     # ─────────────────────────────────────────────────────────────
     with tab3:
         st.markdown("*Análisis y tendencias de rendimiento de proveedores*")
         
+        # Dashboard of another warehouse, or of all of them together
+        dashboard_scope = get_current_warehouse()
+        if len(WAREHOUSES) > 1:
+            scopes = list(WAREHOUSES) + [ALL_WAREHOUSES]
+            dashboard_scope = st.selectbox(
+                "Almacén del dashboard:",
+                options=scopes,
+                index=scopes.index(get_current_warehouse()),
+                key="dashboard_warehouse"
+            )
+            if dashboard_scope != get_current_warehouse():
+                with st.spinner("Cargando almacenes..."):
+                    gestion_df, load_errors = get_warehouse_gestion(dashboard_scope)
+                for name, error in load_errors.items():
+                    st.warning(f"⚠️ No se pudieron cargar los datos de {name}: {error}")
+        
         # Check if we have data
         if gestion_df.empty:
             st.warning("📊 No hay datos disponibles para mostrar gráficos.")
@@ -1233,71 +1611,256 @@ def main():
             )
         
         with col2:
-            # Week range filter
-            week_options = {
-                "1 semana": 1,
-                "2 semanas": 2, 
-                "4 semanas": 4,
-                "12 semanas": 12,
-                "24 semanas": 24
-            }
-            selected_weeks_label = st.selectbox(
-                "Período (semanas completas):",
-                options=list(week_options.keys()),
-                key="dashboard_weeks"
+            period_mode = st.radio(
+                "Período:",
+                options=["Semanas completas", "Rango de fechas"],
+                horizontal=True,
+                key="dashboard_period_mode"
             )
-            selected_weeks = week_options[selected_weeks_label]
+            
+            if period_mode == "Semanas completas":
+                # Week range filter
+                week_options = {
+                    "1 semana": 1,
+                    "2 semanas": 2, 
+                    "4 semanas": 4,
+                    "12 semanas": 12,
+                    "24 semanas": 24
+                }
+                selected_weeks_label = st.selectbox(
+                    "Período (semanas completas):",
+                    options=list(week_options.keys()),
+                    key="dashboard_weeks"
+                )
+                selected_weeks = week_options[selected_weeks_label]
+            else:
+                # Arbitrary range answered from the prefix-sum index
+                daily_index = get_daily_index(gestion_df, dashboard_scope)
+                first_day, last_day = daily_index.bounds() or (datetime.now().date(),) * 2
+                date_range = st.date_input(
+                    "Desde / hasta:",
+                    value=(max(first_day, last_day - timedelta(days=27)), last_day),
+                    key="dashboard_date_range"
+                )
+                granularity = st.radio(
+                    "Agrupar por:",
+                    options=["Día", "Semana"],
+                    horizontal=True,
+                    key="dashboard_granularity"
+                )
         
         st.markdown("---")
         
-        # Get filtered data
-        filtered_data = get_completed_weeks_data(gestion_df, selected_weeks)
-        
-        # Debug info - you can remove this later
-        current_week = get_current_week()
-        target_weeks = [current_week - i for i in range(1, selected_weeks + 1)]
-        st.caption(f"Debug: Semana actual: {current_week}, Semanas objetivo: {target_weeks}, Registros encontrados: {len(filtered_data)}")
-        
-        if filtered_data.empty:
-            st.warning(f"📊 No hay datos completos para las últimas {selected_weeks} semanas.")
-            return
+        if period_mode == "Semanas completas":
+            # Get filtered data
+            filtered_data = get_completed_weeks_data(gestion_df, selected_weeks)
+            
+            # Debug info - you can remove this later
+            current_week = get_current_week()
+            target_weeks = [current_week - i for i in range(1, selected_weeks + 1)]
+            st.caption(f"Debug: Semana actual: {current_week}, Semanas objetivo: {target_weeks}, Registros encontrados: {len(filtered_data)}")
+            
+            if filtered_data.empty:
+                st.warning(f"📊 No hay datos completos para las últimas {selected_weeks} semanas.")
+                return
+            
+            # Filter by provider for stats
+            stats_data = filtered_data.copy()
+            if selected_provider != "Todos":
+                stats_data = stats_data[stats_data['Proveedor'] == selected_provider]
+            period_stats = None if stats_data.empty else {
+                metric: stats_data[metric].mean()
+                for metric in ['Tiempo_espera', 'Tiempo_atencion', 'Tiempo_total', 'Tiempo_retraso']
+            }
+            
+            weekly_data = aggregate_by_week(filtered_data, selected_provider)
+            hourly_data = aggregate_by_hour_from_filtered(filtered_data, selected_provider)
+            x_column, x_title, period_label = 'numero_de_semana', 'Número de Semana', "Semana"
+        else:
+            # While picking the range the widget holds only the start date
+            if len(date_range) != 2:
+                st.info("Selecciona la fecha final del rango.")
+                return
+            start_date, end_date = date_range
+            
+            all_stats = daily_index.summary(start_date, end_date)
+            st.caption(f"Registros encontrados: {all_stats['registros'] if all_stats else 0}")
+            
+            if all_stats is None:
+                st.warning(f"📊 No hay datos completos entre {start_date:%d/%m/%Y} y {end_date:%d/%m/%Y}.")
+                return
+            
+            period_stats = daily_index.summary(start_date, end_date, selected_provider)
+            
+            if granularity == "Día":
+                weekly_data = daily_index.series(start_date, end_date, selected_provider, granularity='day')
+                x_column, x_title, period_label = 'fecha', 'Fecha', "Día"
+            else:
+                weekly_data = daily_index.series(start_date, end_date, selected_provider, granularity='week')
+                x_column, x_title, period_label = 'numero_de_semana', 'Número de Semana', "Semana"
+            hourly_data = daily_index.by_hour(start_date, end_date, selected_provider)
         
         # Summary stats - MOVED TO BEGINNING
         st.subheader("📊 Estadísticas del Período")
         
-        # Filter by provider for stats
-        stats_data = filtered_data.copy()
-        if selected_provider != "Todos":
-            stats_data = stats_data[stats_data['Proveedor'] == selected_provider]
-        
-        if not stats_data.empty:
+        if period_stats is not None:
             col1, col2, col3, col4 = st.columns(4)
             
             with col1:
-                avg_wait = stats_data['Tiempo_espera'].mean()
+                avg_wait = period_stats['Tiempo_espera']
                 st.metric("Espera Promedio", f"{avg_wait:.1f} min")
             
             with col2:
-                avg_service = stats_data['Tiempo_atencion'].mean()
+                avg_service = period_stats['Tiempo_atencion']
                 st.metric("Atención Promedio", f"{avg_service:.1f} min")
             
             with col3:
-                avg_total = stats_data['Tiempo_total'].mean()
+                avg_total = period_stats['Tiempo_total']
                 st.metric("Total Promedio", f"{avg_total:.1f} min")
             
             with col4:
-                avg_delay = stats_data['Tiempo_retraso'].mean()
+                avg_delay = period_stats['Tiempo_retraso']
                 delay_color = "normal" if avg_delay <= 0 else "inverse"
                 st.metric("Retraso Promedio", f"{avg_delay:.1f} min")
         
         st.markdown("---")
         
+        # Percentiles: the long waits that the means hide
+        st.subheader("📐 Distribución de Tiempos (percentiles)")
+        sketches = get_quantile_sketches(gestion_df, dashboard_scope)
+        if period_mode == "Semanas completas":
+            period_start, period_end = get_completed_weeks_range(selected_weeks)
+        else:
+            period_start, period_end = start_date, end_date
+            st.caption("Los percentiles se calculan sobre las semanas completas que abarca el rango.")
+        
+        percentile_table = sketches.percentiles(period_start, period_end, selected_provider)
+        if not percentile_table.empty:
+            metric_labels = {
+                'Tiempo_espera': 'Tiempo de Espera',
+                'Tiempo_atencion': 'Tiempo de Atención',
+                'Tiempo_total': 'Tiempo Total',
+            }
+            st.dataframe(
+                percentile_table.rename(index=metric_labels),
+                use_container_width=True
+            )
+            
+            percentile_metric = st.selectbox(
+                "Métrica:",
+                options=DURATION_METRICS,
+                format_func=metric_labels.get,
+                key="dashboard_percentile_metric"
+            )
+            col1, col2 = st.columns(2)
+            with col1:
+                fig_weekly = create_percentile_chart(
+                    sketches.weekly_percentiles(period_start, period_end, selected_provider, percentile_metric),
+                    metric_labels[percentile_metric]
+                )
+                if fig_weekly:
+                    st.plotly_chart(fig_weekly, use_container_width=True)
+            with col2:
+                fig_hourly = create_percentile_chart(
+                    sketches.hourly_percentiles(period_start, period_end, selected_provider, percentile_metric),
+                    metric_labels[percentile_metric], 'hora_de_reserva', 'Hora de Reserva'
+                )
+                if fig_hourly:
+                    st.plotly_chart(fig_hourly, use_container_width=True)
+        else:
+            st.info("No hay datos para el proveedor seleccionado en el período especificado.")
+        
+        st.markdown("---")
+        
+        # Scorecard: every provider side by side for the same period
+        st.subheader("🏆 Scorecard de Proveedores")
+        scorecard = get_provider_scorecard(gestion_df, period_start, period_end, dashboard_scope)
+        if not scorecard.empty:
+            st.caption("Ordenado por puntualidad. Δ: cambio respecto al período anterior de la misma duración.")
+            st.dataframe(scorecard, hide_index=True, use_container_width=True)
+        else:
+            st.info("No hay datos de proveedores en el período especificado.")
+        
+        st.markdown("---")
+        
+        # Records far above their provider's rolling norm (EWMA z-score)
+        st.subheader("🚨 Anomalías por Proveedor")
+        anomalies = get_anomaly_flags(dashboard_scope)
+        arrival = pd.to_datetime(anomalies['Hora_llegada'])
+        anomalies = anomalies[
+            (arrival >= pd.Timestamp(period_start)) &
+            (arrival < pd.Timestamp(period_end) + pd.Timedelta(days=1))
+        ]
+        if selected_provider != "Todos":
+            anomalies = anomalies[anomalies['Proveedor'] == selected_provider]
+        if anomalies.empty:
+            st.success("✅ Sin registros atípicos en el período especificado.")
+        else:
+            st.caption(
+                f"Registros más de {ANOMALY_Z:.0f} desviaciones por encima de la media móvil "
+                "(exponencial) de su proveedor."
+            )
+            anomalies = anomalies.assign(**{'Métrica': anomalies['Métrica'].map(ANOMALY_METRIC_LABELS)})
+            group_columns = ['Almacen', 'Proveedor'] if dashboard_scope == ALL_WAREHOUSES else ['Proveedor']
+            col1, col2 = st.columns([1, 2])
+            with col1:
+                summary = (
+                    anomalies.groupby(group_columns + ['Métrica']).size()
+                    .unstack(fill_value=0).reset_index()
+                )
+                st.dataframe(summary, hide_index=True, use_container_width=True)
+            with col2:
+                detail_columns = FLAG_COLUMNS if dashboard_scope != ALL_WAREHOUSES else ['Almacen', *FLAG_COLUMNS]
+                st.dataframe(
+                    anomalies[detail_columns].round({'Esperado': 0, 'z': 1}),
+                    hide_index=True,
+                    use_container_width=True
+                )
+        
+        st.markdown("---")
+        
+        # Heatmap: any two axes of the provider × week × hour cube
+        st.subheader("🗺️ Mapa de Calor")
+        heatmap_views = {
+            "Proveedor × Hora de reserva": ("Proveedor", "Hora de reserva"),
+            "Proveedor × Semana": ("Proveedor", "Semana"),
+            "Semana × Hora de reserva": ("Semana", "Hora de reserva"),
+        }
+        heatmap_values = {
+            'Tiempo_espera': 'Tiempo de Espera',
+            'Tiempo_atencion': 'Tiempo de Atención',
+            'Tiempo_total': 'Tiempo Total',
+            'Tiempo_retraso': 'Tiempo de Retraso',
+            None: 'Registros',
+        }
+        col1, col2 = st.columns(2)
+        with col1:
+            heatmap_view = st.selectbox("Vista:", options=list(heatmap_views.keys()), key="dashboard_heatmap_view")
+        with col2:
+            heatmap_metric = st.selectbox(
+                "Valor:",
+                options=list(heatmap_values.keys()),
+                format_func=heatmap_values.get,
+                key="dashboard_heatmap_metric"
+            )
+        
+        rows, columns = heatmap_views[heatmap_view]
+        pivot_data = get_pivot_cube(gestion_df, dashboard_scope).view(
+            rows, columns, heatmap_metric, period_start, period_end, selected_provider
+        )
+        fig_heatmap = create_heatmap_chart(pivot_data, heatmap_values[heatmap_metric], columns, rows)
+        if fig_heatmap:
+            st.plotly_chart(fig_heatmap, use_container_width=True)
+        else:
+            st.info("No hay datos para el proveedor seleccionado en el período especificado.")
+        
+        st.markdown("---")
+        
         # Graph 1: Weekly Time Metrics
-        st.subheader("📈 Gráfico 1: Tiempos por Semana")
-        weekly_data = aggregate_by_week(filtered_data, selected_provider)
+        st.subheader(f"📈 Gráfico 1: Tiempos por {period_label}")
         
         if not weekly_data.empty:
-            fig1 = create_weekly_times_chart(weekly_data)
+            fig1 = create_weekly_times_chart(weekly_data, x_column, x_title)
             if fig1:
                 st.plotly_chart(fig1, use_container_width=True)
         else:
@@ -1306,10 +1869,10 @@ def main():
         st.markdown("---")
         
         # Graph 2: Weekly Delay Metrics  
-        st.subheader("⏰ Gráfico 2: Retrasos por Semana")
+        st.subheader(f"⏰ Gráfico 2: Retrasos por {period_label}")
         
         if not weekly_data.empty:
-            fig2 = create_weekly_delay_chart(weekly_data)
+            fig2 = create_weekly_delay_chart(weekly_data, x_column, x_title)
             if fig2:
                 st.plotly_chart(fig2, use_container_width=True)
         else:
@@ -1319,7 +1882,6 @@ def main():
         
         # Graph 3: Hourly Time Metrics
         st.subheader("🕐 Gráfico 3: Tiempos por Hora de Reserva")
-        hourly_data = aggregate_by_hour_from_filtered(filtered_data, selected_provider)
         
         if not hourly_data.empty:
             fig3 = create_hourly_times_chart(hourly_data)
@@ -1345,6 +1907,64 @@ def main():
                 st.info(f"No hay datos de horas de reserva para el proveedor {selected_provider} en el período especificado.")
             else:
                 st.info("No hay datos de horas de reserva para el período especificado.")
+        
+        st.markdown("---")
+        
+        # Download of the slice selected above (provider and period)
+        with st.expander("📤 Exportar datos filtrados"):
+            export_format = st.radio(
+                "Formato:",
+                options=available_export_formats(),
+                format_func=str.upper,
+                horizontal=True,
+                key="dashboard_export_format"
+            )
+            export_provider = None if selected_provider == "Todos" else selected_provider
+            positions = slice_positions(gestion_df, export_provider, period_start, period_end)
+            st.caption(f"{len(positions)} registro(s) del {period_start:%d/%m/%Y} al {period_end:%d/%m/%Y}")
+            
+            # Prepared once per filter and snapshot version, kept while they don't change
+            export_key = (
+                dashboard_scope, get_view_version(dashboard_scope),
+                export_provider, period_start, period_end, export_format
+            )
+            prepared = st.session_state.get('dashboard_export')
+            if prepared is not None and prepared[0] != export_key:
+                del st.session_state['dashboard_export']
+                prepared = None
+            
+            if prepared is None and st.button("Preparar archivo", key="dashboard_export_button"):
+                # Rows are copied out of the snapshot one chunk at a time
+                with st.spinner("Generando archivo..."):
+                    prepared = (export_key, b''.join(iter_export(gestion_df, positions, export_format)))
+                st.session_state['dashboard_export'] = prepared
+            
+            if prepared is not None:
+                provider_slug = (export_provider or "todos").replace(" ", "_")
+                st.download_button(
+                    "⬇️ Descargar",
+                    data=prepared[1],
+                    file_name=f"gestion_{provider_slug}_{period_start:%Y%m%d}_{period_end:%Y%m%d}.{export_format}",
+                    mime=EXPORT_MIME_TYPES[export_format],
+                    key="dashboard_export_download"
+                )
+        
+        # Memory used by the shared snapshot
+        with st.expander("💾 Uso de memoria del snapshot"):
+            if st.checkbox("Calcular uso de memoria", key="dashboard_memory_report"):
+                st.dataframe(
+                    memory_report({
+                        "proveedor_credencial": credentials_df,
+                        "proveedor_reservas": reservas_df,
+                        "proveedor_gestion": gestion_df,
+                    }),
+                    hide_index=True,
+                    use_container_width=True
+                )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if is_profiler_enabled():
+        _, rerun_profile = profile_call(main)
+        show_profile_report(rerun_profile)
+    else:
+        main()
\ No newline at end of file
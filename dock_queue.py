@@ -0,0 +1,370 @@
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from analytics import completed_records
+
+DEFAULT_SIMULATIONS = 2000
+MIN_POOL_SAMPLES = 5             # Smaller groups fall back to a broader pool
+MAX_DELAY_MINUTES = (-120, 240)  # Arrival delays outside this range are data-entry errors
+BULTOS_BANDS = np.array([5, 10, 20, 40, 80])  # Upper bounds of package-count bands
+
+ALL = "*"  # Pool key part matching any provider / package band
+
+
+def slot_minutes(hora_values):
+    """Booked 'Hora' values ('10:00', '10:00 - 10:30', '10:00:00') -> minutes after midnight"""
+    parts = pd.Series(hora_values, dtype=object).astype(str).str.extract(r'(\d{1,2}):(\d{2})')
+    return (pd.to_numeric(parts[0], errors='coerce') * 60 + pd.to_numeric(parts[1], errors='coerce')).to_numpy(
+        dtype='float64', na_value=np.nan
+    )
+
+
+def _minutes_of_day(values):
+    """Datetime-like values -> minutes after midnight (NaN when missing)"""
+    times = pd.to_datetime(pd.Series(values), errors='coerce', format='mixed')
+    return (times.dt.hour * 60 + times.dt.minute + times.dt.second / 60).to_numpy(dtype='float64', na_value=np.nan)
+
+
+def bultos_band(bultos):
+    """Package-count band of each value (-1 when unknown)"""
+    bultos = np.asarray(bultos, dtype='float64')
+    return np.where(bultos > 0, np.digitize(bultos, BULTOS_BANDS, right=True), -1)
+
+
+class _Pools:
+    """Empirical samples per key, concatenated so draws are one vector op
+
+    ``groups`` are arrays of keys aligned with ``values``; every key with at
+    least MIN_POOL_SAMPLES values gets its own pool. The pool of all
+    values (key (ALL, ALL)) always exists and is the last resort.
+    """
+
+    def __init__(self, values, groups):
+        keep = ~np.isnan(values)
+        values = values[keep]
+
+        pools = [values]
+        self._codes = {(ALL, ALL): 0}
+        for keys in groups:
+            keys = pd.Series(list(zip(*(np.asarray(k, dtype=object)[keep] for k in keys))), dtype=object)
+            if keys.empty:
+                continue
+            codes, names = pd.factorize(keys)
+            counts = np.bincount(codes, minlength=len(names))
+            order = np.argsort(codes, kind='stable')
+            for name, count, pool in zip(names, counts, np.split(values[order], np.cumsum(counts)[:-1])):
+                if count >= MIN_POOL_SAMPLES:
+                    self._codes[name] = len(pools)
+                    pools.append(pool)
+
+        self._values = np.concatenate(pools)
+        self._lengths = np.array([len(p) for p in pools])
+        self._offsets = np.r_[0, np.cumsum(self._lengths)[:-1]]
+
+    @property
+    def empty(self):
+        return self._lengths[0] == 0
+
+    def sample(self, candidates, size, rng):
+        """(size, trucks) draws; ``candidates`` lists each truck's keys, most specific first"""
+        codes = np.array([
+            next((self._codes[k] for k in keys if k in self._codes), 0) for keys in candidates
+        ], dtype='int64')
+        picks = (rng.random((size, len(codes))) * self._lengths[codes]).astype('int64')
+        return self._values[self._offsets[codes] + picks]
+
+
+class ServiceTimeModel:
+    """Historical service times per provider and package band, and arrival delays"""
+
+    def __init__(self, gestion_df):
+        records = completed_records(gestion_df)
+        providers = records['Proveedor'].astype(object).to_numpy()
+        atencion = pd.to_numeric(records['Tiempo_atencion'], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        bands = bultos_band(pd.to_numeric(records['Numero_de_bultos'], errors='coerce').to_numpy(
+            dtype='float64', na_value=np.nan
+        ))
+        retraso = pd.to_numeric(records['Tiempo_retraso'], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+        low, high = MAX_DELAY_MINUTES
+        retraso = np.where((retraso >= low) & (retraso <= high), retraso, np.nan)
+        anyone = np.full(len(records), ALL, dtype=object)
+        known_bands = np.where(bands >= 0, bands, None).astype(object)
+
+        self.service_minutes = _Pools(np.where(atencion >= 0, atencion, np.nan), [
+            (providers, known_bands), (anyone, known_bands), (providers, anyone),
+        ])
+        self.delay_minutes = _Pools(retraso, [(providers, anyone)])
+
+    @property
+    def empty(self):
+        return self.service_minutes.empty
+
+    def sample_service(self, providers, bultos, size, rng):
+        """Service minutes drawn from the closest group with enough history:
+        same provider and package band, any provider with that band, the
+        provider, everybody."""
+        candidates = [
+            [(p, b), (ALL, b), (p, ALL)] if b >= 0 else [(p, ALL)]
+            for p, b in zip(providers, bultos_band(bultos))
+        ]
+        return self.service_minutes.sample(candidates, size, rng)
+
+    def sample_delay(self, providers, size, rng):
+        if self.delay_minutes.empty:
+            return np.zeros((size, len(providers)))
+        return self.delay_minutes.sample([[(p, ALL)] for p in providers], size, rng)
+
+
+def simulate_queue(arrivals, service, bays):
+    """FIFO queue over ``bays`` docks for many simulated days at once
+
+    ``arrivals`` and ``service`` are (simulations, trucks) minute arrays.
+    Trucks are served in arrival order at the first free bay. Loops over
+    trucks only; every step is vectorized across simulations. Returns the
+    (simulations, trucks) wait before service, in the input truck order.
+    """
+    simulations, trucks = arrivals.shape
+    order = np.argsort(arrivals, axis=1, kind='stable')
+    arrivals = np.take_along_axis(arrivals, order, axis=1)
+    service = np.take_along_axis(service, order, axis=1)
+
+    rows = np.arange(simulations)
+    bay_free = np.full((simulations, max(int(bays), 1)), -np.inf)
+    waits = np.empty_like(arrivals)
+    for k in range(trucks):
+        bay = bay_free.argmin(axis=1)
+        start = np.maximum(arrivals[:, k], bay_free[rows, bay])
+        waits[:, k] = start - arrivals[:, k]
+        bay_free[rows, bay] = start + service[:, k]
+
+    result = np.empty_like(waits)
+    np.put_along_axis(result, order, waits, axis=1)
+    return result
+
+
+def forecast_day(today_reservations, gestion_df, bays, now=None, model=None,
+                 simulations=DEFAULT_SIMULATIONS, seed=0):
+    """Expected dock wait per booked hour for today's reservations (Monte Carlo)
+
+    Trucks that already arrived keep their real arrival time, and the ones
+    already served their real service time. The rest arrive at their booked
+    slot plus a delay drawn from the provider's history (never before
+    ``now``) and take a service time drawn from it too.
+    Returns one row per booked hour, or an empty frame without history.
+    """
+    model = model or ServiceTimeModel(gestion_df)
+    if today_reservations.empty or model.empty:
+        return pd.DataFrame()
+
+    now = now or datetime.now()
+    now_minutes = now.hour * 60 + now.minute
+    reservations = today_reservations.assign(
+        _slot=slot_minutes(today_reservations['Hora'])
+    ).dropna(subset=['_slot']).reset_index(drop=True)
+    if reservations.empty:
+        return pd.DataFrame()
+
+    # What already happened today, matched by order
+    today = gestion_df[
+        pd.to_datetime(gestion_df['Hora_llegada'], errors='coerce', format='mixed').dt.date == now.date()
+    ] if not gestion_df.empty else gestion_df
+    actual = today.drop_duplicates('Orden_de_compra').set_index('Orden_de_compra')
+    orders = reservations['Orden_de_compra'].astype(str)
+    arrived = _minutes_of_day(actual['Hora_llegada'].reindex(orders))
+    served = pd.to_numeric(actual['Tiempo_atencion'], errors='coerce').reindex(orders).to_numpy(
+        dtype='float64', na_value=np.nan
+    ) if 'Tiempo_atencion' in actual.columns else np.full(len(orders), np.nan)
+
+    rng = np.random.default_rng(seed)
+    providers = reservations['Proveedor'].astype(object).to_numpy()
+    bultos = pd.to_numeric(reservations['Numero_de_bultos'], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+    planned = reservations['_slot'].to_numpy() + model.sample_delay(providers, simulations, rng)
+    arrivals = np.where(np.isnan(arrived), np.maximum(planned, now_minutes), arrived)
+    service = model.sample_service(providers, bultos, simulations, rng)
+    service = np.where(np.isnan(served), service, served)
+
+    waits = simulate_queue(arrivals, service, bays)
+
+    hours = (reservations['_slot'].to_numpy() // 60).astype('int64')
+    rows = []
+    for hour in np.unique(hours):
+        in_hour = waits[:, hours == hour]
+        rows.append({
+            'Hora': f"{hour:02d}:00",
+            'Reservas': in_hour.shape[1],
+            'Espera esperada (min)': in_hour.mean(),
+            'Espera p90 (min)': np.percentile(in_hour, 90),
+            'Prob. espera > 30 min (%)': (in_hour > 30).mean() * 100,
+        })
+    return pd.DataFrame(rows).round(1)
+
+
+MIN_SAVING_MINUTES = 1.0        # Smaller expected improvements are not worth a rebooking
+MAX_CANDIDATE_VALUES = 4_000_000  # Simulated arrivals evaluated per batch (memory bound)
+TRUCKS_PER_HOUR = 3             # Trucks of each booked hour tried per round (the longest services)
+MOVES_PER_ROUND = 4             # Improving moves between distinct hours applied together
+PLAN_TIME_BUDGET = 10.0         # Seconds optimize_slots may spend over all days
+
+
+def _expected_total_waits(arrivals, service, bays):
+    """Expected total wait of each candidate plan
+
+    ``arrivals`` is (candidates, simulations, trucks); all candidates share
+    the same service draws, so their differences come from the plan only.
+    """
+    candidates, simulations, trucks = arrivals.shape
+    per_batch = max(1, MAX_CANDIDATE_VALUES // (simulations * trucks))
+    totals = np.empty(candidates)
+    for start in range(0, candidates, per_batch):
+        batch = arrivals[start:start + per_batch]
+        waits = simulate_queue(
+            batch.reshape(-1, trucks), np.tile(service, (len(batch), 1)), bays
+        ).reshape(len(batch), simulations, trucks)
+        totals[start:start + per_batch] = waits.sum(axis=2).mean(axis=1)
+    return totals
+
+
+def _plan_day(slots, allowed, delays, service, bays, max_moves, deadline=None):
+    """Greedy rebooking for one day: apply the best moves while they help
+
+    ``slots`` are the booked minutes, ``allowed`` a (trucks, candidate slots)
+    boolean mask of where each truck may move. Trucks booked in the same
+    hour are nearly interchangeable, so each round only tries moving the
+    TRUCKS_PER_HOUR of every hour with the longest services, evaluated in
+    one vectorized batch. The best move is applied together with the next
+    best ones that touch other hours, unless together they do worse than
+    it alone. Stops early once ``deadline`` (a time.monotonic() value) has
+    passed. Returns (final slots, expected total wait before, after).
+    """
+    current = slots.copy()
+    longest_first = np.argsort(-service.mean(axis=0), kind='stable')
+    before = best_total = _expected_total_waits((current + delays)[None], service, bays)[0]
+    moves = 0
+
+    while moves < max_moves:
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+
+        hours = current[longest_first] // 60
+        rank_in_hour = pd.Series(hours).groupby(hours).cumcount().to_numpy()
+        movers = longest_first[rank_in_hour < TRUCKS_PER_HOUR]
+        trucks, targets = np.nonzero(allowed[movers])
+        trucks = movers[trucks]
+        targets = np.asarray(targets, dtype='float64')
+        keep = targets != current[trucks]
+        trucks, targets = trucks[keep], targets[keep]
+        if len(trucks) == 0:
+            break
+
+        arrivals = np.broadcast_to(current + delays, (len(trucks),) + delays.shape).copy()
+        arrivals[np.arange(len(trucks)), :, trucks] = targets[:, None] + delays[:, trucks].T
+        totals = _expected_total_waits(arrivals, service, bays)
+
+        ranked = np.argsort(totals, kind='stable')
+        improving = ranked[best_total - totals[ranked] >= MIN_SAVING_MINUTES]
+        if len(improving) == 0:
+            break
+        chosen, touched = [], set()
+        for i in improving:
+            source, target = current[trucks[i]] // 60, targets[i] // 60
+            if source in touched or target in touched:
+                continue
+            chosen.append(i)
+            touched.update((source, target))
+            if len(chosen) == min(MOVES_PER_ROUND, max_moves - moves):
+                break
+
+        proposal = current.copy()
+        proposal[trucks[chosen]] = targets[chosen]
+        total = totals[chosen[0]]
+        if len(chosen) > 1:
+            total = _expected_total_waits((proposal + delays)[None], service, bays)[0]
+        if total > totals[chosen[0]]:
+            # The moves interfere: keep only the best one
+            chosen = chosen[:1]
+            proposal = current.copy()
+            proposal[trucks[chosen]] = targets[chosen]
+            total = totals[chosen[0]]
+        current, best_total = proposal, total
+        moves += len(chosen)
+
+    return current, before, best_total
+
+
+def optimize_slots(reservations, model, bays, max_shift_hours=2, allowed_hours=None,
+                   max_moves_per_day=None, simulations=50, seed=0, time_budget=PLAN_TIME_BUDGET):
+    """Propose slot changes that flatten peaks and cut the expected total wait
+
+    Each day of ``reservations`` is planned separately: trucks may move by
+    whole hours, at most ``max_shift_hours`` away from their booking and
+    within the day's booked window (and ``allowed_hours`` when given, e.g.
+    to keep lunch breaks free). Waits are estimated by simulating the
+    queue with draws from ``model`` shared by all candidate plans. The
+    search stops improving after ``time_budget`` seconds, shared evenly by
+    the days still to plan. Returns (proposals, per-day summary) DataFrames.
+    """
+    if reservations.empty or model.empty:
+        return pd.DataFrame(), pd.DataFrame()
+
+    rng = np.random.default_rng(seed)
+    days = pd.to_datetime(reservations['Fecha'], errors='coerce', format='mixed').dt.normalize()
+    slots_all = slot_minutes(reservations['Hora'])
+    proposals, summary = [], []
+    plan_days = sorted(days.dropna().unique())
+    deadline = time.monotonic() + time_budget if time_budget is not None else None
+
+    for day_number, day in enumerate(plan_days):
+        mask = (days == day).to_numpy() & ~np.isnan(slots_all)
+        day_reservations = reservations[mask]
+        if day_reservations.empty:
+            continue
+        slots = slots_all[mask]
+        providers = day_reservations['Proveedor'].astype(object).to_numpy()
+        bultos = pd.to_numeric(day_reservations['Numero_de_bultos'], errors='coerce').to_numpy(
+            dtype='float64', na_value=np.nan
+        )
+
+        delays = model.sample_delay(providers, simulations, rng)
+        service = model.sample_service(providers, bultos, simulations, rng)
+
+        # Whole-hour slots inside the day's booked window (as minutes of day)
+        window = np.arange(np.floor(slots.min() / 60) * 60, slots.max() + 1, 60)
+        if allowed_hours is not None:
+            window = window[np.isin(window // 60, list(allowed_hours))]
+        allowed = np.zeros((len(slots), 24 * 60), dtype=bool)
+        near = np.abs(window[None, :] - slots[:, None]) <= max_shift_hours * 60
+        rows, columns = np.nonzero(near)
+        allowed[rows, window[columns].astype('int64')] = True
+
+        max_moves = max_moves_per_day if max_moves_per_day is not None else len(slots)
+        day_deadline = None
+        if deadline is not None:
+            now = time.monotonic()
+            day_deadline = now + max(deadline - now, 0) / (len(plan_days) - day_number)
+        final, before, after = _plan_day(slots, allowed, delays, service, bays, max_moves, day_deadline)
+
+        moved = np.flatnonzero(final != slots)
+        for i in moved:
+            record = day_reservations.iloc[i]
+            proposals.append({
+                'Fecha': pd.Timestamp(day).date(),
+                'Orden_de_compra': record['Orden_de_compra'],
+                'Proveedor': record['Proveedor'],
+                'Hora actual': str(record['Hora']),
+                'Hora propuesta': f"{int(final[i]) // 60:02d}:{int(final[i]) % 60:02d}",
+            })
+        summary.append({
+            'Fecha': pd.Timestamp(day).date(),
+            'Reservas': len(slots),
+            'Cambios propuestos': len(moved),
+            'Espera total actual (min)': before,
+            'Espera total propuesta (min)': after,
+            'Ahorro (min)': before - after,
+        })
+
+    return pd.DataFrame(proposals), pd.DataFrame(summary).round(1)
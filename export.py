@@ -0,0 +1,113 @@
+import codecs
+
+import numpy as np
+import pandas as pd
+
+EXPORT_CHUNK_ROWS = 50_000  # Rows copied out of the snapshot at a time
+
+EXPORT_MIME_TYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def available_export_formats():
+    """Export formats that can run with the installed packages"""
+    formats = ['csv']
+    try:
+        import pyarrow.parquet  # noqa: F401
+        formats.append('parquet')
+    except ImportError:
+        pass
+    return formats
+
+
+def slice_positions(gestion_df, provider=None, start=None, end=None):
+    """Row positions of the records of ``provider`` that arrived from start to end
+
+    Dates are inclusive; None means no bound. Returns positions instead of
+    a filtered frame so the snapshot is never copied as a whole.
+    """
+    mask = np.ones(len(gestion_df), dtype=bool)
+    if provider is not None:
+        mask &= (gestion_df['Proveedor'] == provider).to_numpy(dtype=bool, na_value=False)
+    if start is not None or end is not None:
+        arrival = pd.to_datetime(gestion_df['Hora_llegada'], errors='coerce')
+        if start is not None:
+            mask &= (arrival >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (arrival < pd.Timestamp(end) + pd.Timedelta(days=1)).to_numpy()
+    return np.flatnonzero(mask)
+
+
+def _chunks(gestion_df, positions, chunk_rows):
+    """The selected rows, ``chunk_rows`` at a time (one empty chunk if none)"""
+    for i in range(0, max(len(positions), 1), chunk_rows):
+        yield gestion_df.iloc[positions[i:i + chunk_rows]]
+
+
+def iter_csv(gestion_df, positions, chunk_rows=EXPORT_CHUNK_ROWS):
+    """CSV bytes of the selected rows, one chunk at a time
+
+    Starts with a UTF-8 BOM so Excel shows the accents correctly.
+    """
+    yield codecs.BOM_UTF8
+    for i, chunk in enumerate(_chunks(gestion_df, positions, chunk_rows)):
+        yield chunk.to_csv(index=False, header=(i == 0)).encode('utf-8')
+
+
+class _ByteSink:
+    """Write-only file object that hands over what was written so far"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def iter_parquet(gestion_df, positions, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Parquet bytes of the selected rows, one row group per chunk"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ByteSink()
+    writer = None
+    schema = None
+    for chunk in _chunks(gestion_df, positions, chunk_rows):
+        table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+        if writer is None:
+            schema = table.schema
+            writer = pq.ParquetWriter(sink, schema)
+        writer.write_table(table)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def iter_export(gestion_df, positions, export_format, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Chunks of the selected rows in 'csv' or 'parquet'"""
+    if export_format not in available_export_formats():
+        raise ValueError(f"Formato de exportación no disponible: {export_format}")
+    if export_format == 'parquet':
+        return iter_parquet(gestion_df, positions, chunk_rows)
+    return iter_csv(gestion_df, positions, chunk_rows)
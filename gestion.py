@@ -0,0 +1,422 @@
+import re
+import weakref
+from datetime import datetime, time
+
+import numpy as np
+import pandas as pd
+
+from schema import compact_gestion
+
+SERVICE_FIELDS = [
+    'Hora_inicio_atencion', 'Hora_fin_atencion',
+    'Tiempo_espera', 'Tiempo_atencion', 'Tiempo_total'
+]
+
+
+# id(gestion frame) -> (weakref to it, {orden: row position} or None when orders repeat, change log)
+# The change log of a derived frame is (parent's log, row positions it touched)
+_ROW_INDEXES = {}
+
+
+def _register_rows(gestion_df, positions, changes):
+    key = id(gestion_df)
+
+    def forget(ref):
+        if _ROW_INDEXES.get(key, (None,))[0] is ref:
+            _ROW_INDEXES.pop(key, None)
+
+    _ROW_INDEXES[key] = (weakref.ref(gestion_df, forget), positions, changes)
+
+
+def _rows_entry(gestion_df):
+    """Registry entry of a frame, indexing it on first use
+
+    Frames derived by the registration helpers share their parent's map,
+    which appended orders are added to, so it is built once per loaded
+    snapshot rather than once per registration.
+    """
+    entry = _ROW_INDEXES.get(id(gestion_df))
+    if entry is not None and entry[0]() is gestion_df:
+        return entry
+    orders = gestion_df['Orden_de_compra'].tolist() if 'Orden_de_compra' in gestion_df.columns else []
+    positions = dict(zip(reversed(orders), range(len(orders) - 1, -1, -1)))
+    if len(positions) < len(orders):
+        positions = None  # Hand-edited repeats: every row of the order is updated by scanning
+    _register_rows(gestion_df, positions, (None, ()))
+    return _ROW_INDEXES[id(gestion_df)]
+
+
+def _derived(gestion_df, parent_df, touched=()):
+    """``gestion_df`` registered as ``parent_df`` with the rows at positions ``touched`` changed or added"""
+    _, positions, changes = _rows_entry(parent_df)
+    _register_rows(gestion_df, positions, (changes, tuple(touched)) if len(touched) else changes)
+    return gestion_df
+
+
+def changed_rows(gestion_df, since_df):
+    """Positions of the rows changed or added since ``since_df``, or None if unknown
+
+    Only known when gestion_df was derived from since_df by the
+    registration helpers; the positions may include rows that ended up
+    unchanged.
+    """
+    entry = _ROW_INDEXES.get(id(gestion_df))
+    since = _ROW_INDEXES.get(id(since_df))
+    if entry is None or entry[0]() is not gestion_df or since is None or since[0]() is not since_df:
+        return None
+    touched = []
+    changes = entry[2]
+    while changes is not since[2]:
+        if changes[0] is None:
+            return None  # Not derived from since_df
+        changes, rows = changes
+        touched.extend(rows)
+    return np.unique(np.asarray(touched, dtype='int64'))
+
+
+def _order_rows(gestion_df, orden_compra):
+    """Positions of the rows of an order
+
+    Frames derived from one snapshot share an append-only map, so a
+    position is only trusted once the frame confirms it; otherwise (another
+    derived frame appended a different order there) the column is scanned.
+    """
+    positions = _rows_entry(gestion_df)[1]
+    if positions is not None:
+        i = positions.get(orden_compra)
+        if i is None:
+            return np.empty(0, dtype='int64')
+        if i < len(gestion_df) and gestion_df['Orden_de_compra'].iat[i] == orden_compra:
+            return np.array([i])
+    return np.flatnonzero((gestion_df['Orden_de_compra'] == orden_compra).to_numpy())
+
+
+def get_arrival_record(gestion_df, orden_compra):
+    """Get existing arrival record for an order"""
+    rows = _order_rows(gestion_df, orden_compra)
+    return gestion_df.iloc[rows[0]] if len(rows) else None
+
+
+def get_today_reservations(reservas_df):
+    """Get today's reservations"""
+    today = datetime.now().strftime('%Y-%m-%d')
+    return reservas_df[reservas_df['Fecha'].astype(str).str.contains(today, na=False)]
+
+
+def get_existing_arrivals(gestion_df):
+    """Get orders that already have arrival registered today but not yet completed"""
+    today = datetime.now().strftime('%Y-%m-%d')
+    if gestion_df.empty:
+        return []
+
+    # Filter records with arrival time from today
+    today_arrivals = gestion_df[
+        gestion_df['Hora_llegada'].astype(str).str.contains(today, na=False)
+    ]
+
+    # Only return orders that don't have service times completed
+    pending_service = today_arrivals[
+        today_arrivals['Hora_inicio_atencion'].isna() | 
+        today_arrivals['Hora_fin_atencion'].isna()
+    ]
+
+    return sorted(pending_service['Orden_de_compra'].tolist())
+
+
+def get_completed_orders(gestion_df):
+    """Get orders that have both arrival and service registered today"""
+    today = datetime.now().strftime('%Y-%m-%d')
+    if gestion_df.empty:
+        return []
+
+    # Filter records with arrival time from today
+    today_records = gestion_df[
+        gestion_df['Hora_llegada'].astype(str).str.contains(today, na=False)
+    ]
+
+    # Return orders that have both arrival and service times
+    completed = today_records[
+        today_records['Hora_inicio_atencion'].notna() & 
+        today_records['Hora_fin_atencion'].notna()
+    ]
+
+    return completed['Orden_de_compra'].tolist()
+
+
+def get_pending_arrivals(today_reservations, gestion_df):
+    """Get orders that haven't registered arrival yet"""
+    existing_arrivals = get_existing_arrivals(gestion_df)
+    completed_orders = get_completed_orders(gestion_df)
+
+    # Combine both lists to exclude from dropdown
+    processed_orders = existing_arrivals + completed_orders
+
+    # Return orders that haven't been processed at all
+    pending = today_reservations[
+        ~today_reservations['Orden_de_compra'].isin(processed_orders)
+    ]
+
+    return sorted(pending['Orden_de_compra'].astype(str).tolist())
+
+
+def booked_start_time(hora):
+    """Start of a booked slot ('10:00', '10:00 - 10:30', '10:00:00'), None if unparsable"""
+    match = re.match(r'\s*(\d{1,2}):(\d{2})(?::(\d{2}))?', str(hora))
+    if not match:
+        return None
+    try:
+        return time(int(match.group(1)), int(match.group(2)), int(match.group(3) or 0))
+    except ValueError:
+        return None
+
+
+def _minutes(start, end):
+    """Whole minutes from start to end, like the registration tabs compute them"""
+    return int((end - start).total_seconds() / 60)
+
+
+def build_arrival_data(reservas_df, orden_compra, hora_llegada):
+    """Arrival record for a reserved order, derived as the arrival tab does
+
+    ``hora_llegada`` is a datetime or ISO string. Raises ValueError when the
+    order has no reservation or the time can't be parsed.
+    """
+    reservation = reservas_df[reservas_df['Orden_de_compra'] == str(orden_compra)]
+    if reservation.empty:
+        raise ValueError("No se encontró la reserva para esta orden.")
+    reservation = reservation.iloc[0]
+
+    try:
+        arrival_datetime = pd.Timestamp(hora_llegada).to_pydatetime().replace(microsecond=0)
+    except (TypeError, ValueError):
+        raise ValueError(f"Hora de llegada no válida: {hora_llegada}")
+
+    booked_time = booked_start_time(reservation['Hora'])
+    tiempo_retraso = 0
+    hora_de_reserva = None
+    if booked_time is not None:
+        tiempo_retraso = _minutes(datetime.combine(arrival_datetime.date(), booked_time), arrival_datetime)
+        hora_de_reserva = booked_time.hour
+
+    return {
+        'Orden_de_compra': str(orden_compra),
+        'Proveedor': reservation['Proveedor'],
+        'Numero_de_bultos': reservation['Numero_de_bultos'],
+        'Hora_llegada': arrival_datetime.strftime('%Y-%m-%d %H:%M:%S'),
+        'Hora_inicio_atencion': None,
+        'Hora_fin_atencion': None,
+        'Tiempo_espera': None,
+        'Tiempo_atencion': None,
+        'Tiempo_total': None,
+        'Tiempo_retraso': tiempo_retraso,
+        'numero_de_semana': arrival_datetime.isocalendar()[1],
+        'hora_de_reserva': hora_de_reserva,
+    }
+
+
+def build_service_data(gestion_df, orden_compra, hora_inicio, hora_fin):
+    """Service record for an arrived order, validated as the service tab does
+
+    Raises ValueError when the order has no arrival, the times can't be
+    parsed, the end is not after the start or the start is before arrival.
+    """
+    arrival_record = get_arrival_record(gestion_df, str(orden_compra))
+    if arrival_record is None:
+        raise ValueError("No se encontró registro de llegada para esta orden.")
+
+    try:
+        hora_inicio = pd.Timestamp(hora_inicio).to_pydatetime().replace(microsecond=0)
+        hora_fin = pd.Timestamp(hora_fin).to_pydatetime().replace(microsecond=0)
+    except (TypeError, ValueError):
+        raise ValueError("Horas de atención no válidas.")
+    arrival_datetime = pd.Timestamp(arrival_record['Hora_llegada']).to_pydatetime()
+
+    if hora_inicio >= hora_fin:
+        raise ValueError("La hora de fin debe ser posterior a la hora de inicio.")
+    if hora_inicio < arrival_datetime:
+        raise ValueError("La hora de inicio de atención no puede ser anterior a la hora de llegada.")
+
+    return {
+        'Hora_inicio_atencion': hora_inicio.strftime('%Y-%m-%d %H:%M:%S'),
+        'Hora_fin_atencion': hora_fin.strftime('%Y-%m-%d %H:%M:%S'),
+        'Tiempo_espera': _minutes(arrival_datetime, hora_inicio),
+        'Tiempo_atencion': _minutes(hora_inicio, hora_fin),
+        'Tiempo_total': _minutes(arrival_datetime, hora_fin),
+    }
+
+
+def _ensure_derived_columns(gestion_df):
+    """Add numero_de_semana / hora_de_reserva to sheets created before they existed"""
+    if 'numero_de_semana' not in gestion_df.columns:
+        # Calculate week number for existing records that don't have it
+        arrivals = pd.to_datetime(gestion_df['Hora_llegada'], errors='coerce', format='mixed')
+        gestion_df['numero_de_semana'] = arrivals.dt.isocalendar().week
+
+    if 'hora_de_reserva' not in gestion_df.columns:
+        # Reservation hour needs reservas_df, so older records keep it empty;
+        # it is populated for new records going forward
+        gestion_df['hora_de_reserva'] = None
+
+
+def _with_derived_columns(gestion_df):
+    """Shallow copy of gestion_df with the derived columns, sharing its row index"""
+    copy_df = gestion_df.copy(deep=False)
+    _ensure_derived_columns(copy_df)
+    return _derived(copy_df, gestion_df)
+
+
+def _conform(gestion_df, values):
+    """``values`` as a compact one-row frame with gestion_df's columns and dtypes
+
+    Lets a registration be appended or assigned without pandas casting
+    whole columns to object, which would make every save re-parse the
+    full history. Categories the row introduces are added to gestion_df,
+    so it must be a copy. Returns (gestion_df, row, columns whose dtypes
+    still differ and need compacting after the change).
+    """
+    row = compact_gestion(pd.DataFrame([values]))
+    row = row.reindex(columns=gestion_df.columns.union(row.columns, sort=False))
+    loose = []
+    for column in gestion_df.columns:
+        dtype = gestion_df[column].dtype
+        if row[column].dtype == dtype:
+            continue
+        if isinstance(dtype, pd.CategoricalDtype):
+            value = row[column].astype(object)
+            missing = [v for v in value.dropna() if v not in dtype.categories]
+            if missing:
+                gestion_df[column] = gestion_df[column].cat.add_categories(missing)
+            row[column] = value.astype(gestion_df[column].dtype)
+            continue
+        try:
+            row[column] = row[column].astype(dtype)
+        except (TypeError, ValueError, OverflowError):
+            # e.g. minutes that don't fit the column's integer width
+            loose.append(column)
+    return gestion_df, row, loose
+
+
+def _compact_columns(gestion_df, columns):
+    """Compact only ``columns`` (those a change left with a mixed dtype)"""
+    if not columns:
+        return gestion_df
+    return gestion_df.assign(**compact_gestion(gestion_df[columns]))
+
+
+def _set_values(gestion_df, rows, values):
+    """Copy of gestion_df with ``values`` ({column: value}) set on the row positions ``rows``
+
+    Only the touched columns are copied; the snapshot is shared between
+    sessions and must never be modified in place.
+    """
+    parent_df = gestion_df
+    gestion_df = gestion_df.copy(deep=False)
+    gestion_df, row, loose = _conform(gestion_df, values)
+    for column in values:
+        if column in gestion_df.columns:
+            series = gestion_df[column].copy()
+        else:
+            series = row[column].iloc[:0].reindex(gestion_df.index)
+        series.iloc[rows] = row[column].iloc[0]
+        gestion_df[column] = series
+    return _derived(_compact_columns(gestion_df, [c for c in loose if c in values]), parent_df, rows)
+
+
+def apply_arrival(gestion_df, arrival_data):
+    """Return a copy of gestion_df with the arrival registered (insert or update)"""
+    orden_compra = arrival_data['Orden_de_compra']
+    arrival_datetime = datetime.fromisoformat(arrival_data['Hora_llegada'])
+    week_number = arrival_datetime.isocalendar()[1]
+
+    rows = _order_rows(gestion_df, orden_compra)
+    if len(rows):
+        # Update existing record
+        return _set_values(_with_derived_columns(gestion_df), rows, {
+            'Hora_llegada': arrival_data['Hora_llegada'],
+            'numero_de_semana': week_number,
+            'hora_de_reserva': arrival_data.get('hora_de_reserva'),
+        })
+
+    # Add new record with its week number
+    new_record = {**arrival_data, 'numero_de_semana': week_number}
+    if gestion_df.empty:
+        appended = _conform(gestion_df.copy(deep=False), new_record)[1]
+    else:
+        parent_df, new_row, loose = _conform(gestion_df.copy(deep=False), new_record)
+        appended = _compact_columns(pd.concat([parent_df, new_row], ignore_index=True), loose)
+
+    # The new row is the last one: extend the shared row index instead of rebuilding it
+    positions = _rows_entry(gestion_df)[1]
+    if positions is not None:
+        positions[orden_compra] = len(gestion_df)
+    return _derived(appended, gestion_df, [len(gestion_df)])
+
+
+def apply_service(gestion_df, orden_compra, service_data):
+    """Return a copy of gestion_df with service times set for an arrived order
+
+    Raises ValueError when the order has no arrival registered or the
+    start/end timestamps are missing.
+    """
+    if not service_data.get('Hora_inicio_atencion') or not service_data.get('Hora_fin_atencion'):
+        raise ValueError("Faltan las horas de inicio o fin de atención.")
+    rows = _order_rows(gestion_df, orden_compra)
+    if not len(rows):
+        raise ValueError("No se encontró registro de llegada para esta orden.")
+
+    # Update service times and calculations
+    updated_df = _set_values(_with_derived_columns(gestion_df), rows, {
+        field: service_data[field] for field in SERVICE_FIELDS if field in service_data
+    })
+
+    if any(field not in service_data for field in SERVICE_FIELDS):
+        # Events that only carry timestamps get their minutes derived here
+        return refresh_derived_metrics(updated_df, [orden_compra])
+    return updated_df
+
+
+def _minutes_between(start, end):
+    """Whole minutes from start to end (truncated like calculate_time_difference)"""
+    return np.trunc((end - start).dt.total_seconds() / 60)
+
+
+def refresh_derived_metrics(gestion_df, ordenes):
+    """Recompute week and wait/service/total minutes from timestamps for some orders
+
+    Values that can't be derived (missing timestamps) are left as they are;
+    Tiempo_retraso needs the booked slot and always comes from the event.
+    """
+    positions = np.unique(np.concatenate(
+        [_order_rows(gestion_df, str(orden)) for orden in ordenes] or [np.empty(0, dtype='int64')]
+    ))
+    if not len(positions):
+        return gestion_df
+
+    parent_df = gestion_df
+    gestion_df = _with_derived_columns(gestion_df)
+    rows = gestion_df.iloc[positions]
+
+    llegada = pd.to_datetime(rows['Hora_llegada'], errors='coerce', format='mixed')
+    inicio = pd.to_datetime(rows['Hora_inicio_atencion'], errors='coerce', format='mixed')
+    fin = pd.to_datetime(rows['Hora_fin_atencion'], errors='coerce', format='mixed')
+
+    derived = {
+        'numero_de_semana': llegada.dt.isocalendar().week,
+        'Tiempo_espera': _minutes_between(llegada, inicio),
+        'Tiempo_atencion': _minutes_between(inicio, fin),
+        'Tiempo_total': _minutes_between(llegada, fin),
+    }
+    for column, values in derived.items():
+        known = values.notna().to_numpy()
+        values = values.to_numpy()[known]
+        # Only the touched columns are copied, as in _set_values
+        series = gestion_df[column].copy() if column in gestion_df.columns else pd.Series(None, index=gestion_df.index)
+        try:
+            series.iloc[positions[known]] = values
+        except (TypeError, ValueError):
+            # Minutes that don't fit the column's integer width: widen it
+            series = series.astype(object)
+            series.iloc[positions[known]] = values
+        gestion_df[column] = series
+
+    return _derived(_compact_columns(gestion_df, list(derived)), parent_df, positions)
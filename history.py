@@ -0,0 +1,112 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from analytics import ALL
+
+STATUS_WAITING = "En espera"
+STATUS_IN_SERVICE = "En atención"
+STATUS_COMPLETED = "Completado"
+STATUSES = (STATUS_WAITING, STATUS_IN_SERVICE, STATUS_COMPLETED)
+
+HISTORY_PAGE_SIZES = (25, 50, 100, 250)
+
+_NO_ARRIVAL = np.iinfo('int64').min  # Sort key of records without a valid arrival time
+
+
+def record_status(gestion_df):
+    """Index into STATUSES of every record: waiting, being served or completed"""
+    started = gestion_df['Hora_inicio_atencion'].notna().to_numpy()
+    ended = gestion_df['Hora_fin_atencion'].notna().to_numpy()
+    return np.where(ended, 2, np.where(started, 1, 0)).astype('int8')
+
+
+def _arrival_key(value):
+    """Nanoseconds since the epoch of a date (its midnight) or datetime"""
+    return pd.Timestamp(value).value
+
+
+class HistoryIndex:
+    """Record positions sorted by arrival time, per provider and status
+
+    Built once per snapshot version. A filter is two binary searches on the
+    arrival times of its (provider, status) group and a page is a slice of
+    positions, so only the rows on screen are copied out of the snapshot.
+    Groups other than "everything" are extracted the first time they are
+    queried.
+    """
+
+    def __init__(self, gestion_df):
+        self._df = gestion_df
+        arrival = pd.to_datetime(gestion_df['Hora_llegada'], errors='coerce', format='mixed')
+        keys = arrival.to_numpy(dtype='datetime64[ns]').view('int64').copy()
+        keys[arrival.isna().to_numpy()] = _NO_ARRIVAL
+
+        order = np.argsort(keys, kind='stable')
+        self._keys = keys[order]
+        self._positions = order
+        providers = pd.Categorical(gestion_df['Proveedor'])
+        self._providers = {name: code for code, name in enumerate(providers.categories)}
+        self._provider_codes = providers.codes[order]
+        self._status = record_status(gestion_df)[order]
+
+        self._lock = threading.Lock()
+        self._groups = {(ALL, ALL): (self._keys, self._positions)}
+
+    def __len__(self):
+        return len(self._positions)
+
+    def providers(self):
+        """Providers with at least one record"""
+        return sorted(self._providers)
+
+    def bounds(self):
+        """(first, last) arrival date, or None without arrivals"""
+        valid = self._keys[self._keys != _NO_ARRIVAL]
+        if len(valid) == 0:
+            return None
+        return pd.Timestamp(valid[0]).date(), pd.Timestamp(valid[-1]).date()
+
+    def _group(self, provider, status):
+        """(sorted arrival keys, positions) of one provider and status"""
+        key = (provider, status)
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                mask = np.ones(len(self._keys), dtype=bool)
+                if provider != ALL:
+                    mask &= self._provider_codes == self._providers.get(provider, -2)
+                if status != ALL:
+                    mask &= self._status == STATUSES.index(status)
+                group = self._groups[key] = (self._keys[mask], self._positions[mask])
+            return group
+
+    def _range(self, keys, start, end):
+        """[i0, i1) of the records that arrived from start to end (dates, inclusive)
+
+        Records without an arrival time only match when there are no bounds.
+        """
+        if start is not None:
+            i0 = np.searchsorted(keys, _arrival_key(start), side='left')
+        elif end is not None:
+            i0 = np.searchsorted(keys, _NO_ARRIVAL, side='right')
+        else:
+            i0 = 0
+        i1 = len(keys) if end is None else np.searchsorted(
+            keys, _arrival_key(pd.Timestamp(end) + pd.Timedelta(days=1)), side='left'
+        )
+        return int(i0), int(max(i1, i0))
+
+    def count(self, start=None, end=None, provider=ALL, status=ALL):
+        keys, _ = self._group(provider, status)
+        i0, i1 = self._range(keys, start, end)
+        return i1 - i0
+
+    def page(self, start=None, end=None, provider=ALL, status=ALL, page=0, page_size=50):
+        """(number of matching records, rows of page ``page``), latest arrivals first"""
+        keys, positions = self._group(provider, status)
+        i0, i1 = self._range(keys, start, end)
+        hi = max(i1 - page * page_size, i0)
+        lo = max(hi - page_size, i0)
+        return i1 - i0, self._df.iloc[positions[lo:hi][::-1]]
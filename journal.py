@@ -0,0 +1,335 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from gestion import apply_arrival, apply_service, refresh_derived_metrics
+from schema import GESTION_COLUMNS, compact_gestion
+
+EVENT_ARRIVAL = 'arrival'
+EVENT_SERVICE = 'service'
+
+
+def _json_default(value):
+    """Serialize numpy/pandas scalars found in registration payloads"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.isoformat(sep=' ')
+    if value is pd.NA or value is pd.NaT:
+        return None
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class EventJournal:
+    """Durable local append-only log of arrival and service registrations (SQLite, WAL)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event_type TEXT NOT NULL,
+                    orden_de_compra TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    applied_at TEXT
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS events_pending ON events (applied_at, id)"
+            )
+
+            # Columns added after the first release of the journal
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(events)")}
+            for column in ('terminal', 'event_time'):
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE events ADD COLUMN {column} TEXT")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS events_orden ON events (orden_de_compra, id)"
+            )
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived autocommit connection (safe to use from any thread)"""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA synchronous=FULL")
+            yield conn
+        finally:
+            conn.close()
+
+    def append(self, event_type, orden_de_compra, payload, terminal=None, event_time=None):
+        """Durably record an event and return its id (an O(1) append)"""
+        return self.append_many([(event_type, orden_de_compra, payload, terminal, event_time)])[0]
+
+    def append_many(self, events):
+        """Durably record (event_type, orden, payload, terminal, event_time) tuples
+
+        All events go in one transaction, so a batch costs a single fsync.
+        Returns their ids in order.
+        """
+        if not events:
+            return []
+        now = datetime.now().isoformat(sep=' ', timespec='seconds')
+        ids = []
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN")
+            for event_type, orden_de_compra, payload, terminal, event_time in events:
+                cursor = conn.execute(
+                    "INSERT INTO events "
+                    "(event_type, orden_de_compra, payload, created_at, terminal, event_time) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        event_type,
+                        str(orden_de_compra),
+                        json.dumps(payload, default=_json_default),
+                        now,
+                        terminal,
+                        event_time or now,
+                    ),
+                )
+                ids.append(cursor.lastrowid)
+            conn.execute("COMMIT")
+        return ids
+
+    def last_id(self):
+        """Id of the newest event (0 when empty); cheap to poll"""
+        with self._connect() as conn:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+    def acquire_lease(self, name, owner, ttl):
+        """Take or renew a named lease for ``ttl`` seconds; False if someone else holds it
+
+        Lets several processes share the journal while only one of them
+        runs a given job (e.g. compaction).
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                (name, owner, now + ttl),
+            )
+            conn.execute("COMMIT")
+            return True
+
+    def events(self, orden_de_compra=None, since_id=0, until=None):
+        """Full event history in order, optionally for one order or up to a time"""
+        query = (
+            "SELECT id, event_type, orden_de_compra, payload, created_at, terminal, "
+            "event_time, applied_at FROM events WHERE id > ?"
+        )
+        params = [since_id]
+        if orden_de_compra is not None:
+            query += " AND orden_de_compra = ?"
+            params.append(str(orden_de_compra))
+        if until is not None:
+            query += " AND created_at <= ?"
+            params.append(str(until))
+        query += " ORDER BY id"
+
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [
+            {
+                'id': r[0], 'event_type': r[1], 'orden_de_compra': r[2],
+                'payload': json.loads(r[3]), 'created_at': r[4], 'terminal': r[5],
+                'event_time': r[6], 'applied_at': r[7],
+            }
+            for r in rows
+        ]
+
+    def pending(self):
+        """Events not yet written to the workbook, oldest first"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, event_type, orden_de_compra, payload FROM events "
+                "WHERE applied_at IS NULL ORDER BY id"
+            ).fetchall()
+        return [
+            {'id': r[0], 'event_type': r[1], 'orden_de_compra': r[2], 'payload': json.loads(r[3])}
+            for r in rows
+        ]
+
+    def pending_count(self):
+        """Number of events waiting to be written to the workbook"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM events WHERE applied_at IS NULL"
+            ).fetchone()[0]
+
+    def mark_applied(self, event_ids):
+        """Flag events as written to the workbook"""
+        if not event_ids:
+            return
+        applied_at = datetime.now().isoformat(sep=' ', timespec='seconds')
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "UPDATE events SET applied_at = ? WHERE id = ?",
+                [(applied_at, event_id) for event_id in event_ids],
+            )
+            conn.execute("COMMIT")
+
+
+def apply_event(gestion_df, event):
+    """Fold one journal event into the gestion sheet"""
+    if event['event_type'] == EVENT_ARRIVAL:
+        return apply_arrival(gestion_df, event['payload'])
+    if event['event_type'] == EVENT_SERVICE:
+        return apply_service(gestion_df, event['orden_de_compra'], event['payload'])
+    raise ValueError(f"Tipo de evento desconocido: {event['event_type']}")
+
+
+def apply_events(gestion_df, events):
+    """Fold events in order, skipping ones that no longer apply
+
+    Derived metrics (waits, totals, week) of the touched orders are
+    recomputed from their timestamps once, after all events are folded.
+    Returns (gestion_df, ids of the events that were folded or skipped).
+    """
+    handled = []
+    touched = set()
+    for event in events:
+        try:
+            gestion_df = apply_event(gestion_df, event)
+            touched.add(event['orden_de_compra'])
+        except ValueError:
+            # e.g. a service for an order whose arrival was removed by hand
+            pass
+        handled.append(event['id'])
+
+    if touched:
+        gestion_df = refresh_derived_metrics(gestion_df, touched)
+    return gestion_df, handled
+
+
+def replay(journal, until=None, base_gestion_df=None):
+    """Rebuild the gestion table from the event history (for audits)
+
+    Starts from ``base_gestion_df`` or an empty sheet and folds every event
+    recorded up to ``until`` (a 'YYYY-MM-DD HH:MM:SS' string).
+    """
+    if base_gestion_df is None:
+        base_gestion_df = compact_gestion(pd.DataFrame(columns=GESTION_COLUMNS))
+    return apply_events(base_gestion_df, journal.events(until=until))[0]
+
+
+class JournalReconciler:
+    """Background compaction of journal events into the workbook
+
+    Only the process holding the compaction lease (``owner``) uploads;
+    failures are retried with exponential backoff.
+    """
+
+    def __init__(self, journal, fetch, push, on_synced=None,
+                 interval=60, max_backoff=300, owner=None, lease_ttl=600):
+        self.journal = journal
+        self._fetch = fetch
+        self._push = push
+        self._on_synced = on_synced
+        self._interval = interval
+        self._max_backoff = max_backoff
+        self._owner = owner or f"{os.getpid()}"
+        self._lease_ttl = max(lease_ttl, 3 * interval)
+        self._wake = threading.Event()
+        self._sync_lock = threading.Lock()  # One workbook rewrite at a time in this process
+        self._thread = None
+        self.last_error = None
+        self.last_sync = None
+
+    def start(self):
+        """Start the reconciler thread (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="journal-reconciler", daemon=True
+            )
+            self._thread.start()
+
+    def wake(self):
+        """Compact now instead of waiting for the next scheduled run"""
+        self._wake.set()
+
+    def sync_once(self):
+        """Fold all pending events into the workbook; returns how many were compacted"""
+        if not self.journal.acquire_lease('compaction', self._owner, self._lease_ttl):
+            return 0
+        with self._sync_lock:
+            events = self.journal.pending()
+            if not events:
+                return 0
+
+            credentials_df, reservas_df, gestion_df = self._fetch()
+            gestion_df, handled = apply_events(gestion_df, events)
+            self._push(credentials_df, reservas_df, gestion_df)
+            self.journal.mark_applied(handled)
+
+            if self._on_synced is not None:
+                self._on_synced(credentials_df, reservas_df, gestion_df)
+            return len(handled)
+
+    def rewrite_reservas(self, change, wait=30):
+        """Apply ``change`` to the freshly downloaded reservas sheet and upload it right away
+
+        Raises TimeoutError if the compaction lease is held elsewhere for
+        more than ``wait`` seconds. Returns the resulting reservas frame.
+        """
+        deadline = time.monotonic() + wait
+        while not self.journal.acquire_lease('compaction', self._owner, self._lease_ttl):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(
+                    "Otro proceso está actualizando el libro en SharePoint; intente de nuevo en unos minutos."
+                )
+            time.sleep(1)
+
+        with self._sync_lock:
+            credentials_df, reservas_df, gestion_df = self._fetch()
+            changed_df = change(reservas_df)
+            if changed_df is reservas_df:
+                return reservas_df  # Nothing to write
+            reservas_df = changed_df
+            gestion_df, handled = apply_events(gestion_df, self.journal.pending())
+            self._push(credentials_df, reservas_df, gestion_df)
+            self.journal.mark_applied(handled)
+
+            if self._on_synced is not None:
+                self._on_synced(credentials_df, reservas_df, gestion_df)
+            return reservas_df
+
+    def _run(self):
+        delay = self._interval
+        while True:
+            self._wake.wait(timeout=delay)
+            self._wake.clear()
+            try:
+                self.sync_once()
+                self.last_error = None
+                self.last_sync = time.time()
+                delay = self._interval
+            except Exception as e:
+                # Remote unreachable: keep the events and back off
+                self.last_error = e
+                delay = min(max(delay, 1) * 2, self._max_backoff)
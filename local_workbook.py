@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pandas as pd
+
+from schema import GESTION_COLUMNS, compact_gestion, compact_reservas
+
+
+class MemoryWorkbook:
+    """In-memory stand-in for SharePointWorkbook, optionally with transfer latency"""
+
+    def __init__(self, reservas_df, gestion_df=None, credentials_df=None, fetch_latency=0, upload_latency=0):
+        self._lock = threading.Lock()
+        if gestion_df is None:
+            gestion_df = pd.DataFrame(columns=GESTION_COLUMNS)
+        if credentials_df is None:
+            credentials_df = pd.DataFrame({'usuario': ['demo'], 'clave': ['demo']})
+        self._sheets = (credentials_df, compact_reservas(reservas_df), compact_gestion(gestion_df))
+        self.fetch_latency = fetch_latency
+        self.upload_latency = upload_latency
+        self.fetches = 0
+        self.uploads = 0
+
+    @property
+    def reservas(self):
+        return self._sheets[1]
+
+    @property
+    def gestion(self):
+        return self._sheets[2]
+
+    def fetch(self):
+        time.sleep(self.fetch_latency)
+        with self._lock:
+            self.fetches += 1
+            return tuple(df.copy() for df in self._sheets)
+
+    def push(self, credentials_df, reservas_df, gestion_df):
+        time.sleep(self.upload_latency)
+        with self._lock:
+            self.uploads += 1
+            self._sheets = (credentials_df, reservas_df, compact_gestion(gestion_df))
+
+
+def make_reservas(rows):
+    """proveedor_reservas from (orden, proveedor, bultos, 'YYYY-MM-DD', 'HH:MM - HH:MM') tuples"""
+    reservas_df = pd.DataFrame(rows, columns=['Orden_de_compra', 'Proveedor', 'Numero_de_bultos', 'Fecha', 'Hora'])
+    reservas_df['Fecha'] = pd.to_datetime(reservas_df['Fecha'])
+    return reservas_df
+
+
+def make_gestion(rows):
+    """Completed proveedor_gestion records from (orden, proveedor, llegada, espera, atencion, retraso) tuples"""
+    gestion_df = pd.DataFrame(rows, columns=[
+        'Orden_de_compra', 'Proveedor', 'Hora_llegada', 'Tiempo_espera', 'Tiempo_atencion', 'Tiempo_retraso',
+    ])
+    llegada = pd.to_datetime(gestion_df['Hora_llegada'])
+    inicio = llegada + pd.to_timedelta(gestion_df['Tiempo_espera'], unit='min')
+    gestion_df = gestion_df.assign(
+        Numero_de_bultos=10,
+        Hora_llegada=llegada,
+        Hora_inicio_atencion=inicio,
+        Hora_fin_atencion=inicio + pd.to_timedelta(gestion_df['Tiempo_atencion'], unit='min'),
+        Tiempo_total=gestion_df['Tiempo_espera'] + gestion_df['Tiempo_atencion'],
+        numero_de_semana=llegada.dt.isocalendar().week.to_numpy(),
+        hora_de_reserva=llegada.dt.hour,
+    )
+    return compact_gestion(gestion_df[GESTION_COLUMNS])
@@ -0,0 +1,133 @@
+import bisect
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from journal import EVENT_ARRIVAL, EVENT_SERVICE
+
+DEFAULT_SERVICE_MINUTES = 30  # Assumed unloading time before there is any history
+
+
+def _timestamp(value):
+    """Value as a datetime, None when missing or unreadable"""
+    value = pd.to_datetime(value, errors='coerce')
+    return None if pd.isna(value) else value.to_pydatetime()
+
+
+def _median(values):
+    """Median of a sorted list, as ``Series.median`` computes it"""
+    middle = len(values) // 2
+    if len(values) % 2:
+        return float(values[middle])
+    return (values[middle - 1] + values[middle]) / 2
+
+
+class DockOccupancy:
+    """Trucks on site right now, kept up to date event by event
+
+    Only today's unfinished records are held (tens of trucks), keyed by
+    order: a full scan of gestion happens when a new snapshot is loaded,
+    while arrivals and services registered in between are applied one by
+    one. Whether a truck is waiting, being served or gone is decided when
+    the board is read, since service times are registered ahead of time.
+    The sorted service minutes of the history are kept alongside, so the
+    typical service time follows the registrations too.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._source = None  # Gestion frame the board reflects
+        self._day = None
+        self._trucks = {}    # orden -> [provider, arrival, service start, service end]
+        self._service_times = []  # Sorted service minutes of the whole history
+
+    def is_current(self, gestion_df, now=None):
+        """True when the board reflects this snapshot and today's date"""
+        now = now or datetime.now()
+        return self._source is gestion_df and self._day == now.date()
+
+    def rebuild(self, gestion_df, now=None):
+        """Replace the board with today's unfinished records of a snapshot"""
+        now = now or datetime.now()
+        arrival = pd.to_datetime(gestion_df['Hora_llegada'], errors='coerce', format='mixed')
+        start = pd.to_datetime(gestion_df['Hora_inicio_atencion'], errors='coerce', format='mixed')
+        end = pd.to_datetime(gestion_df['Hora_fin_atencion'], errors='coerce', format='mixed')
+        on_site = (arrival.dt.date == now.date()) & (end.isna() | (end > now))
+
+        trucks = {
+            str(orden): [provider, _timestamp(a), _timestamp(s), _timestamp(e)]
+            for orden, provider, a, s, e in zip(
+                gestion_df['Orden_de_compra'][on_site], gestion_df['Proveedor'][on_site],
+                arrival[on_site], start[on_site], end[on_site]
+            )
+        }
+        service = pd.to_numeric(gestion_df['Tiempo_atencion'], errors='coerce').dropna()
+        service_times = sorted(service.astype(float).tolist())
+
+        with self._lock:
+            self._trucks = trucks
+            self._day = now.date()
+            self._service_times = service_times
+            self._source = gestion_df
+
+    def advance(self, base_gestion_df, gestion_df, events):
+        """Apply (event_type, orden, payload) events that turned one snapshot into the next
+
+        Ignored unless the board reflects ``base_gestion_df``; the next read
+        then rebuilds it from the new snapshot.
+        """
+        with self._lock:
+            if self._source is not base_gestion_df:
+                return
+            for event_type, orden, payload in events:
+                self._apply(event_type, str(orden), payload)
+            self._source = gestion_df
+
+    def _apply(self, event_type, orden, payload):
+        if event_type == EVENT_ARRIVAL:
+            arrival = _timestamp(payload.get('Hora_llegada'))
+            if arrival is None or arrival.date() != self._day:
+                self._trucks.pop(orden, None)
+                return
+            truck = self._trucks.setdefault(orden, [payload.get('Proveedor'), None, None, None])
+            truck[1] = arrival
+        elif event_type == EVENT_SERVICE:
+            minutes = pd.to_numeric(payload.get('Tiempo_atencion'), errors='coerce')
+            if pd.notna(minutes):
+                bisect.insort(self._service_times, float(minutes))
+            truck = self._trucks.get(orden)
+            if truck is not None:
+                truck[2] = _timestamp(payload.get('Hora_inicio_atencion'))
+                truck[3] = _timestamp(payload.get('Hora_fin_atencion'))
+
+    def status(self, bays, now=None):
+        """Counts of the board at ``now``
+
+        The projected backlog is the time the docks need to clear every
+        truck on site: what remains of the services under way plus a
+        typical (median) service per waiting truck, shared among ``bays``.
+        """
+        now = now or datetime.now()
+        with self._lock:
+            trucks = [truck for truck in self._trucks.values() if truck[3] is None or truck[3] > now]
+            service_minutes = _median(self._service_times) if self._service_times else DEFAULT_SERVICE_MINUTES
+
+        waits = [
+            (now - arrival).total_seconds() / 60
+            for _, arrival, start, _ in trucks
+            if arrival is not None and arrival <= now and (start is None or start > now)
+        ]
+        remaining = [
+            (end - now).total_seconds() / 60 if end is not None
+            else max(service_minutes - (now - start).total_seconds() / 60, 0)
+            for _, _, start, end in trucks
+            if start is not None and start <= now
+        ]
+        backlog = (sum(remaining) + len(waits) * service_minutes) / max(bays, 1)
+        return {
+            'waiting': len(waits),
+            'in_service': len(remaining),
+            'longest_wait': max(waits, default=0),
+            'backlog': backlog,
+        }
@@ -0,0 +1,108 @@
+import unicodedata
+
+import numpy as np
+
+ORDER_SEARCH_LIMIT = 20  # Matches sent to the picker
+_MAX_CHAR = '\U0010ffff'
+
+
+def normalize(text):
+    """Lowercase text without accents, for matching what the user types"""
+    decomposed = unicodedata.normalize('NFKD', str(text).strip().lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+class OrderPrefixIndex:
+    """Sorted prefix index over order numbers and provider names
+
+    Every order is indexed under its number and under each word of its
+    provider's name. Keys are sorted once, so the orders starting with a
+    prefix are the slice between two binary searches. Several terms
+    ("acme 4500") must all match. Orders not in the index, such as today's
+    arrivals booked for another day, can still be searched as ``allowed``
+    extras by a linear scan over that short list.
+    """
+
+    def __init__(self, reservas_df):
+        rows = reservas_df.drop_duplicates('Orden_de_compra')
+        rows = rows.iloc[np.argsort(rows['Orden_de_compra'].astype(str).to_numpy(), kind='stable')]
+        self._orders = rows['Orden_de_compra'].astype(str).to_numpy()
+        self._providers = rows['Proveedor'].astype(str).to_numpy()
+        self._hours = rows['Hora'].fillna('').astype(str).to_numpy() if 'Hora' in rows.columns else None
+        self._row_of = {orden: i for i, orden in enumerate(self._orders)}
+        self._row_of_key = {normalize(orden): i for i, orden in enumerate(self._orders)}
+
+        keys, owners = [], []
+        for i, (orden, provider) in enumerate(zip(self._orders, self._providers)):
+            keys.append(normalize(orden))
+            owners.append(i)
+            for word in normalize(provider).split():
+                keys.append(word)
+                owners.append(i)
+        keys = np.array(keys, dtype=str)
+        order = np.argsort(keys, kind='stable')
+        self._keys = keys[order]
+        self._owners = np.array(owners, dtype='int64')[order]
+
+    def __len__(self):
+        return len(self._orders)
+
+    def label(self, orden):
+        """'4500123 · Proveedor · 10:00 - 11:00' for the picker"""
+        i = self._row_of.get(orden)
+        if i is None:
+            return orden
+        parts = [orden, self._providers[i]]
+        if self._hours is not None and self._hours[i].strip():
+            parts.append(self._hours[i].strip())
+        return ' · '.join(parts)
+
+    def _rows_with_prefix(self, term):
+        """Mask of the orders with a key starting with ``term``"""
+        lo = np.searchsorted(self._keys, term, side='left')
+        hi = np.searchsorted(self._keys, term + _MAX_CHAR, side='left')
+        mask = np.zeros(len(self._orders), dtype=bool)
+        mask[self._owners[lo:hi]] = True
+        return mask
+
+    def search(self, query, allowed=None, limit=ORDER_SEARCH_LIMIT):
+        """(up to ``limit`` matching orders, number of matches)
+
+        Matches are sorted by order number, except that an order typed in
+        full (a scanned barcode) comes first. ``allowed`` restricts the
+        result to those orders.
+        """
+        terms = normalize(query).split()
+        mask = np.ones(len(self._orders), dtype=bool)
+        for term in terms:
+            mask &= self._rows_with_prefix(term)
+
+        extras = []
+        if allowed is not None:
+            allowed_mask = np.zeros(len(self._orders), dtype=bool)
+            for orden in allowed:
+                i = self._row_of.get(orden)
+                if i is None:
+                    # Orders the index doesn't know about are matched one by one
+                    if all(normalize(orden).startswith(term) for term in terms):
+                        extras.append(orden)
+                else:
+                    allowed_mask[i] = True
+            mask &= allowed_mask
+
+        rows = np.flatnonzero(mask)
+        total = len(rows) + len(extras)
+        if extras:
+            matches = sorted(self._orders[rows].tolist() + extras)
+        else:
+            # Rows are in order-number order: only the top ones are converted
+            matches = self._orders[rows[:limit]].tolist()
+
+        if len(terms) == 1:
+            exact = self._row_of_key.get(terms[0])
+            if exact is not None and mask[exact]:
+                orden = self._orders[exact]
+                if orden in matches:
+                    matches.remove(orden)
+                matches.insert(0, orden)
+        return matches[:limit], total
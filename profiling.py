@@ -0,0 +1,111 @@
+import cProfile
+import marshal
+import os
+import pstats
+import tracemalloc
+
+import pandas as pd
+
+TRACEMALLOC_FRAMES = 10  # Stack depth kept per allocation while tracing
+
+# Allocations made by the tracing machinery itself
+_IGNORED_TRACES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def profile_call(func, *args, **kwargs):
+    """Run ``func`` under cProfile; returns (result, profiler)"""
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    return result, profiler
+
+
+def _short_path(filename):
+    """Path relative to the app or to site-packages, for readable tables"""
+    for root in (os.path.dirname(os.path.abspath(__file__)), 'site-packages'):
+        if root in filename:
+            return filename.split(root, 1)[1].lstrip(os.sep)
+    return filename
+
+
+def hotspots(profiler, limit=30, sort='cumulative'):
+    """Top functions of a profile as a table, sorted by 'cumulative' or 'self' time"""
+    stats = pstats.Stats(profiler).stats
+    rows = [
+        {
+            'Función': name if filename == '~' else f"{_short_path(filename)}:{line}({name})",
+            'Llamadas': calls,
+            'Tiempo propio (ms)': round(self_time * 1000, 1),
+            'Tiempo acumulado (ms)': round(cumulative * 1000, 1),
+        }
+        for (filename, line, name), (_, calls, self_time, cumulative, _) in stats.items()
+    ]
+    column = 'Tiempo propio (ms)' if sort == 'self' else 'Tiempo acumulado (ms)'
+    return pd.DataFrame(rows).sort_values(column, ascending=False).head(limit).reset_index(drop=True)
+
+
+def profile_bytes(profiler):
+    """The profile in pstats format (what ``Stats.dump_stats`` writes)
+
+    Open it with ``python -m pstats file.prof`` or snakeviz.
+    """
+    return marshal.dumps(pstats.Stats(profiler).stats)
+
+
+def start_memory_tracing():
+    """Start tracing allocations process-wide (idempotent)
+
+    Only allocations made after this are seen: reload the snapshot once
+    tracing is on to measure it. Tracing slows every allocation down.
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+
+
+def stop_memory_tracing():
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def take_memory_snapshot():
+    """Current traced allocations, None when tracing is off"""
+    if not tracemalloc.is_tracing():
+        return None
+    return tracemalloc.take_snapshot().filter_traces(_IGNORED_TRACES)
+
+
+def memory_top(snapshot, previous=None, limit=20, group_by='lineno'):
+    """Largest live allocations by source line, or their growth since ``previous``"""
+    if previous is not None:
+        stats = snapshot.compare_to(previous, group_by)
+        rows = [
+            {
+                'Ubicación': _short_path(str(stat.traceback[0])),
+                'MB': round(stat.size / 2**20, 2),
+                'Δ MB': round(stat.size_diff / 2**20, 2),
+                'Bloques': stat.count,
+            }
+            for stat in stats[:limit]
+        ]
+    else:
+        rows = [
+            {
+                'Ubicación': _short_path(str(stat.traceback[0])),
+                'MB': round(stat.size / 2**20, 2),
+                'Bloques': stat.count,
+            }
+            for stat in snapshot.statistics(group_by)[:limit]
+        ]
+    return pd.DataFrame(rows)
+
+
+def traced_memory_mb():
+    """(current, peak) traced MB, or None when tracing is off"""
+    if not tracemalloc.is_tracing():
+        return None
+    current, peak = tracemalloc.get_traced_memory()
+    return current / 2**20, peak / 2**20
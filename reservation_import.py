@@ -0,0 +1,242 @@
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from schema import compact_reservas
+from xlsx_io import open_workbook_streaming, read_sheet
+
+IMPORT_COLUMNS = ['Orden_de_compra', 'Proveedor', 'Numero_de_bultos', 'Fecha', 'Hora']
+
+# 'HH:MM', 'HH:MM:SS' or a range 'HH:MM - HH:MM' ('.' or 'h' also separate hours)
+_HORA_PATTERN = (
+    r'^\s*(\d{1,2})[:.h](\d{2})(?::\d{2})?'
+    r'(?:\s*-\s*(\d{1,2})[:.h](\d{2})(?::\d{2})?)?\s*$'
+)
+
+
+def _header_key(name):
+    """Column name without case, accents, spaces or dashes"""
+    decomposed = unicodedata.normalize('NFKD', str(name).strip().lower())
+    text = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ''.join(c for c in text if c.isalnum())
+
+
+_HEADER_ALIASES = {_header_key(column): column for column in IMPORT_COLUMNS}
+_HEADER_ALIASES.update({'oc': 'Orden_de_compra', 'orden': 'Orden_de_compra', 'bultos': 'Numero_de_bultos'})
+
+
+def read_reservations_batch(file, filename):
+    """Rows of an uploaded CSV or xlsx batch (a binary file object), all as text
+
+    xlsx files are read from their 'proveedor_reservas' sheet when there is
+    one, otherwise from the first sheet. CSV files may use ',' or ';'.
+    """
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        with open_workbook_streaming(file) as workbook:
+            names = workbook.sheetnames
+            sheet = "proveedor_reservas" if "proveedor_reservas" in names else names[0]
+            batch_df = read_sheet(workbook, sheet, dtype=str)
+    elif filename.lower().endswith('.csv'):
+        batch_df = pd.read_csv(
+            file, dtype=str, sep=None, engine='python',
+            encoding='utf-8-sig', skip_blank_lines=True
+        )
+    else:
+        raise ValueError("Formato no soportado: suba un archivo .csv o .xlsx")
+
+    batch_df = batch_df.rename(columns=lambda c: _HEADER_ALIASES.get(_header_key(c), c))
+    missing = [c for c in IMPORT_COLUMNS if c not in batch_df.columns]
+    if missing:
+        raise ValueError(f"Faltan columnas en el archivo: {', '.join(missing)}")
+    return batch_df[IMPORT_COLUMNS].dropna(how='all').reset_index(drop=True)
+
+
+def normalize_hora(values):
+    """'Hora' values as 'HH:MM' or 'HH:MM - HH:MM'; NaN when unreadable"""
+    parts = pd.Series(values, dtype=object).astype(str).str.extract(_HORA_PATTERN)
+    numbers = parts.apply(pd.to_numeric, errors='coerce')
+    start_ok = (numbers[0] < 24) & (numbers[1] < 60)
+    has_end = numbers[2].notna()
+    end_ok = (numbers[2] < 24) & (numbers[3] < 60)
+
+    def fmt(hours, minutes):
+        return hours.astype('Int64').astype(str).str.zfill(2) + ':' + minutes.astype('Int64').astype(str).str.zfill(2)
+
+    start = fmt(numbers[0].where(start_ok, 0), numbers[1].where(start_ok, 0))
+    end = fmt(numbers[2].where(end_ok, 0), numbers[3].where(end_ok, 0))
+    hora = start.where(~has_end, start + ' - ' + end)
+    return hora.where(start_ok & (~has_end | end_ok)).to_numpy(dtype=object)
+
+
+def normalize_fecha(values):
+    """'Fecha' values as midnight timestamps (NaT when unreadable)
+
+    ISO dates are read as such; anything else is read day first, as
+    Spanish-locale Excel writes them.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.normalize()
+    text = values.astype(str).str.strip()
+    iso = pd.to_datetime(text, errors='coerce', format='ISO8601')
+    local = pd.to_datetime(text, errors='coerce', dayfirst=True, format='mixed')
+    return iso.fillna(local).dt.normalize()
+
+
+def normalize_batch(batch_df):
+    """Validated batch rows and the rejected ones, both with a 'Fila' column
+
+    'Fila' is the row number in the file (the header is row 1). Rejected
+    rows carry a 'Motivo'. An order appearing more than once in the file
+    is rejected every time, since it's unclear which booking is right.
+    """
+    orders = batch_df['Orden_de_compra'].astype(str).str.strip()
+    orders = orders.str.replace(r'\.0$', '', regex=True).where(batch_df['Orden_de_compra'].notna())
+    providers = batch_df['Proveedor'].astype(str).str.strip().where(batch_df['Proveedor'].notna())
+    bultos = pd.to_numeric(batch_df['Numero_de_bultos'], errors='coerce')
+    normalized = pd.DataFrame({
+        'Fila': np.arange(len(batch_df)) + 2,
+        'Orden_de_compra': orders,
+        'Proveedor': providers,
+        'Numero_de_bultos': bultos.round().astype('Int32'),
+        'Fecha': normalize_fecha(batch_df['Fecha']),
+        'Hora': normalize_hora(batch_df['Hora']),
+    })
+
+    # First failing check of each row, in order of importance
+    checks = [
+        (orders.isna() | (orders == ''), "Falta la orden de compra"),
+        (orders.duplicated(keep=False), "Orden repetida en el archivo"),
+        (providers.isna() | (providers == ''), "Falta el proveedor"),
+        (bultos.isna() | (bultos <= 0), "Número de bultos inválido"),
+        (normalized['Fecha'].isna(), "Fecha inválida"),
+        (pd.isna(normalized['Hora']), "Hora inválida"),
+    ]
+    reason = pd.Series(np.nan, index=batch_df.index, dtype=object)
+    for failed, message in checks:
+        reason = reason.where(reason.notna() | ~failed.to_numpy(), message)
+
+    rejected = normalized[reason.notna()].assign(Motivo=reason[reason.notna()])
+    return normalized[reason.isna()].reset_index(drop=True), rejected.reset_index(drop=True)
+
+
+class ReservationImport:
+    """Upsert plan of a validated batch into the reservas sheet
+
+    With ``slot_capacity``, bookings over that many per date and hour are rejected.
+    """
+
+    def __init__(self, batch_df, reservas_df, slot_capacity=None, rejected=None):
+        existing_orders = reservas_df['Orden_de_compra'].astype(str).to_numpy()
+        # Position of the last row of each existing order
+        last = pd.Series(np.arange(len(reservas_df)), index=existing_orders)
+        last = last[~last.index.duplicated(keep='last')]
+        positions = last.index.get_indexer(batch_df['Orden_de_compra'])
+
+        matched = positions >= 0
+        changed = ~matched
+        if matched.any():
+            current = self._comparable(reservas_df.iloc[positions[matched]])
+            proposed = batch_df.loc[matched, IMPORT_COLUMNS].reset_index(drop=True)
+            differs = np.zeros(matched.sum(), dtype=bool)
+            for column in IMPORT_COLUMNS[1:]:
+                a = current[column].astype(object)
+                b = proposed[column].astype(object)
+                differs |= ~((a == b) | (a.isna() & b.isna())).to_numpy(dtype=bool)
+            changed[matched] = differs
+
+        batch_df = batch_df.assign(_position=positions)
+        self.unchanged = int((~changed).sum())
+        candidates = batch_df[changed]
+        over_capacity = self._over_capacity(candidates, reservas_df, slot_capacity)
+        overbooked = candidates[over_capacity].drop(columns='_position').assign(Motivo="Hora completa")
+        accepted = candidates[~over_capacity]
+
+        self.inserts = accepted[accepted['_position'] < 0].drop(columns='_position')
+        self.updates = accepted[accepted['_position'] >= 0]
+
+        rejected_parts = [frame for frame in (rejected, overbooked) if frame is not None and not frame.empty]
+        if rejected_parts:
+            self.rejected = pd.concat(rejected_parts, ignore_index=True).sort_values('Fila', ignore_index=True)
+        else:
+            self.rejected = pd.DataFrame(columns=['Fila', *IMPORT_COLUMNS, 'Motivo'])
+
+    @staticmethod
+    def _comparable(rows):
+        """Existing rows normalized like batch rows"""
+        return pd.DataFrame({
+            'Proveedor': rows['Proveedor'].astype(str).str.strip().where(rows['Proveedor'].notna()).to_numpy(),
+            'Numero_de_bultos': pd.to_numeric(rows['Numero_de_bultos'], errors='coerce').round().astype('Int32').to_numpy(),
+            'Fecha': normalize_fecha(rows['Fecha']).to_numpy(),
+            'Hora': normalize_hora(rows['Hora']),
+        })
+
+    @staticmethod
+    def _over_capacity(candidates, reservas_df, slot_capacity):
+        """Mask of the candidate rows that don't fit in their hour"""
+        if not slot_capacity or candidates.empty:
+            return np.zeros(len(candidates), dtype=bool)
+
+        def slots(fecha, hora):
+            # Rows without a date hold no slot (None isn't counted)
+            hours = pd.Series(hora, dtype=object).astype(str).str.extract(r'^(\d{2})')[0]
+            known = fecha.notna().to_numpy()
+            keys = np.full(len(known), None, dtype=object)
+            keys[known] = (fecha[known].dt.strftime('%Y-%m-%d').to_numpy(dtype=object) + ' '
+                           + hours.fillna('').to_numpy(dtype=object)[known])
+            return keys
+
+        # Existing bookings that stay where they are (updated rows move)
+        keep = np.ones(len(reservas_df), dtype=bool)
+        keep[candidates['_position'][candidates['_position'] >= 0].to_numpy()] = False
+        staying = reservas_df[keep]
+        booked = pd.Series(
+            slots(normalize_fecha(staying['Fecha']), normalize_hora(staying['Hora']))
+        ).value_counts()
+
+        slot = pd.Series(slots(candidates['Fecha'].reset_index(drop=True), candidates['Hora'].to_numpy()))
+        rank = slot.groupby(slot).cumcount().to_numpy()
+        already = slot.map(booked).fillna(0).to_numpy()
+        return already + rank >= slot_capacity
+
+    @property
+    def changed(self):
+        return len(self.inserts) + len(self.updates)
+
+    def summary(self):
+        return {
+            'Nuevas': len(self.inserts),
+            'Modificadas': len(self.updates),
+            'Sin cambios': self.unchanged,
+            'Rechazadas': len(self.rejected),
+        }
+
+    def apply(self, reservas_df):
+        """reservas_df with the updated rows replaced and the new ones appended
+
+        Columns of the sheet that the import doesn't know are kept as they
+        were on updated rows and left empty on new ones.
+        """
+        if not self.changed:
+            return reservas_df
+        result = reservas_df.copy()
+        positions = self.updates['_position'].to_numpy()
+        for column in IMPORT_COLUMNS[1:]:
+            if column in result.columns:
+                values = result[column].astype(object).to_numpy(copy=True)
+            else:
+                values = np.full(len(result), np.nan, dtype=object)
+            values[positions] = self.updates[column].astype(object).to_numpy()
+            result[column] = values
+        if not self.inserts.empty:
+            result = pd.concat([result, self.inserts[IMPORT_COLUMNS]], ignore_index=True)
+        # Existing dates may be text; don't mix them with the imported timestamps
+        result['Fecha'] = normalize_fecha(result['Fecha'])
+        return compact_reservas(result)
+
+
+def plan_import(batch_df, reservas_df, slot_capacity=None):
+    """Validate a raw batch and plan its upsert into reservas_df"""
+    valid, rejected = normalize_batch(batch_df)
+    return ReservationImport(valid, reservas_df, slot_capacity, rejected)
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+# Column -> compact dtype for each sheet. "minutes" are nullable integers
+# downcast to the smallest type that holds the values.
+GESTION_SCHEMA = {
+    'Orden_de_compra': 'str',
+    'Proveedor': 'category',
+    'Numero_de_bultos': 'Int32',
+    'Hora_llegada': 'datetime',
+    'Hora_inicio_atencion': 'datetime',
+    'Hora_fin_atencion': 'datetime',
+    'Tiempo_espera': 'minutes',
+    'Tiempo_atencion': 'minutes',
+    'Tiempo_total': 'minutes',
+    'Tiempo_retraso': 'minutes',
+    'numero_de_semana': 'Int8',
+    'hora_de_reserva': 'Int8',
+}
+
+GESTION_COLUMNS = list(GESTION_SCHEMA)
+
+RESERVAS_SCHEMA = {
+    'Orden_de_compra': 'str',
+    'Proveedor': 'category',
+    'Numero_de_bultos': 'Int32',
+}
+
+# Nullable integer types from narrowest to widest
+_INT_LADDER = ['Int8', 'Int16', 'Int32', 'Int64']
+
+
+def _text_value(value):
+    """Cell value as text, without the '.0' Excel adds to numeric ids"""
+    if isinstance(value, str):
+        return value
+    if pd.isna(value):
+        return np.nan
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _to_text(series):
+    """Column as text; blanks stay NaN"""
+    return series.astype(object).map(_text_value)
+
+
+def _to_nullable_int(series, dtype):
+    """Nullable integer of at least ``dtype`` width, widened if values don't fit"""
+    values = pd.to_numeric(series, errors='coerce').round()
+    start = _INT_LADDER.index(dtype)
+    for candidate in _INT_LADDER[start:]:
+        info = np.iinfo(candidate.lower())
+        if values.isna().all() or (values.min() >= info.min and values.max() <= info.max):
+            return values.astype(candidate)
+    return values.astype('Int64')
+
+
+def _convert(series, kind):
+    """Convert one column to the schema kind"""
+    if kind == 'str':
+        return _to_text(series)
+    if kind == 'category':
+        return series.astype('category')
+    if kind == 'datetime':
+        return pd.to_datetime(series, errors='coerce', format='mixed')
+    if kind == 'minutes':
+        return _to_nullable_int(series, 'Int16')
+    return _to_nullable_int(series, kind)
+
+
+def apply_schema(df, schema):
+    """Return ``df`` with the columns in ``schema`` converted to compact dtypes
+
+    Columns not present in the frame are ignored; columns already of the
+    target dtype are left untouched, so this is cheap to call repeatedly.
+    """
+    if df is None:
+        return df
+
+    converted = {}
+    for column, kind in schema.items():
+        if column not in df.columns:
+            continue
+        series = df[column]
+        if kind == 'category' and isinstance(series.dtype, pd.CategoricalDtype):
+            continue
+        if kind == 'datetime' and pd.api.types.is_datetime64_dtype(series):
+            continue
+        if kind not in ('str', 'category', 'datetime') and str(series.dtype) in _INT_LADDER:
+            continue
+        converted[column] = _convert(series, kind)
+
+    if not converted:
+        return df
+    return df.assign(**converted)
+
+
+def compact_gestion(gestion_df):
+    """Gestion sheet with compact dtypes"""
+    return apply_schema(gestion_df, GESTION_SCHEMA)
+
+
+def compact_reservas(reservas_df):
+    """Reservas sheet with compact dtypes"""
+    return apply_schema(reservas_df, RESERVAS_SCHEMA)
+
+
+def memory_report(sheets):
+    """Per-sheet memory usage vs. the same data held as plain Python objects"""
+    rows = []
+    for sheet_name, df in sheets.items():
+        if df is None:
+            continue
+        compact_bytes = int(df.memory_usage(deep=True).sum())
+        object_bytes = int(df.astype(object).memory_usage(deep=True).sum())
+        rows.append({
+            'Hoja': sheet_name,
+            'Filas': len(df),
+            'MB (objetos)': round(object_bytes / 2**20, 2),
+            'MB (compacto)': round(compact_bytes / 2**20, 2),
+            'Reducción': f"{object_bytes / compact_bytes:.1f}x" if compact_bytes else '-',
+        })
+    return pd.DataFrame(rows)
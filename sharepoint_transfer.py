@@ -0,0 +1,142 @@
+import tempfile
+import time
+import uuid
+
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024       # Read the HTTP stream 1 MB at a time
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024     # Upload session fragment size
+SPOOL_MAX_BYTES = 16 * 1024 * 1024       # Larger downloads spill to a temp file
+MAX_ATTEMPTS = 4
+RETRY_BACKOFF_SECONDS = 1.0
+
+
+class TransferError(Exception):
+    """A download or upload failed after all retries"""
+
+
+def _retry(action, description, max_attempts=MAX_ATTEMPTS, ctx=None):
+    """Run ``action(attempt)`` with exponential backoff between failures"""
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return action(attempt)
+        except Exception as e:
+            if ctx is not None:
+                # Drop queries left behind by the failed request
+                ctx.clear()
+            if attempt == max_attempts:
+                raise TransferError(f"{description} failed after {attempt} attempts: {e}") from e
+            time.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+
+def download_to_spool(ctx, file, expected_size=None, chunk_size=DOWNLOAD_CHUNK_BYTES,
+                      spool_max_size=SPOOL_MAX_BYTES, max_attempts=MAX_ATTEMPTS):
+    """Stream a SharePoint file into a spooled temp file and return it rewound
+
+    Small files stay in memory, large ones spill to disk, so the workbook is
+    never held twice. A dropped connection resumes from the bytes already
+    received with an HTTP Range request (or restarts if Range is ignored).
+    """
+    from office365.runtime.http.http_method import HttpMethod
+    from office365.runtime.queries.service_operation import ServiceOperationQuery
+
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_max_size)
+
+    def _download(attempt):
+        offset = spool.tell()
+        qry = ServiceOperationQuery(file, "$value")
+
+        def _construct_request(request):
+            request.stream = True
+            request.method = HttpMethod.Get
+            if offset:
+                request.headers["Range"] = f"bytes={offset}-"
+
+        def _process_response(response):
+            response.raise_for_status()
+            if offset and response.status_code != 206:
+                # Server ignored the Range header: start over
+                spool.seek(0)
+                spool.truncate()
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                spool.write(chunk)
+
+        ctx.add_query(qry).before_query_execute(_construct_request).after_execute(_process_response)
+        ctx.execute_query()
+
+        if expected_size is not None and spool.tell() < expected_size:
+            raise IOError(f"Incomplete download: {spool.tell()} of {expected_size} bytes")
+
+    _retry(_download, "Download", max_attempts, ctx)
+    spool.seek(0)
+    return spool
+
+
+def upload_in_chunks(ctx, file, data, chunk_size=UPLOAD_CHUNK_BYTES, max_attempts=MAX_ATTEMPTS):
+    """Overwrite an existing SharePoint file through a chunked upload session
+
+    ``data`` is any bytes-like object; fragments are sliced from a memoryview
+    so only one chunk is copied at a time. Each fragment is retried on its
+    own, and the file content only changes when the session is finished, so
+    a failed upload leaves the previous workbook intact.
+    """
+    view = memoryview(data)
+    total = len(view)
+    upload_id = str(uuid.uuid4())
+    offset = 0
+
+    try:
+        def _start(attempt):
+            result = file.start_upload(upload_id, bytes(view[:chunk_size]))
+            ctx.execute_query()
+            return result.value
+
+        offset = _retry(_start, "Upload start", max_attempts, ctx)
+
+        while total - offset > chunk_size:
+            def _continue(attempt, offset=offset):
+                result = file.continue_upload(upload_id, offset, bytes(view[offset:offset + chunk_size]))
+                ctx.execute_query()
+                return result.value
+
+            offset = _retry(_continue, f"Upload at byte {offset}", max_attempts, ctx)
+
+        def _finish(attempt):
+            file.finish_upload(upload_id, offset, bytes(view[offset:]))
+            ctx.execute_query()
+
+        _retry(_finish, "Upload finish", max_attempts, ctx)
+
+    except TransferError:
+        try:
+            file.cancel_upload(upload_id)
+            ctx.execute_query()
+        except Exception:
+            ctx.clear()
+        raise
+    finally:
+        view.release()
+
+
+def upload_workbook(ctx, file, buffer, chunk_size=UPLOAD_CHUNK_BYTES, max_attempts=MAX_ATTEMPTS):
+    """Replace ``file`` (loaded with Name/ServerRelativeUrl) with ``buffer``'s content
+
+    Small workbooks go in a single request; larger ones use an upload session.
+    ``buffer`` is a BytesIO, whose memory is shared instead of copied.
+    """
+    data = buffer.getbuffer()
+    try:
+        if len(data) > chunk_size:
+            upload_in_chunks(ctx, file, data, chunk_size, max_attempts)
+            return
+
+        file_name = file.properties['Name']
+        server_relative_url = file.properties['ServerRelativeUrl']
+        folder_url = server_relative_url.replace('/' + file_name, '')
+        folder = ctx.web.get_folder_by_server_relative_url(folder_url)
+
+        def _add(attempt):
+            folder.files.add(file_name, bytes(data), True)
+            ctx.execute_query()
+
+        _retry(_add, "Upload", max_attempts, ctx)
+    finally:
+        data.release()
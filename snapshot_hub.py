@@ -0,0 +1,152 @@
+import threading
+import time
+
+
+class SnapshotHub:
+    """In-process shared copy of the workbook with a version counter
+
+    Loads are single-flight and, once a snapshot exists, happen in the
+    background. ``rebase`` re-applies local commits to every fresh copy.
+    """
+
+    def __init__(self, loader, ttl=300, retry_delay=30, rebase=None):
+        self._loader = loader
+        self._rebase = rebase
+        self._ttl = ttl
+        self._retry_delay = retry_delay
+        self._cond = threading.Condition()
+        self._frames = None
+        self._expires_at = 0.0  # Counted from the last remote copy, not local commits
+        self._version = 0
+        self._remote_version = 0  # Fresh remote copies published so far
+        self._loading = False
+        self._last_error = None
+        self._last_refresh_request = float('-inf')
+
+    @property
+    def version(self):
+        """Current snapshot version (cheap to poll)"""
+        return self._version
+
+    @property
+    def last_error(self):
+        """Error of the last failed load, None after a successful one"""
+        return self._last_error
+
+    @property
+    def is_loading(self):
+        """True while a download is in flight"""
+        return self._loading
+
+    def is_stale(self):
+        """True when there is no snapshot or it has expired"""
+        return self._frames is None or time.monotonic() >= self._expires_at
+
+    def get(self):
+        """Return (credentials_df, reservas_df, gestion_df), loading if needed"""
+        return self.get_versioned()[1]
+
+    def get_versioned(self):
+        """Return (version, frames) taken atomically
+
+        Without a snapshot the caller blocks until the single in-flight load
+        finishes (and gets its error if it fails). With an expired snapshot
+        a background reload is started and the old snapshot is returned.
+        """
+        with self._cond:
+            if self._frames is not None:
+                if self.is_stale():
+                    self._start_background_load()
+                return self._version, self._frames
+
+            if self._loading:
+                # Another thread is already downloading: wait for its result
+                self._cond.wait_for(lambda: not self._loading)
+                if self._frames is None:
+                    raise self._last_error or RuntimeError("Snapshot load failed")
+                return self._version, self._frames
+
+            self._loading = True
+
+        # This thread is the only loader; download outside the lock
+        self._load()
+        with self._cond:
+            if self._frames is None:
+                raise self._last_error or RuntimeError("Snapshot load failed")
+            return self._version, self._frames
+
+    def prewarm(self):
+        """Start loading in a background thread so the first session doesn't wait"""
+        with self._cond:
+            if self.is_stale():
+                self._start_background_load()
+
+    def request_refresh(self, min_interval=0):
+        """Reload in the background; False if debounced or already loading"""
+        with self._cond:
+            now = time.monotonic()
+            if self._loading or now - self._last_refresh_request < min_interval:
+                return False
+            self._last_refresh_request = now
+            return self._start_background_load()
+
+    def publish(self, credentials_df, reservas_df, gestion_df):
+        """Replace the shared snapshot with a fresh copy of the remote workbook"""
+        with self._cond:
+            self._set_remote_frames((credentials_df, reservas_df, gestion_df))
+
+    def update(self, change):
+        """Atomically replace the snapshot with ``change(frames)`` and publish it
+
+        ``change`` runs under the hub lock, so concurrent commits from
+        different sessions are applied one after the other. If it raises,
+        or returns the frames it was given, the snapshot is left untouched.
+        """
+        self.get()
+        with self._cond:
+            frames = change(self._frames)
+            if frames is not self._frames:
+                self._set_frames(frames)
+            return self._version
+
+    def _start_background_load(self):
+        """Spawn the loader thread unless one is running (call with the lock held)"""
+        if self._loading:
+            return False
+        self._loading = True
+        threading.Thread(target=self._load, name="snapshot-load", daemon=True).start()
+        return True
+
+    def _load(self):
+        """Run the loader and store its result; only one thread gets here at a time"""
+        with self._cond:
+            start_remote_version = self._remote_version
+
+        try:
+            frames = self._loader()
+            with self._cond:
+                # Unless a newer remote copy was published during the download
+                if self._remote_version == start_remote_version:
+                    self._set_remote_frames(frames)
+                self._last_error = None
+        except Exception as e:
+            with self._cond:
+                self._last_error = e
+                # Keep serving the old snapshot, retry after a short delay
+                self._expires_at = time.monotonic() + self._retry_delay
+        finally:
+            with self._cond:
+                self._loading = False
+                self._cond.notify_all()
+
+    def _set_remote_frames(self, frames):
+        """Publish a fresh remote copy with the local commits re-applied (call with the lock held)"""
+        if self._rebase is not None:
+            frames = self._rebase(frames)
+        self._set_frames(frames)
+        self._remote_version += 1
+        self._expires_at = time.monotonic() + self._ttl
+
+    def _set_frames(self, frames):
+        self._frames = frames
+        self._version += 1
@@ -0,0 +1,345 @@
+import os
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from anomalies import ProviderAnomalies
+from gestion import apply_arrival, apply_service, build_arrival_data, build_service_data, get_arrival_record
+from journal import EVENT_ARRIVAL, EVENT_SERVICE, EventJournal, JournalReconciler, apply_events
+from occupancy import DockOccupancy
+from schema import GESTION_COLUMNS, compact_gestion, compact_reservas
+from sharepoint_transfer import download_to_spool, upload_workbook
+from snapshot_hub import SnapshotHub
+from xlsx_io import open_workbook_streaming, read_sheet, write_workbook
+
+SNAPSHOT_TTL_SECONDS = 300        # Reload from SharePoint every 5 minutes
+COMPACTION_INTERVAL_SECONDS = 60  # How often journaled events are folded into the workbook
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "journal.sqlite3")
+
+DEFAULT_WAREHOUSE = "Principal"  # Name of the only warehouse when WAREHOUSES is not set
+
+
+class SharePointWorkbook:
+    """The workbook file on SharePoint holding the three sheets"""
+
+    def __init__(self, site_url, file_id, username, password, writer_engine=None):
+        self.site_url = site_url
+        self.file_id = file_id
+        self._username = username
+        self._password = password
+        self.writer_engine = writer_engine
+
+    def context(self):
+        """Authenticated SharePoint client context"""
+        from office365.runtime.auth.user_credential import UserCredential
+        from office365.sharepoint.client_context import ClientContext
+
+        user_credentials = UserCredential(self._username, self._password)
+        return ClientContext(self.site_url).with_credentials(user_credentials)
+
+    def fetch(self):
+        """Download the workbook and return (credentials_df, reservas_df, gestion_df)"""
+        ctx = self.context()
+
+        # File size lets the download detect a truncated transfer
+        file = ctx.web.get_file_by_id(self.file_id)
+        ctx.load(file)
+        ctx.execute_query()
+
+        # Stream to a spooled temp file (spills to disk for large workbooks)
+        file_size = file.properties.get('Length')
+        expected_size = int(file_size) if file_size else None
+
+        with download_to_spool(ctx, file, expected_size=expected_size) as file_content:
+            # Load all sheets in a single streaming pass over the workbook
+            with open_workbook_streaming(file_content) as workbook:
+                credentials_df = read_sheet(workbook, "proveedor_credencial", dtype=str)
+                reservas_df = read_sheet(workbook, "proveedor_reservas", dtype={'Orden_de_compra': str})
+
+                # Try to load gestion sheet, create if doesn't exist
+                try:
+                    gestion_df = read_sheet(workbook, "proveedor_gestion")
+                except ValueError:
+                    gestion_df = pd.DataFrame(columns=GESTION_COLUMNS)
+
+        # Compact dtypes (categorical providers, small ints, datetimes)
+        return credentials_df, compact_reservas(reservas_df), compact_gestion(gestion_df)
+
+    def build_buffer(self, credentials_df, reservas_df, gestion_df):
+        """Serialize the three sheets to an in-memory xlsx file"""
+        return write_workbook({
+            "proveedor_credencial": credentials_df,
+            "proveedor_reservas": reservas_df,
+            "proveedor_gestion": gestion_df,
+        }, engine=self.writer_engine)
+
+    def push(self, credentials_df, reservas_df, gestion_df):
+        """Serialize and upload the three sheets, replacing the SharePoint file"""
+        ctx = self.context()
+        excel_buffer = self.build_buffer(credentials_df, reservas_df, gestion_df)
+
+        # Get the file info and upload (chunked upload session for large workbooks)
+        file = ctx.web.get_file_by_id(self.file_id)
+        ctx.load(file)
+        ctx.execute_query()
+
+        upload_workbook(ctx, file, excel_buffer)
+
+
+class AlreadyRegistered(ValueError):
+    """The arrival or service of the order was registered before"""
+
+
+def arrival_registration(reservas_df, orden_compra, hora_llegada, terminal=None):
+    """(event_type, orden, payload, apply_change, terminal, event_time) for an arrival"""
+    orden_compra = str(orden_compra)
+    arrival_data = build_arrival_data(reservas_df, orden_compra, hora_llegada)
+
+    def apply_change(gestion_df):
+        # A second scan of the same truck must not move its arrival time
+        if get_arrival_record(gestion_df, orden_compra) is not None:
+            raise AlreadyRegistered("La llegada de esta orden ya fue registrada.")
+        return apply_arrival(gestion_df, arrival_data)
+
+    return EVENT_ARRIVAL, orden_compra, arrival_data, apply_change, terminal, arrival_data['Hora_llegada']
+
+
+def service_registration(orden_compra, hora_inicio, hora_fin, terminal=None):
+    """(event_type, orden, payload, apply_change, terminal, event_time) for a service
+
+    The payload is derived inside ``apply_change`` from the arrival in the
+    snapshot, so an arrival earlier in the same batch is taken into account.
+    """
+    orden_compra = str(orden_compra)
+    service_data = {}
+
+    def apply_change(gestion_df):
+        # A repeated service must not overwrite the registered times
+        arrival_record = get_arrival_record(gestion_df, orden_compra)
+        if arrival_record is not None and pd.notna(arrival_record.get('Hora_fin_atencion')):
+            raise AlreadyRegistered("El servicio de esta orden ya fue registrado.")
+        service_data.update(build_service_data(gestion_df, orden_compra, hora_inicio, hora_fin))
+        return apply_service(gestion_df, orden_compra, service_data)
+
+    return EVENT_SERVICE, orden_compra, service_data, apply_change, terminal, str(hora_fin)
+
+
+class RegistrationStore:
+    """Storage behind every terminal: local journal, shared snapshot, compaction
+
+    The app and the ingestion API each hold one over the same journal file.
+    """
+
+    def __init__(self, workbook, journal_path=DEFAULT_JOURNAL_PATH,
+                 snapshot_ttl=SNAPSHOT_TTL_SECONDS, compaction_interval=COMPACTION_INTERVAL_SECONDS):
+        self.workbook = workbook
+        self.journal = EventJournal(journal_path)
+        self.hub = SnapshotHub(workbook.fetch, ttl=snapshot_ttl, rebase=self._with_pending)
+        self.reconciler = JournalReconciler(
+            self.journal, workbook.fetch, workbook.push,
+            on_synced=self._on_synced, interval=compaction_interval,
+            owner=f"{os.getpid()}-{uuid.uuid4().hex[:8]}",
+        )
+        self.occupancy = DockOccupancy()
+        self.anomalies = ProviderAnomalies()
+        self._follow_lock = threading.Lock()
+        self._seen_id = self.journal.last_id()
+        self._own_ids = set()
+
+    def start(self):
+        """Start loading the snapshot and the scheduled compaction"""
+        self.hub.prewarm()
+        self.reconciler.start()
+
+    def _with_pending(self, frames):
+        """Remote workbook frames plus the registrations not yet synced to it"""
+        credentials_df, reservas_df, gestion_df = frames
+        return credentials_df, reservas_df, apply_events(gestion_df, self.journal.pending())[0]
+
+    def _on_synced(self, credentials_df, reservas_df, gestion_df):
+        # Registrations journaled during the upload are still pending
+        self.hub.publish(credentials_df, reservas_df, gestion_df)
+
+    def record(self, event_type, orden_compra, payload, apply_change, terminal=None, event_time=None):
+        """Append a registration to the event log and show it to every session at once
+
+        The event is fsync'd to the local journal and applied to the shared
+        snapshot under the hub lock. ``apply_change`` validates it: if it
+        raises, nothing is journaled. Returns the event id.
+        """
+        return self.record_many([(event_type, orden_compra, payload, apply_change, terminal, event_time)])[0]
+
+    def record_many(self, registrations, stop_on_error=True):
+        """Validate and journal several registrations under one hub lock
+
+        ``registrations`` are (event_type, orden, payload, apply_change,
+        terminal, event_time) tuples, applied in order. Valid ones are
+        appended in a single journal transaction. Returns one entry per
+        registration: the event id, or the exception when it was rejected
+        (which is raised instead with ``stop_on_error``).
+        """
+        results = []
+
+        def _change(frames):
+            credentials_df, reservas_df, gestion_df = frames
+            accepted = []
+            for event_type, orden_compra, payload, apply_change, terminal, event_time in registrations:
+                try:
+                    gestion_df = apply_change(gestion_df)
+                except ValueError as e:
+                    if stop_on_error:
+                        raise
+                    results.append(e)
+                    continue
+                results.append(None)
+                accepted.append((event_type, orden_compra, payload, terminal, event_time))
+
+            if not accepted:
+                return frames
+
+            # Remembered before follow_journal can see them, so they aren't applied twice
+            with self._follow_lock:
+                ids = self.journal.append_many(accepted)
+                self._own_ids.update(ids)
+            ids = iter(ids)
+            results[:] = [r if r is not None else next(ids) for r in results]
+            self._advance_views(frames[2], gestion_df, [event[:3] for event in accepted])
+            return credentials_df, reservas_df, gestion_df
+
+        self.hub.update(_change)
+        return results
+
+    def update_reservas(self, change):
+        """Rewrite the reservas sheet with ``change`` and share it with every session
+
+        Unlike registrations, reservations aren't journaled: the workbook is
+        downloaded, changed and uploaded at once (see
+        ``JournalReconciler.rewrite_reservas``).
+        """
+        return self.reconciler.rewrite_reservas(change)
+
+    def follow_journal(self):
+        """Fold events journaled by other processes into the snapshot
+
+        A cheap check (one indexed query) when nothing changed. Returns True
+        when the snapshot was updated.
+        """
+        with self._follow_lock:
+            last_id = self.journal.last_id()
+            if last_id <= self._seen_id:
+                return False
+            events = [
+                e for e in self.journal.events(since_id=self._seen_id)
+                if e['id'] not in self._own_ids
+            ]
+            self._own_ids = {i for i in self._own_ids if i > last_id}
+            self._seen_id = last_id
+        if not events:
+            return False
+
+        def _change(frames):
+            gestion_df = apply_events(frames[2], events)[0]
+            self._advance_views(frames[2], gestion_df, [
+                (e['event_type'], e['orden_de_compra'], e['payload']) for e in events
+            ])
+            return frames[0], frames[1], gestion_df
+
+        self.hub.update(_change)
+        return True
+
+    def _advance_views(self, base_gestion_df, gestion_df, events):
+        """Update the incremental views with (event_type, orden, payload) events"""
+        self.occupancy.advance(base_gestion_df, gestion_df, events)
+        self.anomalies.advance(base_gestion_df, gestion_df, events)
+
+    def anomaly_engine(self):
+        """Provider anomaly statistics of the current snapshot
+
+        Backfilled over the whole history when a new snapshot is loaded;
+        registrations update them as they are recorded.
+        """
+        gestion_df = self.hub.get()[2]
+        if not self.anomalies.is_current(gestion_df):
+            self.anomalies.rebuild(gestion_df)
+        return self.anomalies
+
+    def occupancy_status(self, bays):
+        """Trucks waiting and being served right now (see ``DockOccupancy.status``)
+
+        Registrations update the board as they are recorded; only a newly
+        loaded snapshot (or a new day) makes it rescan gestion.
+        """
+        gestion_df = self.hub.get()[2]
+        if not self.occupancy.is_current(gestion_df):
+            self.occupancy.rebuild(gestion_df)
+        return self.occupancy.status(bays)
+
+
+def parse_warehouses(setting, default_file_id=None):
+    """{name: file_id} from the WAREHOUSES setting
+
+    Accepts a mapping (a ``[WAREHOUSES]`` table in secrets.toml) or a
+    "Norte=<file id>;Sur=<file id>" string (environment). Without it the
+    deployment has a single warehouse backed by ``default_file_id``.
+    """
+    if not setting:
+        return {DEFAULT_WAREHOUSE: default_file_id} if default_file_id else {}
+    if isinstance(setting, str):
+        items = []
+        for item in setting.split(';'):
+            if not item.strip():
+                continue
+            if '=' not in item:
+                raise ValueError(f"Invalid WAREHOUSES entry (expected name=file_id): {item.strip()}")
+            items.append(item.split('=', 1))
+    else:
+        items = setting.items()
+    return {str(name).strip(): str(file_id).strip() for name, file_id in items}
+
+
+def warehouse_journal_path(journal_path, warehouse):
+    """Journal file of one warehouse next to ``journal_path`` (data/journal-norte.sqlite3)"""
+    root, ext = os.path.splitext(journal_path)
+    slug = re.sub(r'[^a-z0-9]+', '-', warehouse.lower()).strip('-') or 'almacen'
+    return f"{root}-{slug}{ext}"
+
+
+def build_stores(site_url, warehouses, username, password,
+                 journal_path=DEFAULT_JOURNAL_PATH, writer_engine=None):
+    """One RegistrationStore per warehouse workbook, each with its own journal
+
+    A single warehouse keeps ``journal_path`` itself, so existing
+    deployments keep their journal when upgrading.
+    """
+    stores = {}
+    for name, file_id in warehouses.items():
+        workbook = SharePointWorkbook(site_url, file_id, username, password, writer_engine=writer_engine)
+        path = journal_path if len(warehouses) == 1 else warehouse_journal_path(journal_path, name)
+        stores[name] = RegistrationStore(workbook, path)
+    return stores
+
+
+def load_snapshots(stores, max_workers=None):
+    """{name: (version, frames)} for every store, downloaded in parallel
+
+    Total time is that of the slowest workbook rather than the sum. A
+    warehouse that fails to load maps to its exception instead, so one
+    unreachable workbook doesn't hide the others.
+    """
+    if not stores:
+        return {}
+    with ThreadPoolExecutor(max_workers=max_workers or len(stores),
+                            thread_name_prefix="warehouse-load") as pool:
+        futures = {name: pool.submit(store.hub.get_versioned) for name, store in stores.items()}
+
+    snapshots = {}
+    for name, future in futures.items():
+        try:
+            snapshots[name] = future.result()
+        except Exception as e:
+            snapshots[name] = e
+    return snapshots
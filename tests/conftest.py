@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_workbook import MemoryWorkbook, make_reservas  # noqa: E402
+from store import RegistrationStore, arrival_registration, service_registration  # noqa: E402
+
+
+@pytest.fixture
+def reservas_df():
+    return make_reservas([
+        ('4500001', 'Acme', 12, '2024-05-31', '08:00 - 09:00'),
+        ('4500002', 'Acme', 30, '2024-05-31', '09:00 - 10:00'),
+        ('4500003', 'Beta Foods', 5, '2024-05-31', '10:00 - 11:00'),
+    ])
+
+
+@pytest.fixture
+def store(tmp_path, reservas_df):
+    return RegistrationStore(MemoryWorkbook(reservas_df), str(tmp_path / 'journal.sqlite3'))
+
+
+@pytest.fixture
+def arrival():
+    """Builds an arrival registration against the store's reservations"""
+    def build(store, orden, hora):
+        return arrival_registration(store.hub.get()[1], orden, hora)
+    return build
+
+
+@pytest.fixture
+def service():
+    """Builds a service registration"""
+    def build(orden, inicio, fin):
+        return service_registration(orden, inicio, fin)
+    return build
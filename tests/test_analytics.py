@@ -0,0 +1,65 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from analytics import ALL, DailyIndex, QuantileSketches
+from gestion import apply_service
+from local_workbook import MemoryWorkbook, make_gestion
+from store import RegistrationStore
+
+START, END = date(2024, 5, 1), date(2024, 5, 31)
+
+
+@pytest.fixture
+def store(tmp_path, reservas_df):
+    rows = [
+        (f'44000{day:02d}', 'Acme' if day % 2 else 'Beta Foods', f'2024-05-{day:02d} 08:00:00', 5 + day, 20 + day, day % 3)
+        for day in range(1, 20)
+    ]
+    return RegistrationStore(MemoryWorkbook(reservas_df, make_gestion(rows)), str(tmp_path / 'journal.sqlite3'))
+
+
+def _answers(daily, sketches):
+    return [
+        (daily.summary(START, END, provider), sketches.percentiles(START, END, provider))
+        for provider in (ALL, 'Acme', 'Beta Foods')
+    ]
+
+
+def _assert_same(synced, rebuilt):
+    for (summary, percentiles), (expected_summary, expected_percentiles) in zip(synced, rebuilt):
+        assert summary == pytest.approx(expected_summary, nan_ok=True)
+        np.testing.assert_allclose(percentiles, expected_percentiles)
+
+
+def test_sync_folds_registrations_like_a_rebuild(store, arrival, service):
+    gestion_df = store.hub.get()[2]
+    daily, sketches = DailyIndex.from_gestion(gestion_df), QuantileSketches.from_gestion(gestion_df)
+
+    store.record_many([
+        arrival(store, '4500001', '2024-05-31 08:10:00'),
+        arrival(store, '4500002', '2024-05-31 09:05:00'),
+        service('4500001', '2024-05-31 08:20:00', '2024-05-31 09:00:00'),
+    ])
+    store.record_many([service('4500002', '2024-05-31 09:30:00', '2024-05-31 10:45:00')])
+    gestion_df = store.hub.get()[2]
+
+    synced = daily.sync(gestion_df), sketches.sync(gestion_df)
+    assert synced[0].sync(gestion_df) is synced[0]
+    _assert_same(_answers(*synced), _answers(DailyIndex.from_gestion(gestion_df), QuantileSketches.from_gestion(gestion_df)))
+    assert daily.summary(END, END) != synced[0].summary(END, END)
+
+
+def test_sync_rebuilds_when_a_folded_record_changes(store):
+    gestion_df = store.hub.get()[2]
+    daily, sketches = DailyIndex.from_gestion(gestion_df), QuantileSketches.from_gestion(gestion_df)
+
+    # A completed record timed again: its old contribution must go
+    edited = apply_service(gestion_df, '4400003', {
+        'Hora_inicio_atencion': '2024-05-03 09:00:00',
+        'Hora_fin_atencion': '2024-05-03 12:00:00',
+    })
+
+    synced = daily.sync(edited), sketches.sync(edited)
+    _assert_same(_answers(*synced), _answers(DailyIndex.from_gestion(edited), QuantileSketches.from_gestion(edited)))
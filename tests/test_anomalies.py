@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+
+from anomalies import ProviderAnomalies
+from local_workbook import MemoryWorkbook, make_gestion
+from store import RegistrationStore
+
+
+@pytest.fixture
+def store(tmp_path, reservas_df):
+    # A dozen punctual Acme deliveries and three Beta Foods ones before the day under test
+    rows = [
+        (f'44000{day:02d}', 'Acme', f'2024-05-{day:02d} 08:00:00', 10, 30 + day % 3, day % 4)
+        for day in range(1, 13)
+    ]
+    rows += [(f'44001{day:02d}', 'Beta Foods', f'2024-05-{day:02d} 10:00:00', 5, 20, 2) for day in range(1, 4)]
+    return RegistrationStore(MemoryWorkbook(reservas_df, make_gestion(rows)), str(tmp_path / 'journal.sqlite3'))
+
+
+def test_late_arrival_is_flagged_against_its_provider_norm(store, arrival):
+    engine = store.anomaly_engine()
+    norms = engine.norms().set_index(['Métrica', 'Proveedor'])
+    assert engine.flags().empty
+
+    store.record_many([
+        arrival(store, '4500001', '2024-05-31 09:30:00'),  # 90 minutes late
+        arrival(store, '4500003', '2024-05-31 11:05:00'),  # 65 minutes late, but too little history
+    ])
+
+    flags = engine.flags(since='2024-05-31')
+    assert flags[['Orden_de_compra', 'Métrica', 'Valor']].values.tolist() == [['4500001', 'Tiempo_retraso', 90]]
+    assert flags.loc[0, 'Esperado'] == norms.loc[('Tiempo_retraso', 'Acme'), 'Media']
+    assert flags.loc[0, 'z'] >= engine.threshold
+
+
+def test_recorded_registrations_update_norms_like_a_backfill(store, arrival, service):
+    engine = store.anomaly_engine()
+    store.record_many([
+        arrival(store, '4500001', '2024-05-31 08:02:00'),
+        arrival(store, '4500003', '2024-05-31 10:05:00'),
+    ])
+    store.record_many([
+        service('4500001', '2024-05-31 08:10:00', '2024-05-31 10:10:00'),  # two hours unloading
+        service('4500003', '2024-05-31 10:10:00', '2024-05-31 10:30:00'),
+    ])
+
+    # Folded registration by registration, not backfilled
+    assert engine.is_current(store.hub.get()[2])
+    assert engine.flags()[['Orden_de_compra', 'Métrica']].values.tolist() == [['4500001', 'Tiempo_atencion']]
+
+    backfilled = ProviderAnomalies()
+    backfilled.rebuild(store.hub.get()[2])
+    sort = ['Métrica', 'Proveedor']
+    pd.testing.assert_frame_equal(
+        engine.norms().sort_values(sort, ignore_index=True),
+        backfilled.norms().sort_values(sort, ignore_index=True),
+    )
@@ -0,0 +1,96 @@
+import http.client
+import json
+import sqlite3
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from api import ingest, make_handler
+from local_workbook import MemoryWorkbook
+from store import RegistrationStore
+
+
+@pytest.fixture
+def stores(tmp_path, reservas_df):
+    return {
+        name: RegistrationStore(MemoryWorkbook(reservas_df), str(tmp_path / f'journal-{name}.sqlite3'))
+        for name in ('Norte', 'Sur')
+    }
+
+
+@pytest.fixture
+def server(stores):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(stores))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _arrival(almacen, orden, hora):
+    return {'type': 'arrival', 'almacen': almacen, 'orden_de_compra': orden, 'hora_llegada': hora}
+
+
+def _post(server, body, headers):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    connection.putrequest('POST', '/events')
+    for name, value in headers.items():
+        connection.putheader(name, value)
+    connection.endheaders(body)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_ingest_keeps_the_warehouses_that_could_write(stores, monkeypatch):
+    def locked(registrations, stop_on_error=True):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(stores['Sur'], 'record_many', locked)
+    results = ingest(stores, [
+        _arrival('Norte', '4500001', '2024-05-31 08:10:00'),
+        _arrival('Sur', '4500001', '2024-05-31 08:12:00'),
+        _arrival('Norte', '4500002', '2024-05-31 09:00:00'),
+    ])
+
+    assert [r['status'] for r in results] == ['ok', 'error', 'ok']
+    assert results[1]['unavailable'] and 'database is locked' in results[1]['error']
+    assert len(stores['Norte'].journal.events()) == 2
+
+
+def test_ingest_reports_a_warehouse_that_cannot_load(stores, reservas_df, tmp_path):
+    class UnreachableWorkbook(MemoryWorkbook):
+        def fetch(self):
+            raise ConnectionError("SharePoint no responde")
+
+    stores['Sur'] = RegistrationStore(UnreachableWorkbook(reservas_df), str(tmp_path / 'journal-sur-2.sqlite3'))
+    results = ingest(stores, [
+        _arrival('Sur', '4500001', '2024-05-31 08:12:00'),
+        _arrival('Norte', '4500001', '2024-05-31 08:10:00'),
+        _arrival('Sur', '4500002', '2024-05-31 09:00:00'),
+    ])
+
+    assert [r['status'] for r in results] == ['error', 'ok', 'error']
+    assert all(results[i]['unavailable'] for i in (0, 2))
+
+
+def test_post_answers_503_when_part_of_the_batch_could_not_be_stored(server, stores, monkeypatch):
+    monkeypatch.setattr(stores['Sur'], 'record_many', lambda *args, **kwargs: 1 / 0)
+    body = json.dumps([
+        _arrival('Norte', '4500001', '2024-05-31 08:10:00'),
+        _arrival('Sur', '4500001', '2024-05-31 08:12:00'),
+    ]).encode()
+
+    status, response = _post(server, body, {'Content-Length': str(len(body))})
+
+    assert status == 503
+    assert (response['accepted'], response['rejected']) == (1, 1)
+
+
+@pytest.mark.parametrize('length', ['abc', '-5'])
+def test_post_rejects_a_malformed_content_length(server, length):
+    status, response = _post(server, b'', {'Content-Length': length})
+
+    assert status == 400
+    assert response == {'error': 'Content-Length no válido'}
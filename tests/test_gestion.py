@@ -0,0 +1,51 @@
+import pandas as pd
+
+from gestion import apply_service, get_arrival_record
+from local_workbook import make_gestion
+from store import arrival_registration, service_registration
+
+
+def _arrive(gestion_df, reservas_df, orden, hora):
+    return arrival_registration(reservas_df, orden, hora)[3](gestion_df)
+
+
+def _serve(gestion_df, orden, inicio, fin):
+    return service_registration(orden, inicio, fin)[3](gestion_df)
+
+
+def test_frames_derived_from_one_snapshot_find_their_own_orders(reservas_df):
+    snapshot = make_gestion([('4400001', 'Acme', '2024-05-30 08:00:00', 10, 30, 0)])
+    assert get_arrival_record(snapshot, '4400001')['Proveedor'] == 'Acme'
+
+    # Two sessions register different orders on the same snapshot: both land on row 1
+    first = _arrive(snapshot, reservas_df, '4500001', '2024-05-31 08:10:00')
+    second = _arrive(snapshot, reservas_df, '4500002', '2024-05-31 09:05:00')
+
+    assert get_arrival_record(snapshot, '4500001') is None
+    assert get_arrival_record(first, '4500001')['Proveedor'] == 'Acme'
+    assert get_arrival_record(first, '4500002') is None
+    assert get_arrival_record(second, '4500002') is not None
+    assert get_arrival_record(second, '4500001') is None
+
+    served = _serve(second, '4500002', '2024-05-31 09:15:00', '2024-05-31 09:45:00')
+    record = get_arrival_record(served, '4500002')
+    assert (record['Tiempo_espera'], record['Tiempo_atencion'], record['Tiempo_total']) == (10, 30, 40)
+    assert pd.isna(get_arrival_record(second, '4500002')['Tiempo_atencion'])
+
+
+def test_repeated_orders_are_all_updated():
+    # A hand-edited workbook can carry the same order twice
+    gestion_df = make_gestion([
+        ('4500001', 'Acme', '2024-05-31 08:00:00', 10, 30, 0),
+        ('4400001', 'Acme', '2024-05-30 08:00:00', 10, 30, 0),
+        ('4500001', 'Acme', '2024-05-31 08:00:00', 10, 30, 0),
+    ])
+
+    # Timestamps only: the minutes are derived for every row of the order
+    served = apply_service(gestion_df, '4500001', {
+        'Hora_inicio_atencion': '2024-05-31 08:20:00',
+        'Hora_fin_atencion': '2024-05-31 09:20:00',
+    })
+
+    assert served['Tiempo_atencion'].tolist() == [60, 30, 60]
+    assert served['Tiempo_espera'].tolist() == [20, 10, 20]
@@ -0,0 +1,75 @@
+import pandas as pd
+
+from gestion import build_arrival_data, build_service_data
+from journal import EVENT_ARRIVAL, EVENT_SERVICE, EventJournal, apply_events, replay
+from schema import GESTION_COLUMNS, compact_gestion
+
+
+def _empty_gestion():
+    return compact_gestion(pd.DataFrame(columns=GESTION_COLUMNS))
+
+
+def _arrival(event_id, reservas_df, orden, hora):
+    return {'id': event_id, 'event_type': EVENT_ARRIVAL, 'orden_de_compra': orden,
+            'payload': build_arrival_data(reservas_df, orden, hora)}
+
+
+def _service(event_id, orden, inicio, fin):
+    return {'id': event_id, 'event_type': EVENT_SERVICE, 'orden_de_compra': orden,
+            'payload': {'Hora_inicio_atencion': inicio, 'Hora_fin_atencion': fin}}
+
+
+def test_apply_events_folds_arrival_then_service(reservas_df):
+    events = [
+        _arrival(1, reservas_df, '4500001', '2024-05-31 08:10:00'),
+        _service(2, '4500001', '2024-05-31 08:30:00', '2024-05-31 09:05:00'),
+    ]
+    gestion_df, handled = apply_events(_empty_gestion(), events)
+
+    assert handled == [1, 2]
+    record = gestion_df.set_index('Orden_de_compra').loc['4500001']
+    assert record['Proveedor'] == 'Acme'
+    assert record['Tiempo_retraso'] == 10
+    # Minutes derived from the timestamps the service event carries
+    assert (record['Tiempo_espera'], record['Tiempo_atencion'], record['Tiempo_total']) == (20, 35, 55)
+
+
+def test_apply_events_skips_events_that_no_longer_apply(reservas_df):
+    events = [
+        _service(1, '4500002', '2024-05-31 09:30:00', '2024-05-31 10:00:00'),
+        _arrival(2, reservas_df, '4500001', '2024-05-31 08:00:00'),
+    ]
+    gestion_df, handled = apply_events(_empty_gestion(), events)
+
+    # The orphan service is marked handled so compaction doesn't retry it forever
+    assert handled == [1, 2]
+    assert gestion_df['Orden_de_compra'].tolist() == ['4500001']
+
+
+def test_apply_events_keeps_the_snapshot_untouched(reservas_df):
+    base = apply_events(_empty_gestion(), [_arrival(1, reservas_df, '4500001', '2024-05-31 08:10:00')])[0]
+    before = base.copy()
+
+    apply_events(base, [
+        _service(2, '4500001', '2024-05-31 08:30:00', '2024-05-31 09:05:00'),
+        _arrival(3, reservas_df, '4500003', '2024-05-31 10:20:00'),
+    ])
+
+    pd.testing.assert_frame_equal(base, before)
+
+
+def test_replay_rebuilds_the_history_up_to_a_time(tmp_path, reservas_df):
+    journal = EventJournal(str(tmp_path / 'journal.sqlite3'))
+    arrival = build_arrival_data(reservas_df, '4500001', '2024-05-31 08:10:00')
+    journal.append(EVENT_ARRIVAL, '4500001', arrival)
+    gestion_df = replay(journal)
+    service = build_service_data(gestion_df, '4500001', '2024-05-31 08:30:00', '2024-05-31 09:05:00')
+    journal.append(EVENT_SERVICE, '4500001', service)
+
+    replayed = replay(journal)
+    record = replayed.set_index('Orden_de_compra').loc['4500001']
+    assert record['Tiempo_total'] == 55
+    assert pd.Timestamp(record['Hora_fin_atencion']) == pd.Timestamp('2024-05-31 09:05:00')
+
+    # Nothing was recorded before the first event
+    assert replay(journal, until='2000-01-01 00:00:00').empty
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from local_workbook import MemoryWorkbook, make_gestion
+from occupancy import DockOccupancy
+from store import RegistrationStore
+
+NOW = datetime(2024, 5, 31, 9, 20)
+
+
+def test_board_counts_trucks_on_site_with_the_typical_service_time(tmp_path, reservas_df, arrival, service):
+    gestion_df = make_gestion([
+        ('4400001', 'Acme', '2024-05-30 08:00:00', 10, 30, 0),        # yesterday
+        ('4400002', 'Beta Foods', '2024-05-31 07:00:00', 5, 20, 0),   # gone already
+        ('4400003', 'Beta Foods', '2024-05-31 08:50:00', 10, 45, 0),  # in service until 09:45
+    ])
+    store = RegistrationStore(MemoryWorkbook(reservas_df, gestion_df), str(tmp_path / 'journal.sqlite3'))
+    store.occupancy.rebuild(store.hub.get()[2], now=NOW)
+
+    store.record_many([
+        arrival(store, '4500001', '2024-05-31 08:05:00'),
+        arrival(store, '4500002', '2024-05-31 09:00:00'),
+        arrival(store, '4500003', '2024-05-31 09:10:00'),
+    ])
+    store.record_many([
+        service('4500001', '2024-05-31 08:15:00', '2024-05-31 08:50:00'),
+        service('4500002', '2024-05-31 09:05:00', '2024-05-31 09:50:00'),
+    ])
+
+    # 4500003 waits; 25 and 30 minutes of service remain; the median service is now 35
+    status = store.occupancy.status(2, now=NOW)
+    assert status == {'waiting': 1, 'in_service': 2, 'longest_wait': 10, 'backlog': (25 + 30 + 35) / 2}
+    rescanned = DockOccupancy()
+    rescanned.rebuild(store.hub.get()[2], now=NOW)
+    assert rescanned.status(2, now=NOW) == status
+
+
+def test_board_moves_trucks_along_as_the_clock_runs(store, arrival, service):
+    store.occupancy.rebuild(store.hub.get()[2], now=NOW)
+    store.record_many([
+        arrival(store, '4500003', '2024-05-31 09:10:00'),
+        service('4500003', '2024-05-31 09:30:00', '2024-05-31 10:00:00'),
+    ])
+
+    def counts(hour, minute):
+        status = store.occupancy.status(1, now=NOW.replace(hour=hour, minute=minute))
+        return status['waiting'], status['in_service'], status['backlog']
+
+    # Services are registered ahead of time; the board reads them against the clock
+    assert counts(9, 5) == (0, 0, 0)
+    assert counts(9, 20) == (1, 0, 30)
+    assert counts(9, 40) == (0, 1, 20)
+    assert counts(10, 0) == (0, 0, 0)
@@ -0,0 +1,93 @@
+import pandas as pd
+
+from local_workbook import make_reservas
+from reservation_import import plan_import
+
+
+def _batch(rows):
+    return pd.DataFrame(rows, columns=['Orden_de_compra', 'Proveedor', 'Numero_de_bultos', 'Fecha', 'Hora'])
+
+
+def test_plan_import_upserts_by_order(reservas_df):
+    batch_df = _batch([
+        ['4500001', 'Acme', '12', '2024-05-31', '08:00 - 09:00'],   # unchanged
+        ['4500002', 'Acme', '45', '31/05/2024', '9:00-10:00'],      # more packages
+        ['4500009', 'Gamma', '7', '2024-06-01', '11.30'],           # new
+    ])
+    plan = plan_import(batch_df, reservas_df)
+
+    assert plan.summary() == {'Nuevas': 1, 'Modificadas': 1, 'Sin cambios': 1, 'Rechazadas': 0}
+    result = plan.apply(reservas_df).set_index('Orden_de_compra')
+    assert len(result) == 4
+    assert result.loc['4500002', 'Numero_de_bultos'] == 45
+    assert result.loc['4500002', 'Hora'] == '09:00 - 10:00'
+    assert result.loc['4500009', 'Proveedor'] == 'Gamma'
+    assert result.loc['4500009', 'Hora'] == '11:30'
+    assert result.loc['4500009', 'Fecha'] == pd.Timestamp('2024-06-01')
+    # Rows the batch didn't touch are left as they were
+    assert result.loc['4500003', 'Proveedor'] == 'Beta Foods'
+
+
+def test_plan_import_without_changes_returns_the_sheet(reservas_df):
+    batch_df = _batch([['4500003', 'Beta Foods', '5', '2024-05-31', '10:00 - 11:00']])
+    plan = plan_import(batch_df, reservas_df)
+
+    assert plan.changed == 0
+    assert plan.apply(reservas_df) is reservas_df
+
+
+def test_plan_import_rejects_invalid_and_repeated_rows(reservas_df):
+    batch_df = _batch([
+        ['4500010', 'Gamma', '0', '2024-06-01', '08:00'],
+        ['4500011', 'Gamma', '3', 'mañana', '08:00'],
+        ['4500012', 'Gamma', '3', '2024-06-01', '25:00'],
+        ['4500013', 'Gamma', '3', '2024-06-01', '08:00'],
+        ['4500013', 'Gamma', '4', '2024-06-01', '09:00'],
+        [None, 'Gamma', '3', '2024-06-01', '08:00'],
+    ])
+    plan = plan_import(batch_df, reservas_df)
+
+    assert plan.changed == 0
+    assert plan.rejected[['Fila', 'Motivo']].values.tolist() == [
+        [2, "Número de bultos inválido"],
+        [3, "Fecha inválida"],
+        [4, "Hora inválida"],
+        [5, "Orden repetida en el archivo"],
+        [6, "Orden repetida en el archivo"],
+        [7, "Falta la orden de compra"],
+    ]
+
+
+def test_plan_import_respects_slot_capacity(reservas_df):
+    batch_df = _batch([
+        ['4500020', 'Gamma', '3', '2024-05-31', '08:15'],
+        ['4500021', 'Gamma', '3', '2024-05-31', '08:45'],
+        ['4500022', 'Gamma', '3', '2024-05-31', '09:00'],
+    ])
+    # 08:00 and 09:00 already hold one booking each
+    plan = plan_import(batch_df, reservas_df, slot_capacity=2)
+
+    assert plan.inserts['Orden_de_compra'].tolist() == ['4500020', '4500022']
+    assert plan.rejected[['Orden_de_compra', 'Motivo']].values.tolist() == [['4500021', "Hora completa"]]
+
+
+def test_plan_import_skips_reservations_without_a_date(reservas_df):
+    reservas_df = pd.concat([reservas_df, make_reservas([('4500004', 'Acme', 8, None, '08:00 - 09:00')])],
+                            ignore_index=True)
+    batch_df = _batch([['4500020', 'Gamma', '3', '2024-05-31', '08:30']])
+    # The undated 08:00 booking doesn't take the slot
+    plan = plan_import(batch_df, reservas_df, slot_capacity=2)
+
+    assert plan.inserts['Orden_de_compra'].tolist() == ['4500020']
+    result = plan.apply(reservas_df)
+    assert pd.api.types.is_datetime64_any_dtype(result['Fecha'])
+    assert result['Fecha'].isna().sum() == 1
+
+
+def test_apply_reads_dates_stored_as_text(reservas_df):
+    reservas_df = reservas_df.assign(Fecha=['31/05/2024', '2024-05-31', '31/05/2024'])
+    batch_df = _batch([['4500009', 'Gamma', '7', '2024-06-01', '11:30']])
+
+    result = plan_import(batch_df, reservas_df).apply(reservas_df)
+
+    assert result['Fecha'].tolist() == [pd.Timestamp('2024-05-31')] * 3 + [pd.Timestamp('2024-06-01')]
@@ -0,0 +1,59 @@
+import threading
+import time
+
+from local_workbook import MemoryWorkbook, make_gestion
+from snapshot_hub import SnapshotHub
+from store import RegistrationStore
+
+
+def _wait_for_load(hub):
+    deadline = time.monotonic() + 5
+    while hub.is_loading and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_commits_do_not_postpone_the_reload():
+    loads = []
+
+    def loader():
+        loads.append(len(loads))
+        return ('credenciales', 'reservas', len(loads))
+
+    hub = SnapshotHub(loader, ttl=0.2)
+    hub.get()
+    # A commit every 50 ms outlives a 200 ms TTL
+    for _ in range(6):
+        time.sleep(0.05)
+        hub.update(lambda frames: (*frames[:2], frames[2] * 10))
+    _wait_for_load(hub)
+
+    assert len(loads) == 2
+
+
+def test_reload_keeps_registrations_recorded_during_the_download(tmp_path, reservas_df, arrival):
+    workbook = MemoryWorkbook(reservas_df)
+    downloading, release = threading.Event(), threading.Event()
+    release.set()
+    fetch = workbook.fetch
+
+    def slow_fetch():
+        downloading.set()
+        release.wait(5)
+        return fetch()
+
+    workbook.fetch = slow_fetch
+    store = RegistrationStore(workbook, str(tmp_path / 'journal.sqlite3'))
+    store.hub.get()
+
+    # Someone adds a record by hand on SharePoint, then a refresh starts
+    workbook.push(*workbook.fetch()[:2], make_gestion([('4400001', 'Acme', '2024-05-30 08:00:00', 5, 30, 0)]))
+    release.clear()
+    downloading.clear()
+    assert store.hub.request_refresh()
+    downloading.wait(5)
+    store.record_many([arrival(store, '4500001', '2024-05-31 08:10:00')])
+    release.set()
+    _wait_for_load(store.hub)
+
+    orders = store.hub.get()[2]['Orden_de_compra'].tolist()
+    assert sorted(orders) == ['4400001', '4500001']
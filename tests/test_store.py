@@ -0,0 +1,65 @@
+import pytest
+
+from gestion import apply_service
+from journal import EVENT_SERVICE
+from store import AlreadyRegistered
+
+
+def test_record_many_journals_only_the_valid_registrations(store, arrival, service):
+    results = store.record_many([
+        arrival(store, '4500001', '2024-05-31 08:10:00'),
+        arrival(store, '4500001', '2024-05-31 08:40:00'),
+        service('4500002', '2024-05-31 09:30:00', '2024-05-31 10:00:00'),
+        service('4500001', '2024-05-31 08:30:00', '2024-05-31 09:05:00'),
+    ], stop_on_error=False)
+
+    assert isinstance(results[0], int) and isinstance(results[3], int)
+    assert isinstance(results[1], AlreadyRegistered)
+    assert isinstance(results[2], ValueError)
+    assert [event['id'] for event in store.journal.events()] == [results[0], results[3]]
+
+    # The repeated scan didn't move the first arrival
+    record = store.hub.get()[2].set_index('Orden_de_compra').loc['4500001']
+    assert str(record['Hora_llegada']) == '2024-05-31 08:10:00'
+    assert record['Tiempo_total'] == 55
+
+
+def test_record_many_stops_on_the_first_rejection(store, arrival, service):
+    store.hub.get()
+    version = store.hub.version
+
+    with pytest.raises(ValueError):
+        store.record_many([
+            arrival(store, '4500001', '2024-05-31 08:10:00'),
+            service('4500003', '2024-05-31 10:30:00', '2024-05-31 11:00:00'),
+        ])
+
+    # Nothing of the batch is journaled or shown, not even the valid arrival
+    assert store.journal.events() == []
+    assert store.hub.version == version
+    assert store.hub.get()[2].empty
+
+
+def test_record_many_rejects_a_service_already_registered(store, arrival, service):
+    store.record_many([
+        arrival(store, '4500002', '2024-05-31 09:05:00'),
+        service('4500002', '2024-05-31 09:10:00', '2024-05-31 09:40:00'),
+    ])
+    version = store.hub.version
+
+    results = store.record_many(
+        [service('4500002', '2024-05-31 09:15:00', '2024-05-31 10:30:00')], stop_on_error=False
+    )
+
+    assert isinstance(results[0], AlreadyRegistered)
+    assert store.hub.version == version
+    assert len(store.journal.events()) == 2
+    record = store.hub.get()[2].set_index('Orden_de_compra').loc['4500002']
+    assert record['Tiempo_atencion'] == 30
+
+
+def test_record_validates_before_journaling(store):
+    payload = {'Hora_inicio_atencion': '2024-05-31 08:30:00'}
+    with pytest.raises(ValueError):
+        store.record(EVENT_SERVICE, '4500001', payload, lambda gestion_df: apply_service(gestion_df, '4500001', payload))
+    assert store.journal.pending_count() == 0
@@ -0,0 +1,99 @@
+"""Compare xlsx writer engines on synthetic gestion sheets
+
+Usage: python tools/bench_xlsx_writer.py [--rows 10000,100000,500000] [--engines ...]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xlsx_io import available_writer_engines, read_sheet, write_workbook  # noqa: E402
+
+
+def make_gestion(rows, seed=0):
+    """Synthetic proveedor_gestion sheet with realistic column types"""
+    rng = np.random.default_rng(seed)
+    arrival = pd.Timestamp('2024-01-01 09:00') + pd.to_timedelta(
+        rng.integers(0, 365 * 24 * 60, rows), unit='min'
+    )
+    espera = rng.integers(0, 90, rows)
+    atencion = rng.integers(5, 120, rows)
+    return pd.DataFrame({
+        'Orden_de_compra': [f"OC{i:07d}" for i in range(rows)],
+        'Proveedor': rng.choice([f"Proveedor {i}" for i in range(200)], rows),
+        'Numero_de_bultos': rng.integers(1, 300, rows),
+        'Hora_llegada': arrival,
+        'Hora_inicio_atencion': arrival + pd.to_timedelta(espera, unit='min'),
+        'Hora_fin_atencion': arrival + pd.to_timedelta(espera + atencion, unit='min'),
+        'Tiempo_espera': espera,
+        'Tiempo_atencion': atencion,
+        'Tiempo_total': espera + atencion,
+        'Tiempo_retraso': rng.integers(-30, 60, rows),
+        'numero_de_semana': arrival.isocalendar().week.to_numpy(),
+        'hora_de_reserva': rng.integers(9, 19, rows),
+    })
+
+
+def make_sheets(rows):
+    """All three sheets, with small credential/reservation sheets"""
+    return {
+        'proveedor_credencial': pd.DataFrame({'usuario': ['demo'], 'clave': ['demo']}),
+        'proveedor_reservas': pd.DataFrame({
+            'Fecha': ['2024-01-01'], 'Hora': ['09:00'], 'Proveedor': ['Proveedor 1'],
+            'Numero_de_bultos': [10], 'Orden_de_compra': ['OC0000001'],
+        }),
+        'proveedor_gestion': make_gestion(rows),
+    }
+
+
+def bench(engine, sheets, measure_memory=True):
+    """Return (seconds, peak traced MiB, output MiB, buffer) for one engine
+
+    Time and memory are measured in separate runs because tracemalloc
+    slows allocation-heavy writers down considerably.
+    """
+    start = time.perf_counter()
+    buffer = write_workbook(sheets, engine=engine)
+    elapsed = time.perf_counter() - start
+
+    peak = float('nan')
+    if measure_memory:
+        tracemalloc.start()
+        write_workbook(sheets, engine=engine)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak = peak / 2**20
+
+    return elapsed, peak, buffer.getbuffer().nbytes / 2**20, buffer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='10000,100000,500000')
+    parser.add_argument('--engines', default=','.join(available_writer_engines()))
+    parser.add_argument('--verify', action='store_true', help='Read back and compare the gestion sheet')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc run')
+    args = parser.parse_args()
+
+    engines = [e for e in args.engines.split(',') if e in available_writer_engines()]
+    print(f"{'rows':>8} {'engine':<22} {'seconds':>9} {'peak MiB':>9} {'file MiB':>9}")
+    for rows in [int(r) for r in args.rows.split(',')]:
+        sheets = make_sheets(rows)
+        for engine in engines:
+            elapsed, peak, size, buffer = bench(engine, sheets, not args.no_memory)
+            print(f"{rows:>8} {engine:<22} {elapsed:>9.2f} {peak:>9.1f} {size:>9.1f}")
+            if args.verify:
+                back = read_sheet(buffer, 'proveedor_gestion')
+                pd.testing.assert_frame_equal(
+                    back, sheets['proveedor_gestion'], check_dtype=False
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""Simulate dock rush hour: N terminals saving and reading on one server process
+
+Every terminal drives the code a tablet runs in the app -- the journaled
+save of an arrival or a service (validation, hub lock, journal append),
+the order-status lists computed on each rerun and, for a share of reruns,
+the dashboard aggregation -- against an in-memory stand-in for the
+SharePoint workbook with simulated transfer latency. Compaction and
+snapshot reloads run on their normal threads. At the end every pending
+event is compacted and each acknowledged registration is looked up in the
+workbook and in the shared snapshot: any that is missing is a lost update.
+
+Usage:
+    python tools/load_test.py --terminals 20 --orders 400 --duration 60
+    python tools/load_test.py --pattern uniform --history 200000 --upload-latency 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import DailyIndex, VersionedCache, provider_scorecard  # noqa: E402
+from gestion import (  # noqa: E402
+    booked_start_time, get_existing_arrivals, get_pending_arrivals, get_today_reservations,
+)
+from local_workbook import MemoryWorkbook, make_gestion, make_reservas  # noqa: E402
+from store import RegistrationStore, arrival_registration, service_registration  # noqa: E402
+
+PATTERNS = ('rush', 'uniform')
+SLOT_HOURS = list(range(7, 18))
+RUSH_HOURS = (8, 9)  # Slots most trucks book in the 'rush' pattern
+OPERATIONS = ('llegada', 'atencion', 'estado', 'dashboard')
+
+
+def synthetic_reservas(orders, pattern, rng):
+    """Synthetic proveedor_reservas for today"""
+    weights = np.ones(len(SLOT_HOURS))
+    if pattern == 'rush':
+        weights[np.isin(SLOT_HOURS, RUSH_HOURS)] = 6.0
+    hours = rng.choice(SLOT_HOURS, orders, p=weights / weights.sum())
+    return make_reservas(zip(
+        [f"LT{i:06d}" for i in range(orders)],
+        rng.choice([f"Proveedor {i}" for i in range(40)], orders),
+        rng.integers(1, 300, orders),
+        [datetime.now().strftime('%Y-%m-%d')] * orders,
+        [f"{h:02d}:00 - {h + 1:02d}:00" for h in hours],
+    ))
+
+
+def synthetic_history(rows, rng):
+    """Completed proveedor_gestion records over the last six months"""
+    start = pd.Timestamp(datetime.now().date()) - pd.Timedelta(days=180)
+    return make_gestion(zip(
+        [f"H{i:08d}" for i in range(rows)],
+        rng.choice([f"Proveedor {i}" for i in range(40)], rows),
+        start + pd.to_timedelta(rng.integers(0, 180 * 24 * 60, rows), unit='min'),
+        rng.integers(0, 90, rows),
+        rng.integers(5, 120, rows),
+        rng.integers(-30, 60, rows),
+    ))
+
+
+def make_schedule(reservas_df, terminals, duration, rng):
+    """Per-terminal lists of (offset seconds, operation, orden, times)
+
+    Trucks arrive around their booked slot, wait and are unloaded; the
+    whole day is compressed into ``duration`` seconds. Each order's arrival
+    and service are registered by the same terminal, so they stay in order.
+    """
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    slot = np.array([
+        booked_start_time(h).hour * 60 + booked_start_time(h).minute for h in reservas_df['Hora']
+    ])
+    n = len(slot)
+    arrival = slot + np.round(rng.normal(0, 12, n))
+    inicio = arrival + np.round(rng.exponential(15, n))
+    fin = inicio + rng.integers(10, 60, n)
+
+    first, last = arrival.min(), fin.max()
+    scale = duration / max(last - first, 1)
+
+    def stamp(minutes):
+        return (today + timedelta(minutes=float(minutes))).strftime('%Y-%m-%d %H:%M:%S')
+
+    schedules = [[] for _ in range(terminals)]
+    owners = rng.integers(0, terminals, n)
+    for i, orden in enumerate(reservas_df['Orden_de_compra']):
+        schedules[owners[i]].append(((arrival[i] - first) * scale, 'llegada', orden, (stamp(arrival[i]),)))
+        schedules[owners[i]].append(((fin[i] - first) * scale, 'atencion', orden, (stamp(inicio[i]), stamp(fin[i]))))
+    return [sorted(s) for s in schedules]
+
+
+class Terminal(threading.Thread):
+    """One simulated tablet working through its schedule"""
+
+    def __init__(self, name, store, schedule, views, dashboard_share, start_time, seed):
+        super().__init__(name=name, daemon=True)
+        self.store = store
+        self.schedule = schedule
+        self.views = views
+        self.dashboard_share = dashboard_share
+        self.start_time = start_time
+        self.rng = np.random.default_rng(seed)
+        self.latencies = {op: [] for op in OPERATIONS}
+        self.lag = []
+        self.errors = Counter()
+        self.acknowledged = {}  # orden -> {'Hora_llegada': ..., 'Hora_fin_atencion': ...}
+
+    def run(self):
+        for offset, operation, orden, times in self.schedule:
+            delay = self.start_time + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.lag.append(max(-delay, 0.0))
+
+            started = time.perf_counter()
+            try:
+                self.save(operation, orden, times)
+            except Exception as e:
+                self.errors[f"{operation}: {e}"] += 1
+                continue
+            self.latencies[operation].append(time.perf_counter() - started)
+            self.rerun()
+
+    def save(self, operation, orden, times):
+        """The app's save_arrival_to_excel / update_service_times"""
+        if operation == 'llegada':
+            registration = arrival_registration(self.store.hub.get()[1], orden, times[0], terminal=self.name)
+            self.store.record(*registration)
+            self.acknowledged[orden] = {'Hora_llegada': registration[2]['Hora_llegada']}
+        else:
+            registration = service_registration(orden, *times, terminal=self.name)
+            self.store.record(*registration)
+            self.acknowledged[orden]['Hora_fin_atencion'] = registration[2]['Hora_fin_atencion']
+
+    def rerun(self):
+        """What the page computes after a save: order lists, sometimes the dashboard"""
+        started = time.perf_counter()
+        version, (credentials_df, reservas_df, gestion_df) = self.store.hub.get_versioned()
+        today_reservations = get_today_reservations(reservas_df)
+        get_existing_arrivals(gestion_df)
+        get_pending_arrivals(today_reservations, gestion_df)
+        self.latencies['estado'].append(time.perf_counter() - started)
+
+        if self.rng.random() >= self.dashboard_share:
+            return
+        started = time.perf_counter()
+        end = datetime.now().date()
+        start = end - timedelta(days=27)
+        index = self.views.get(
+            'daily_index', version,
+            lambda previous: previous.sync(gestion_df) if previous else DailyIndex.from_gestion(gestion_df)
+        )
+        index.summary(start, end)
+        self.views.get(
+            f'scorecard:{start}:{end}', version,
+            lambda previous: provider_scorecard(gestion_df, start, end)
+        )
+        self.latencies['dashboard'].append(time.perf_counter() - started)
+
+
+def count_lost(gestion_df, acknowledged):
+    """Acknowledged registrations whose values are missing from ``gestion_df``"""
+    expected = pd.DataFrame.from_dict(acknowledged, orient='index')
+    actual = gestion_df.drop_duplicates('Orden_de_compra', keep='last').set_index('Orden_de_compra')
+    actual = actual.reindex(expected.index)
+    lost = {}
+    for column in expected.columns:
+        wanted = pd.to_datetime(expected[column])
+        found = pd.to_datetime(actual[column])
+        lost[column] = int((wanted.notna() & (found != wanted)).sum())
+    return lost
+
+
+def percentile_ms(values, q):
+    return np.percentile(values, q) * 1000 if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--terminals', type=int, default=10)
+    parser.add_argument('--orders', type=int, default=200, help='Trucks booked today')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds the day is compressed into')
+    parser.add_argument('--pattern', choices=PATTERNS, default='rush')
+    parser.add_argument('--history', type=int, default=20000, help='Completed records already in the sheet')
+    parser.add_argument('--fetch-latency', type=float, default=1.0)
+    parser.add_argument('--upload-latency', type=float, default=1.5)
+    parser.add_argument('--compaction-interval', type=float, default=5)
+    parser.add_argument('--snapshot-ttl', type=float, default=300)
+    parser.add_argument('--dashboard-share', type=float, default=0.2, help='Reruns that render the dashboard')
+    parser.add_argument('--journal', help='Journal file (default: a temporary one)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    reservas_df = synthetic_reservas(args.orders, args.pattern, rng)
+    workbook = MemoryWorkbook(
+        reservas_df, synthetic_history(args.history, rng),
+        fetch_latency=args.fetch_latency, upload_latency=args.upload_latency,
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = RegistrationStore(
+            workbook, args.journal or os.path.join(tmp, 'journal.sqlite3'),
+            snapshot_ttl=args.snapshot_ttl, compaction_interval=args.compaction_interval,
+        )
+        store.start()
+        store.hub.get()
+
+        views = VersionedCache()
+        start_time = time.perf_counter()
+        schedules = make_schedule(reservas_df, args.terminals, args.duration, rng)
+        terminals = [
+            Terminal(f"terminal-{i}", store, schedule, views, args.dashboard_share, start_time, args.seed + i)
+            for i, schedule in enumerate(schedules)
+        ]
+        for terminal in terminals:
+            terminal.start()
+        for terminal in terminals:
+            terminal.join()
+        elapsed = time.perf_counter() - start_time
+
+        # Fold everything still pending into the workbook
+        drain_start = time.perf_counter()
+        store.reconciler.wake()
+        while store.journal.pending_count() and time.perf_counter() - drain_start < 60 + 10 * args.upload_latency:
+            time.sleep(0.1)
+        drain = time.perf_counter() - drain_start
+        pending = store.journal.pending_count()
+
+        acknowledged = {}
+        for terminal in terminals:
+            acknowledged.update(terminal.acknowledged)
+        lost_workbook = count_lost(workbook.gestion, acknowledged)
+        lost_snapshot = count_lost(store.hub.get()[2], acknowledged)
+        duplicates = int(workbook.gestion['Orden_de_compra'].duplicated().sum())
+
+    print(f"{args.terminals} terminales, {args.orders} camiones ({args.pattern}), "
+          f"{args.history} registros históricos, {elapsed:.1f} s")
+    print(f"{'operación':<10} {'n':>6} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for op in OPERATIONS:
+        values = [v for terminal in terminals for v in terminal.latencies[op]]
+        print(f"{op:<10} {len(values):>6} {len(values) / elapsed:>8.1f} "
+              f"{percentile_ms(values, 50):>8.1f} {percentile_ms(values, 95):>8.1f} "
+              f"{percentile_ms(values, 99):>8.1f} {percentile_ms(values, 100):>8.1f}")
+
+    lag = [v for terminal in terminals for v in terminal.lag]
+    print(f"Retraso sobre el programa: p95 {percentile_ms(lag, 95):.0f} ms, máx {percentile_ms(lag, 100):.0f} ms")
+    print(f"Compactación: {workbook.uploads} subidas, {workbook.fetches} descargas, "
+          f"vaciado final {drain:.1f} s, {pending} evento(s) sin compactar")
+
+    errors = Counter()
+    for terminal in terminals:
+        errors.update(terminal.errors)
+    for message, count in errors.most_common(5):
+        print(f"Error x{count}: {message}")
+
+    print(f"Actualizaciones perdidas (libro): {lost_workbook}; (snapshot): {lost_snapshot}; "
+          f"filas duplicadas: {duplicates}")
+    lost = sum(lost_workbook.values()) + sum(lost_snapshot.values()) + duplicates + pending
+    sys.exit(1 if lost or errors else 0)
+
+
+if __name__ == '__main__':
+    main()
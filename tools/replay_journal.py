@@ -0,0 +1,52 @@
+"""Audit the local event journal: list events or rebuild the gestion sheet
+
+Usage:
+    python tools/replay_journal.py --journal data/journal.sqlite3 --orden 4500123
+    python tools/replay_journal.py --until "2024-05-31 23:59:59" --output gestion.csv
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journal import EventJournal, replay  # noqa: E402
+
+DEFAULT_JOURNAL = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "journal.sqlite3"
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--journal', default=os.getenv("JOURNAL_PATH", DEFAULT_JOURNAL))
+    parser.add_argument('--orden', help='Only list the events of this order')
+    parser.add_argument('--until', help="Replay events recorded up to 'YYYY-MM-DD HH:MM:SS'")
+    parser.add_argument('--output', help='Write the replayed gestion sheet (.csv or .xlsx)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.journal):
+        parser.error(f"Journal not found: {args.journal}")
+    journal = EventJournal(args.journal)
+
+    if args.output:
+        gestion_df = replay(journal, until=args.until)
+        if args.output.endswith('.xlsx'):
+            gestion_df.to_excel(args.output, sheet_name="proveedor_gestion", index=False)
+        else:
+            gestion_df.to_csv(args.output, index=False)
+        print(f"{len(gestion_df)} registros reconstruidos en {args.output}")
+        return
+
+    for event in journal.events(orden_de_compra=args.orden, until=args.until):
+        status = f"aplicado {event['applied_at']}" if event['applied_at'] else "pendiente"
+        print(
+            f"#{event['id']:<6} {event['created_at']}  {event['event_type']:<8} "
+            f"{event['orden_de_compra']:<12} {event['terminal'] or '-':<14} {status}"
+        )
+        print(f"        {json.dumps(event['payload'], ensure_ascii=False)}")
+
+
+if __name__ == '__main__':
+    main()
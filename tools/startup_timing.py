@@ -0,0 +1,54 @@
+"""Measure cold import time of the app's heavy dependencies
+
+Each module is imported in a fresh interpreter so caches don't hide the
+cost. Usage: python tools/startup_timing.py [--runs 5]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+MODULES = [
+    'streamlit',
+    'pandas',
+    'openpyxl',
+    'plotly.graph_objects',
+    'plotly.express',
+    'plotly.subplots',
+    'office365.sharepoint.client_context',
+]
+
+SNIPPET = (
+    "import time, importlib; t = time.perf_counter(); "
+    "importlib.import_module({module!r}); print(time.perf_counter() - t)"
+)
+
+
+def time_import(module, runs):
+    """Median cold import time in milliseconds (None if not installed)"""
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-c', SNIPPET.format(module=module)],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            return None
+        samples.append(float(result.stdout.strip()) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'module':<40} {'ms':>8}")
+    for module in MODULES:
+        elapsed = time_import(module, args.runs)
+        shown = f"{elapsed:>8.0f}" if elapsed is not None else '  missing'
+        print(f"{module:<40} {shown}")
+
+
+if __name__ == '__main__':
+    main()
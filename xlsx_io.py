@@ -0,0 +1,247 @@
+import io
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+DEFAULT_CHUNK_ROWS = 5000
+
+
+# ─────────────────────────────────────────────────────────────
+# Readers
+# ─────────────────────────────────────────────────────────────
+@contextmanager
+def open_workbook_streaming(source):
+    """Open an xlsx (path or file-like) in openpyxl's read-only streaming mode"""
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        yield workbook
+    finally:
+        workbook.close()
+
+
+def _header_names(header_row):
+    """Column names from the header row, named like pandas for blank cells"""
+    return [
+        str(value) if value is not None else f"Unnamed: {i}"
+        for i, value in enumerate(header_row)
+    ]
+
+
+def _build_chunk(header, rows, dtype):
+    """Build a DataFrame column-wise from a list of row tuples"""
+    if rows:
+        columns = list(zip(*rows))
+    else:
+        columns = [() for _ in header]
+
+    data = {}
+    for name, values in zip(header, columns):
+        target = dtype.get(name) if isinstance(dtype, dict) else dtype
+        if target is str:
+            # Same behaviour as read_excel(dtype=str): text, but blanks stay NaN
+            data[name] = pd.Series(
+                [np.nan if v is None else str(v) for v in values], dtype=object
+            )
+        else:
+            data[name] = pd.Series(values, dtype=target)
+
+    return pd.DataFrame(data, columns=header)
+
+
+def _get_sheet(workbook, sheet_name):
+    """Worksheet by name, raising ValueError like pandas when missing"""
+    if sheet_name not in workbook.sheetnames:
+        raise ValueError(f"Worksheet named '{sheet_name}' not found")
+    return workbook[sheet_name]
+
+
+def iter_sheet_chunks(source, sheet_name, chunk_size=DEFAULT_CHUNK_ROWS, skip_rows=0, dtype=None):
+    """Yield a sheet as DataFrame chunks of at most ``chunk_size`` rows
+
+    ``source`` is a path, a file-like object or a workbook already opened
+    with ``open_workbook_streaming`` (to read several sheets in one pass).
+    ``skip_rows`` skips that many data rows after the header, which allows
+    tail reads of only the records appended since a previous snapshot.
+    Blank rows at the end of the sheet are dropped, like ``pd.read_excel``.
+    """
+    if not hasattr(source, 'sheetnames'):
+        with open_workbook_streaming(source) as workbook:
+            yield from iter_sheet_chunks(workbook, sheet_name, chunk_size, skip_rows, dtype)
+        return
+
+    sheet = _get_sheet(source, sheet_name)
+    row_iter = sheet.iter_rows(values_only=True)
+    header_row = next(row_iter, None)
+    if header_row is None:
+        return
+
+    header = _header_names(header_row)
+    width = len(header)
+    rows = []
+    blank_run = []  # Blank rows are only kept if data follows them
+
+    for index, row in enumerate(row_iter):
+        if index < skip_rows:
+            continue
+
+        # Rows can be shorter or longer than the header in read-only mode
+        if len(row) != width:
+            row = (tuple(row) + (None,) * width)[:width]
+
+        if all(value is None for value in row):
+            blank_run.append(row)
+            continue
+
+        if blank_run:
+            rows.extend(blank_run)
+            blank_run = []
+        rows.append(row)
+
+        if len(rows) >= chunk_size:
+            yield _build_chunk(header, rows, dtype)
+            rows = []
+
+    if rows:
+        yield _build_chunk(header, rows, dtype)
+
+
+def read_sheet(source, sheet_name, skip_rows=0, dtype=None, chunk_size=DEFAULT_CHUNK_ROWS):
+    """Read a whole sheet (or its tail past ``skip_rows``) into one DataFrame"""
+    if not hasattr(source, 'sheetnames'):
+        with open_workbook_streaming(source) as workbook:
+            return read_sheet(workbook, sheet_name, skip_rows, dtype, chunk_size)
+
+    chunks = list(iter_sheet_chunks(
+        source, sheet_name, chunk_size=chunk_size, skip_rows=skip_rows, dtype=dtype
+    ))
+    if not chunks:
+        return pd.DataFrame(columns=sheet_header(source, sheet_name))
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def sheet_header(source, sheet_name):
+    """Return the header (column names) of a sheet"""
+    if not hasattr(source, 'sheetnames'):
+        with open_workbook_streaming(source) as workbook:
+            return sheet_header(workbook, sheet_name)
+
+    sheet = _get_sheet(source, sheet_name)
+    header_row = next(sheet.iter_rows(max_row=1, values_only=True), None)
+    return _header_names(header_row) if header_row else []
+
+
+# ─────────────────────────────────────────────────────────────
+# Writers
+# ─────────────────────────────────────────────────────────────
+DATETIME_FORMAT = 'YYYY-MM-DD HH:MM:SS'
+
+
+def _column_values(series):
+    """Column as a list of plain Python values ready for a cell (blanks -> None)"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.dt.tz_localize(None) if series.dt.tz is not None else series
+        return [None if pd.isna(v) else v.to_pydatetime() for v in values]
+    values = series.astype(object)
+    return values.where(series.notna(), None).tolist()
+
+
+def _write_openpyxl(sheets, buffer):
+    """Reference writer: pandas + openpyxl (slow, keeps the whole workbook in memory)"""
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        for sheet_name, df in sheets.items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+
+
+def _write_openpyxl_write_only(sheets, buffer):
+    """Streaming writer: openpyxl write_only mode, rows are flushed as they go"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+
+    workbook = Workbook(write_only=True)
+    for sheet_name, df in sheets.items():
+        sheet = workbook.create_sheet(title=sheet_name)
+        sheet.append([str(c) for c in df.columns])
+
+        columns = [_column_values(df[c]) for c in df.columns]
+        datetime_columns = [
+            i for i, c in enumerate(df.columns)
+            if pd.api.types.is_datetime64_any_dtype(df[c])
+        ]
+
+        for row in zip(*columns):
+            if datetime_columns:
+                row = list(row)
+                for i in datetime_columns:
+                    if row[i] is not None:
+                        cell = WriteOnlyCell(sheet, value=row[i])
+                        cell.number_format = DATETIME_FORMAT
+                        row[i] = cell
+            sheet.append(row)
+
+    workbook.save(buffer)
+
+
+def _write_xlsxwriter(sheets, buffer):
+    """Fast writer: xlsxwriter, rows written in order (optional dependency)"""
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(buffer, {
+        'in_memory': True,
+        'default_date_format': DATETIME_FORMAT,
+        'strings_to_numbers': False,
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+    })
+    for sheet_name, df in sheets.items():
+        sheet = workbook.add_worksheet(sheet_name)
+        sheet.write_row(0, 0, [str(c) for c in df.columns])
+
+        columns = [_column_values(df[c]) for c in df.columns]
+        for row_number, row in enumerate(zip(*columns), start=1):
+            sheet.write_row(row_number, 0, row)
+
+    workbook.close()
+
+
+WRITER_ENGINES = {
+    'openpyxl': _write_openpyxl,
+    'openpyxl_write_only': _write_openpyxl_write_only,
+    'xlsxwriter': _write_xlsxwriter,
+}
+
+
+def available_writer_engines():
+    """Writer engines that can run with the installed packages"""
+    engines = ['openpyxl', 'openpyxl_write_only']
+    try:
+        import xlsxwriter  # noqa: F401
+        engines.append('xlsxwriter')
+    except ImportError:
+        pass
+    return engines
+
+
+def default_writer_engine():
+    """Fastest available engine: xlsxwriter if installed, else streaming openpyxl"""
+    return 'xlsxwriter' if 'xlsxwriter' in available_writer_engines() else 'openpyxl_write_only'
+
+
+def write_workbook(sheets, engine=None, buffer=None):
+    """Serialize ``{sheet_name: DataFrame}`` to xlsx and return the buffer
+
+    Sheets are written in the dict's order. Unknown or unavailable engines
+    fall back to the default engine.
+    """
+    if engine not in available_writer_engines():
+        engine = default_writer_engine()
+
+    buffer = buffer if buffer is not None else io.BytesIO()
+    WRITER_ENGINES[engine](sheets, buffer)
+    buffer.seek(0)
+    return buffer